@@ -1,12 +1,64 @@
 import os
 import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
 import pandas as pd
 import librosa
 import numpy as np
+from cache_analise import CacheAnalise
+from biblioteca import Biblioteca, BIBLIOTECA_PATH
+from series_temporais import SeriesTemporais, SERIES_PATH, FRACAO_MORTA_COMPACTAR
+from duplicados import agrupar_duplicados
+import instrumentacao
 
 # --- 1. CONFIGURAÇÃO ---
 AUDIO_FOLDER_PATH = 'musicas_flac/'
 FINAL_OUTPUT_PATH = 'dataset_final_analisado.csv'
+CACHE_PATH = 'cache_analise.sqlite'
+
+# Número de processos de análise em paralelo (1 = modo sequencial)
+NUM_WORKERS = os.cpu_count() or 1
+# Máximo de faixas submetidas e ainda por concluir, por processo.
+# Limita a memória: nunca há mais do que NUM_WORKERS faixas descodificadas ao mesmo tempo.
+MAX_FAIXAS_EM_VOO_POR_WORKER = 2
+
+# Análise em streaming (bloco a bloco): a memória usada deixa de depender da duração da faixa.
+# No modo 'auto', só as faixas mais longas do que este limite (em segundos) são analisadas assim.
+DURACAO_MINIMA_STREAMING = 20 * 60
+N_FFT = 2048
+HOP_LENGTH = 512
+# Número de coeficientes MFCC guardados como resumo do timbre
+NUM_MFCC = 13
+# Número de frames STFT por bloco (256 frames ≈ 3 s a 44.1 kHz)
+FRAMES_POR_BLOCO = 256
+
+# Análise rápida de pré-visualização ('previa'): áudio mono a uma taxa reduzida e só alguns
+# excertos do corpo da faixa (o tempo e a tonalidade do techno são estáveis ao longo da faixa).
+# Os excertos são lidos diretamente do ponto certo do ficheiro, sem descodificar o resto.
+SR_PREVIA = 22050
+JANELAS_PREVIA = 3
+DURACAO_JANELA_PREVIA = 30.0
+# Parte da faixa de onde saem os excertos (evita a introdução e o final, mais pobres)
+INICIO_CORPO, FIM_CORPO = 0.15, 0.85
+# Os resultados da pré-visualização ficam numa cache própria, para nunca substituírem os da análise completa
+CACHE_PREVIA_PATH = 'cache_analise_previa.sqlite'
+# ...e num CSV próprio, para não substituírem o dataset que a engenharia e a ordenação leem
+PREVIA_OUTPUT_PATH = 'dataset_previa.csv'
+
+# Impressão digital para detetar duplicados (a mesma faixa noutro formato ou com outro nome):
+# croma de PARTES_POR_JANELA_IMPRESSAO partes e autocorrelação dos onsets de alguns excertos curtos,
+# lidos como na pré-visualização mas a uma taxa ainda mais baixa
+SR_IMPRESSAO = 11025
+JANELAS_IMPRESSAO = 3
+DURACAO_JANELA_IMPRESSAO = 12.0
+PARTES_POR_JANELA_IMPRESSAO = 4
+ATRASOS_ONSETS_IMPRESSAO = 64
+
+# Séries temporais guardadas para o planeamento das transições: duração de cada segmento
+# de croma/tonalidade (as curvas de onsets e de energia ficam com um valor por frame)
+SEGUNDOS_POR_SEGMENTO = 4.0
 
 # --- 2. PERFIS DE TONALIDADE (Krumhansl-Kessler) ---
 # Baseado na pesquisa fundamental da área, como mencionado no seu documento.
@@ -21,105 +73,840 @@ notes = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
 
 # Gerar todos os 24 perfis de tonalidade (12 maiores, 12 menores) através do deslocamento circular
 # Exatamente como descrito na referência [2] e [37] do seu documento.
-all_profiles = {}
+# Os perfis ficam numa matriz 24x12 já normalizada, calculada uma única vez.
+NOMES_TONALIDADES = []
+perfis = []
 for i in range(12):
-    all_profiles[f'{notes[i]} major'] = np.roll(krumhansl_key_profiles['major'], i)
-    all_profiles[f'{notes[i]} minor'] = np.roll(krumhansl_key_profiles['minor'], i)
+    for modo in ('major', 'minor'):
+        NOMES_TONALIDADES.append(f'{notes[i]} {modo}')
+        perfis.append(np.roll(krumhansl_key_profiles[modo], i))
+MATRIZ_PERFIS = np.array(perfis)
+MATRIZ_PERFIS /= np.linalg.norm(MATRIZ_PERFIS, axis=1, keepdims=True)
+del perfis
 
 
 # --- 3. FUNÇÕES DE ANÁLISE DE ÁUDIO ---
 
+def estimar_tonalidades_lote(chromas):
+    """
+    Compara N vetores de croma (matriz N x 12) com os 24 perfis de tonalidade num único
+    produto matricial. Devolve, para cada vetor, a tonalidade com maior correlação
+    (produto escalar normalizado), essa correlação e a confiança (margem para a segunda
+    melhor tonalidade). Vetores nulos ficam com tonalidade None e correlação NaN.
+    """
+    chromas = np.atleast_2d(np.asarray(chromas, dtype=np.float64))
+    normas = np.linalg.norm(chromas, axis=1, keepdims=True)
+    validos = (normas[:, 0] > 0) & np.isfinite(normas[:, 0])
+
+    correlacoes = np.full((len(chromas), len(NOMES_TONALIDADES)), np.nan)
+    correlacoes[validos] = (chromas[validos] / normas[validos]) @ MATRIZ_PERFIS.T
+
+    n = len(chromas)
+    melhores = np.zeros(n, dtype=int)
+    melhor_corr = np.full(n, np.nan)
+    confianca = np.full(n, np.nan)
+    if validos.any():
+        corr_validas = correlacoes[validos]
+        # As duas maiores correlações de cada linha; argmax devolve a primeira em caso de empate
+        indices = np.argmax(corr_validas, axis=1)
+        duas_maiores = np.partition(corr_validas, -2, axis=1)[:, -2:]
+        melhores[validos] = indices
+        melhor_corr[validos] = corr_validas[np.arange(len(indices)), indices]
+        confianca[validos] = duas_maiores[:, 1] - duas_maiores[:, 0]
+
+    nomes = [NOMES_TONALIDADES[i] if ok else None for i, ok in zip(melhores, validos)]
+    return nomes, melhor_corr, confianca
+
 def estimar_tonalidade_completa(chroma_vector):
     """
     Compara o vetor de croma de uma música com os 24 perfis de tonalidade
     e retorna aquele com a maior correlação (produto escalar).
     """
-    best_match = None
-    max_corr = -1
-    
-    # Normaliza o vetor de croma da música para a comparação
-    chroma_vector_norm = chroma_vector / np.linalg.norm(chroma_vector)
-    
-    for key_name, profile in all_profiles.items():
-        # Normaliza o perfil de tonalidade do gabarito
-        profile_norm = profile / np.linalg.norm(profile)
-        # Calcula a correlação (produto escalar)
-        correlation = np.dot(chroma_vector_norm, profile_norm)
-        
-        if correlation > max_corr:
-            max_corr = correlation
-            best_match = key_name
-            
-    return best_match
+    nomes, _, _ = estimar_tonalidades_lote(chroma_vector)
+    return nomes[0]
+
+def croma_por_segmento(chroma, frames_por_segmento):
+    """Croma médio de cada segmento de `frames_por_segmento` frames; devolve (frame_inicial, matriz 12 x S)."""
+    inicios = np.arange(0, chroma.shape[1], frames_por_segmento)
+    if len(inicios) == 0:
+        return inicios, np.zeros((chroma.shape[0], 0))
+    somas = np.add.reduceat(chroma, inicios, axis=1)
+    tamanhos = np.diff(np.append(inicios, chroma.shape[1]))
+    return inicios, somas / tamanhos
+
+def estimar_tonalidade_por_segmento(chroma, frames_por_segmento):
+    """
+    Estima a tonalidade de cada segmento de uma série temporal de croma (matriz 12 x T),
+    para acompanhar faixas que modulam sem voltar a calcular a STFT.
+    Devolve (frame_inicial, nomes, correlacoes, confiancas), um elemento por segmento.
+    """
+    inicios, medias = croma_por_segmento(chroma, frames_por_segmento)
+    nomes, correlacoes, confiancas = estimar_tonalidades_lote(medias.T)
+    return inicios, nomes, correlacoes, confiancas
+
+# --- 4. EXTRAÇÃO DE ATRIBUTOS SOBRE UM ESPECTROGRAMA PARTILHADO ---
 
-def analisar_faixa_local(filepath):
+class EspectroPartilhado:
+    """
+    STFT de uma faixa (ou de um bloco), calculada uma única vez e partilhada por todos os
+    atributos: envelope de onsets, croma, energia, etc. As representações derivadas
+    (magnitude, mel em dB) também só são calculadas na primeira vez que são pedidas.
+    """
+
+    def __init__(self, sr, y=None, potencia=None):
+        self.sr = sr
+        if potencia is None:
+            potencia = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH)) ** 2
+        self.potencia = potencia
+        self._magnitude = None
+        self._mel_db = None
+
+    @property
+    def num_frames(self):
+        return self.potencia.shape[1]
+
+    @property
+    def magnitude(self):
+        if self._magnitude is None:
+            self._magnitude = np.sqrt(self.potencia)
+        return self._magnitude
+
+    @property
+    def mel_db(self):
+        # Mesma representação que o librosa.onset.onset_strength calcula a partir do sinal
+        if self._mel_db is None:
+            mel = librosa.feature.melspectrogram(S=self.potencia, sr=self.sr, fmax=0.5 * self.sr)
+            self._mel_db = librosa.power_to_db(mel)
+        return self._mel_db
+
+# Atributos calculados frame a frame a partir do espectrograma partilhado; a análise
+# guarda a média de cada um. Para acrescentar um atributo, basta acrescentar uma entrada.
+ATRIBUTOS_POR_FRAME = {
+    'chroma_mean': lambda e: librosa.feature.chroma_stft(S=e.potencia, sr=e.sr),
+    'rms_medio': lambda e: librosa.feature.rms(S=e.magnitude, frame_length=N_FFT),
+    'centroide_medio': lambda e: librosa.feature.spectral_centroid(S=e.magnitude, sr=e.sr),
+    # Resumo do timbre: MFCC calculados do mesmo mel em dB usado pelo envelope de onsets
+    'mfcc_medio': lambda e: librosa.feature.mfcc(S=e.mel_db, sr=e.sr, n_mfcc=NUM_MFCC),
+}
+
+def somar_atributos_por_frame(espectro, por_frame=None):
+    """
+    Devolve, para cada atributo de ATRIBUTOS_POR_FRAME, a soma dos seus valores ao longo dos frames.
+    Com `por_frame` (um dicionário), guarda lá também os valores frame a frame de cada atributo.
+    """
+    somas = {}
+    for nome, extrator in ATRIBUTOS_POR_FRAME.items():
+        with instrumentacao.medir(nome):
+            valores = extrator(espectro)
+            somas[nome] = valores.sum(axis=1)
+        if por_frame is not None:
+            por_frame[nome] = valores
+    return somas
+
+def frames_por_segmento(sr):
+    return max(1, librosa.time_to_frames(SEGUNDOS_POR_SEGMENTO, sr=sr, hop_length=HOP_LENGTH).item())
+
+def construir_series(sr, onset_env, batidas, croma_segmentos, rms):
+    """
+    Séries temporais de uma faixa, para o SeriesTemporais: instantes das batidas (em segundos),
+    envelope de onsets e energia RMS por frame, e croma médio (S x 12) e tonalidade (índice em
+    NOMES_TONALIDADES, -1 sem tonalidade) por segmento. Cada série vem com a sua taxa.
+    """
+    taxa_frames = sr / HOP_LENGTH
+    taxa_segmentos = taxa_frames / frames_por_segmento(sr)
+    nomes, _, _ = estimar_tonalidades_lote(croma_segmentos)
+    tonalidades = [NOMES_TONALIDADES.index(nome) if nome is not None else -1 for nome in nomes]
+    return {
+        'batidas': (librosa.frames_to_time(batidas, sr=sr, hop_length=HOP_LENGTH), None),
+        'onsets': (onset_env, taxa_frames),
+        'rms': (np.ravel(rms), taxa_frames),
+        'croma': (croma_segmentos, taxa_segmentos),
+        'tonalidade': (np.array(tonalidades), taxa_segmentos),
+    }
+
+def medias_atributos(somas, num_frames):
+    """Converte as somas acumuladas em médias (atributos de uma só dimensão passam a escalares)."""
+    medias = {}
+    for nome, soma in somas.items():
+        media = soma / num_frames
+        medias[nome] = media if media.size > 1 else float(media[0])
+    return medias
+
+def bpm_de_tempo(tempo_array):
+    tempo_array = np.atleast_1d(tempo_array)
+    return round(tempo_array[0]) if tempo_array.size > 0 else None
+
+def analisar_faixa_local(filepath, verbose=True, incluir_series=False):
     """
     Analisa um ficheiro de áudio local para extrair BPM e a Tonalidade completa.
+    A STFT é calculada uma única vez e partilhada pelo BPM, pelo croma e pelos restantes atributos.
+    Devolve um dicionário com 'bpm', 'key_estimada', 'chroma_mean', 'rms_medio',
+    'centroide_medio' e 'mfcc_medio', ou None em caso de erro. Com `incluir_series`, o dicionário traz
+    também as séries temporais da faixa em 'series' (ver `construir_series`).
     """
     try:
-        y, sr = librosa.load(filepath, sr=None)
-        
-        # 1. Estimar o BPM
-        tempo_array, _ = librosa.beat.beat_track(y=y, sr=sr)
-        bpm = round(tempo_array[0]) if tempo_array.size > 0 else None
+        with instrumentacao.medir('load'):
+            y, sr = librosa.load(filepath, sr=None)
+        with instrumentacao.medir('stft'):
+            espectro = EspectroPartilhado(sr, y=y)
 
-        # 2. Estimar a Tonalidade e Escala
-        chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-        chroma_mean = np.mean(chroma, axis=1)
-        
-        # Usa a nossa nova função para obter a tonalidade completa
-        key_full = estimar_tonalidade_completa(chroma_mean)
+        # 1. Estimar o BPM (o mesmo que librosa.beat.beat_track(y=y, sr=sr), sem nova STFT)
+        with instrumentacao.medir('beat_track'):
+            onset_env = librosa.onset.onset_strength(S=espectro.mel_db, sr=sr)
+            tempo_array, batidas = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=HOP_LENGTH)
+        bpm = bpm_de_tempo(tempo_array)
+
+        # 2. Croma médio e restantes atributos
+        por_frame = {} if incluir_series else None
+        atributos = medias_atributos(somar_atributos_por_frame(espectro, por_frame), espectro.num_frames)
+
+        # 3. Estimar a Tonalidade e Escala
+        key_full = estimar_tonalidade_completa(atributos['chroma_mean'])
         
-        print(f"  -> Análise OK: BPM={bpm}, Tonalidade={key_full}")
-        return bpm, key_full
+        if verbose:
+            print(f"  -> Análise OK: BPM={bpm}, Tonalidade={key_full}")
+        resultado = {'bpm': bpm, 'key_estimada': key_full, **atributos}
+        if incluir_series:
+            _, croma_segmentos = croma_por_segmento(por_frame['chroma_mean'], frames_por_segmento(sr))
+            resultado['series'] = construir_series(sr, onset_env, batidas, croma_segmentos.T, por_frame['rms_medio'])
+        return resultado
+
+    except Exception as e:
+        print(f"  -> !! Erro ao analisar o ficheiro '{os.path.basename(filepath)}': {e}")
+        return None
+
+def analisar_faixa_streaming(filepath, verbose=True, incluir_series=False):
+    """
+    Igual a `analisar_faixa_local`, mas lê o áudio em blocos em vez de o carregar inteiro.
+    Os atributos médios e o tempograma médio (de onde sai o BPM, como no beat_track) são
+    acumulados bloco a bloco, a partir de uma única STFT por bloco, por isso a memória
+    usada não depende da duração da faixa.
+    """
+    try:
+        sr = librosa.get_samplerate(filepath)
+        blocos = librosa.stream(filepath, block_length=FRAMES_POR_BLOCO, frame_length=N_FFT,
+                                hop_length=HOP_LENGTH, fill_value=0)
+
+        # Janela de autocorrelação usada pelo librosa para estimar o tempo (8 segundos)
+        janela_tempograma = librosa.time_to_frames(8.0, sr=sr, hop_length=HOP_LENGTH).item()
+
+        somas = None
+        num_frames = 0
+        soma_tempograma = np.zeros(janela_tempograma)
+        num_colunas_tempograma = 0
+        envelope_pendente = np.zeros(0, dtype=np.float32)
+        ultimo_frame_db = None
+
+        # Séries temporais: o croma é reduzido a segmentos à medida que os blocos chegam
+        por_frame = {} if incluir_series else None
+        onsets, rms, croma_segmentos = [], [], []
+        frames_segmento = frames_por_segmento(sr)
+        croma_pendente = np.zeros((12, 0))
+
+        for bloco in instrumentacao.medir_iteracao('load', blocos):
+            # center=False: os blocos do librosa.stream já se sobrepõem em N_FFT - HOP_LENGTH amostras
+            with instrumentacao.medir('stft'):
+                potencia = np.abs(librosa.stft(bloco, n_fft=N_FFT, hop_length=HOP_LENGTH, center=False)) ** 2
+            if potencia.shape[1] == 0:
+                continue
+            espectro = EspectroPartilhado(sr, potencia=potencia)
+
+            # 1. Atributos por frame: somas acumuladas para obter as médias no fim
+            somas_bloco = somar_atributos_por_frame(espectro, por_frame)
+            somas = somas_bloco if somas is None else {k: somas[k] + v for k, v in somas_bloco.items()}
+            num_frames += espectro.num_frames
+            if incluir_series:
+                rms.append(np.ravel(por_frame['rms_medio']))
+                croma_pendente = np.concatenate([croma_pendente, por_frame['chroma_mean']], axis=1)
+                completos = croma_pendente.shape[1] // frames_segmento * frames_segmento
+                if completos:
+                    croma_segmentos.append(croma_por_segmento(croma_pendente[:, :completos], frames_segmento)[1].T)
+                    croma_pendente = croma_pendente[:, completos:]
+
+            # 2. Envelope de onsets (fluxo espectral em mel/dB, como o librosa.onset.onset_strength).
+            # O último frame do bloco anterior é reaproveitado para não perder a diferença na fronteira.
+            with instrumentacao.medir('beat_track'):
+                mel_db = espectro.mel_db
+                if ultimo_frame_db is not None:
+                    mel_db_continuo = np.concatenate([ultimo_frame_db, mel_db], axis=1)
+                    onset = librosa.onset.onset_strength(S=mel_db_continuo, sr=sr, center=False)[1:]
+                else:
+                    onset = librosa.onset.onset_strength(S=mel_db, sr=sr, center=False)
+                ultimo_frame_db = mel_db[:, -1:]
+                if incluir_series:
+                    onsets.append(onset.astype(np.float32))
+
+                # 3. Tempograma: processa as janelas completas e guarda só a cauda ainda incompleta
+                envelope_pendente = np.concatenate([envelope_pendente, onset.astype(np.float32)])
+                if len(envelope_pendente) >= 2 * janela_tempograma:
+                    tg = librosa.feature.tempogram(onset_envelope=envelope_pendente, sr=sr, hop_length=HOP_LENGTH,
+                                                   win_length=janela_tempograma, center=False)
+                    soma_tempograma += tg.sum(axis=1)
+                    num_colunas_tempograma += tg.shape[1]
+                    envelope_pendente = envelope_pendente[tg.shape[1]:]
+
+        if num_frames == 0:
+            raise ValueError("o ficheiro não contém áudio")
+
+        with instrumentacao.medir('beat_track'):
+            # Resto do envelope (ou a faixa inteira, se for mais curta do que a janela)
+            if num_colunas_tempograma == 0 or len(envelope_pendente) >= janela_tempograma:
+                tg = librosa.feature.tempogram(onset_envelope=envelope_pendente, sr=sr, hop_length=HOP_LENGTH,
+                                               win_length=janela_tempograma,
+                                               center=num_colunas_tempograma == 0)
+                soma_tempograma += tg.sum(axis=1)
+                num_colunas_tempograma += tg.shape[1]
+
+            tempograma_medio = (soma_tempograma / num_colunas_tempograma)[:, np.newaxis]
+            tempo = librosa.feature.tempo(tg=tempograma_medio, sr=sr, hop_length=HOP_LENGTH)
+            bpm = bpm_de_tempo(tempo)
+
+        atributos = medias_atributos(somas, num_frames)
+        key_full = estimar_tonalidade_completa(atributos['chroma_mean'])
+
+        if verbose:
+            print(f"  -> Análise OK (streaming): BPM={bpm}, Tonalidade={key_full}")
+        resultado = {'bpm': bpm, 'key_estimada': key_full, **atributos}
+        if incluir_series:
+            if croma_pendente.shape[1]:
+                croma_segmentos.append(croma_por_segmento(croma_pendente, frames_segmento)[1].T)
+            onset_env = np.concatenate(onsets)
+            # A grelha de batidas segue o tempo já estimado, sobre o envelope da faixa inteira
+            with instrumentacao.medir('beat_track'):
+                _, batidas = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=HOP_LENGTH,
+                                                     bpm=float(np.atleast_1d(tempo)[0]))
+            resultado['series'] = construir_series(sr, onset_env, batidas, np.concatenate(croma_segmentos),
+                                                   np.concatenate(rms))
+        return resultado
+
+    except Exception as e:
+        print(f"  -> !! Erro ao analisar o ficheiro '{os.path.basename(filepath)}': {e}")
+        return None
+
+def janelas_previa(duracao, janelas=JANELAS_PREVIA, duracao_janela=DURACAO_JANELA_PREVIA):
+    """
+    (offset, duração) de cada excerto, em segundos, distribuídos pelo corpo da faixa.
+    Uma faixa demasiado curta para os excertos é analisada inteira, numa só janela.
+    """
+    inicio, fim = duracao * INICIO_CORPO, duracao * FIM_CORPO
+    if fim - inicio <= janelas * duracao_janela:
+        return [(0.0, None)]
+    passo = (fim - inicio - duracao_janela) / max(1, janelas - 1)
+    return [(inicio + i * passo, duracao_janela) for i in range(janelas)]
+
+def refinar_tempo(tempograma, tempo, sr, hop_length=HOP_LENGTH):
+    """
+    A taxa reduzida torna a grelha de atrasos do tempograma grossa (a 22 kHz, 136 e 144 BPM
+    são atrasos vizinhos). Interpola uma parábola sobre o pico escolhido pelo librosa para
+    recuperar o tempo entre dois atrasos.
+    """
+    tempo = np.atleast_1d(tempo)
+    if tempo.size == 0 or tempo[0] <= 0:
+        return tempo
+    curva = tempograma[:, 0]
+    atraso = int(round(60.0 * sr / (hop_length * tempo[0])))
+    if not 1 <= atraso < len(curva) - 1:
+        return tempo
+    anterior, pico, seguinte = curva[atraso - 1], curva[atraso], curva[atraso + 1]
+    curvatura = anterior - 2 * pico + seguinte
+    if curvatura >= 0:
+        return tempo
+    deslocamento = 0.5 * (anterior - seguinte) / curvatura
+    return np.array([60.0 * sr / (hop_length * (atraso + deslocamento))])
+
+def analisar_faixa_previa(filepath, verbose=True, sr=SR_PREVIA, janelas=JANELAS_PREVIA,
+                          duracao_janela=DURACAO_JANELA_PREVIA):
+    """
+    Análise rápida: descodifica só alguns excertos, em mono e a `sr` Hz, e combina-os como
+    na análise em streaming (somas dos atributos e tempograma médio). Devolve o mesmo
+    dicionário que `analisar_faixa_local`.
+    """
+    try:
+        duracao = librosa.get_duration(path=filepath)
+        # Janela de autocorrelação usada pelo librosa para estimar o tempo (8 segundos)
+        janela_tempograma = librosa.time_to_frames(8.0, sr=sr, hop_length=HOP_LENGTH).item()
+        somas = None
+        num_frames = 0
+        soma_tempograma = None
+        num_colunas_tempograma = 0
+        for offset, duracao_excerto in janelas_previa(duracao, janelas, duracao_janela):
+            with instrumentacao.medir('load'):
+                y, _ = librosa.load(filepath, sr=sr, mono=True, offset=offset, duration=duracao_excerto)
+            with instrumentacao.medir('stft'):
+                espectro = EspectroPartilhado(sr, y=y)
+
+            with instrumentacao.medir('beat_track'):
+                onset_env = librosa.onset.onset_strength(S=espectro.mel_db, sr=sr)
+                tg = librosa.feature.tempogram(onset_envelope=onset_env, sr=sr, hop_length=HOP_LENGTH,
+                                               win_length=janela_tempograma)
+                soma_tempograma = tg.sum(axis=1) if soma_tempograma is None else soma_tempograma + tg.sum(axis=1)
+                num_colunas_tempograma += tg.shape[1]
+
+            somas_excerto = somar_atributos_por_frame(espectro)
+            somas = somas_excerto if somas is None else {k: somas[k] + v for k, v in somas_excerto.items()}
+            num_frames += espectro.num_frames
+
+        tempograma_medio = (soma_tempograma / num_colunas_tempograma)[:, np.newaxis]
+        tempo = librosa.feature.tempo(tg=tempograma_medio, sr=sr, hop_length=HOP_LENGTH)
+        bpm = bpm_de_tempo(refinar_tempo(tempograma_medio, tempo, sr))
+
+        atributos = medias_atributos(somas, num_frames)
+        key_full = estimar_tonalidade_completa(atributos['chroma_mean'])
+
+        if verbose:
+            print(f"  -> Análise OK (pré-visualização): BPM={bpm}, Tonalidade={key_full}")
+        return {'bpm': bpm, 'key_estimada': key_full, **atributos}
 
     except Exception as e:
-        print(f"  -> !! Erro ao analisar o ficheiro: {e}")
-        return None, None
+        print(f"  -> !! Erro ao analisar o ficheiro '{os.path.basename(filepath)}': {e}")
+        return None
 
-# --- 4. PROCESSAMENTO PRINCIPAL ---
-print(f"--- Iniciando a análise dos ficheiros na pasta '{AUDIO_FOLDER_PATH}' ---")
-if not os.path.isdir(AUDIO_FOLDER_PATH):
-    print(f"ERRO: A pasta '{AUDIO_FOLDER_PATH}' não foi encontrada.")
-    sys.exit()
+def analisar_faixa(filepath, modo='auto', verbose=True, incluir_series=False):
+    """
+    Escolhe o tipo de análise: 'completo' (ficheiro inteiro em memória), 'streaming'
+    (bloco a bloco), 'auto' (streaming só para faixas acima de DURACAO_MINIMA_STREAMING)
+    ou 'previa' (só alguns excertos, a uma taxa de amostragem reduzida, e sem séries temporais).
+    """
+    if modo == 'previa':
+        return analisar_faixa_previa(filepath, verbose=verbose)
+    if modo == 'auto':
+        try:
+            usar_streaming = librosa.get_duration(path=filepath) > DURACAO_MINIMA_STREAMING
+        except Exception:
+            usar_streaming = False
+        modo = 'streaming' if usar_streaming else 'completo'
+    if modo == 'streaming':
+        return analisar_faixa_streaming(filepath, verbose=verbose, incluir_series=incluir_series)
+    return analisar_faixa_local(filepath, verbose=verbose, incluir_series=incluir_series)
 
-audio_files = [f for f in os.listdir(AUDIO_FOLDER_PATH) if f.endswith('.flac')]
-if not audio_files:
-    print(f"AVISO: Nenhum ficheiro .flac encontrado na pasta '{AUDIO_FOLDER_PATH}'.")
-    sys.exit()
+def _normalizado(vetor):
+    # Sem a média e com norma 1: o volume e o nível de fundo de cada cópia deixam de contar
+    vetor = vetor - vetor.mean()
+    norma = np.linalg.norm(vetor)
+    return vetor / norma if norma > 0 else vetor
 
-print(f"Encontrados {len(audio_files)} ficheiros de áudio para processar.")
-all_tracks_data = []
+def calcular_impressao(filepath):
+    """
+    Impressão digital compacta de uma faixa, para a deteção de duplicados: em cada excerto,
+    o croma médio de algumas partes e a autocorrelação do envelope de onsets (o ritmo).
+    Devolve (vetor float32, duração em segundos), ou None se o ficheiro não puder ser lido.
+    """
+    try:
+        duracao = librosa.get_duration(path=filepath)
+        partes = []
+        for offset, duracao_excerto in janelas_previa(duracao, JANELAS_IMPRESSAO, DURACAO_JANELA_IMPRESSAO):
+            y, _ = librosa.load(filepath, sr=SR_IMPRESSAO, mono=True, offset=offset, duration=duracao_excerto)
+            espectro = EspectroPartilhado(SR_IMPRESSAO, y=y)
+            chroma = librosa.feature.chroma_stft(S=espectro.potencia, sr=SR_IMPRESSAO)
+            for parte in np.array_split(chroma, PARTES_POR_JANELA_IMPRESSAO, axis=1):
+                partes.append(_normalizado(parte.mean(axis=1)) if parte.size else np.zeros(12))
+            onset_env = librosa.onset.onset_strength(S=espectro.mel_db, sr=SR_IMPRESSAO)
+            autocorrelacao = librosa.autocorrelate(onset_env - onset_env.mean(), max_size=ATRASOS_ONSETS_IMPRESSAO + 1)
+            partes.append(_normalizado(np.pad(autocorrelacao[1:], (0, ATRASOS_ONSETS_IMPRESSAO + 1 - len(autocorrelacao)))))
+        return np.concatenate(partes).astype(np.float32), duracao
+    except Exception as e:
+        print(f"  -> !! Erro ao calcular a impressão digital de '{os.path.basename(filepath)}': {e}")
+        return None
 
-for filename in audio_files:
-    print(f"\nProcessando: {filename}")
+def extrair_artista_titulo(filename):
+    """Extrai (artista, nome_da_musica) de um nome no padrão 'Artista - Nome da Música.flac'."""
     filename_no_ext = os.path.splitext(filename)[0]
     try:
         artista, nome_da_musica = filename_no_ext.split(' - ', 1)
     except ValueError:
         artista = "Desconhecido"
         nome_da_musica = filename_no_ext
-        
-    filepath = os.path.join(AUDIO_FOLDER_PATH, filename)
-    bpm, key = analisar_faixa_local(filepath)
-    
-    all_tracks_data.append({
-        'artista': artista.strip(),
-        'nome_da_musica': nome_da_musica.strip(),
-        'bpm': bpm,
-        'key_estimada': key,
-        'filename': filename
-    })
-
-# --- 5. RESULTADO FINAL ---
-print("\n--- Análise concluída. Criando o DataFrame final. ---")
-df_final = pd.DataFrame(all_tracks_data)
-df_final.dropna(subset=['bpm', 'key_estimada'], inplace=True)
-
-print("\n--- Amostra do Dataset Final Analisado ---")
-print(df_final[['artista', 'nome_da_musica', 'bpm', 'key_estimada']].head())
-
-df_final.to_csv(FINAL_OUTPUT_PATH, index=False, encoding='utf-8')
-print(f"\nDataset final com {len(df_final)} faixas analisadas salvo com sucesso em: {FINAL_OUTPUT_PATH}")
-
-print("\nBASE DE DADOS COMPLETA E PRONTA PARA A ENGENHARIA DE ATRIBUTOS (CAMELOT)!")
\ No newline at end of file
+    return artista.strip(), nome_da_musica.strip()
+
+# --- 5. ANÁLISE EM PARALELO ---
+
+def _iniciar_worker():
+    """Cada processo usa uma única thread de BLAS/OpenMP para não competir com os restantes."""
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    except ImportError:
+        pass
+
+def _analisar_em_worker(filepath, modo, incluir_series=False):
+    # Devolve também as medições da faixa (None sem instrumentação), para o processo principal as registar
+    with instrumentacao.faixa(os.path.basename(filepath), registar=False) as medicoes:
+        resultado = analisar_faixa(filepath, modo=modo, verbose=False, incluir_series=incluir_series)
+    return resultado, medicoes
+
+def _analisar_isolado(filepath, modo, incluir_series=False):
+    """Reanalisa uma faixa num processo só seu, para que uma falha grave não afete as outras."""
+    try:
+        with ProcessPoolExecutor(max_workers=1, initializer=_iniciar_worker) as executor:
+            resultado, medicoes = executor.submit(_analisar_em_worker, filepath, modo, incluir_series).result()
+            instrumentacao.registar_faixa(medicoes)
+            return resultado
+    except BrokenProcessPool:
+        print(f"  -> !! O processo de análise terminou abruptamente com '{os.path.basename(filepath)}'.")
+        return None
+
+def analisar_biblioteca(filepaths, num_workers=NUM_WORKERS, max_em_voo=None, ao_concluir=None, modo='auto',
+                        incluir_series=False):
+    """
+    Analisa uma lista de ficheiros e devolve os resultados pela mesma ordem.
+    Com num_workers > 1 usa um pool de processos; no máximo `max_em_voo` faixas
+    ficam submetidas ao mesmo tempo, e um erro numa faixa não afeta as restantes.
+    `ao_concluir(indice, resultado)` é chamado assim que cada faixa termina.
+    """
+    total = len(filepaths)
+    if num_workers <= 1:
+        resultados = []
+        for i, filepath in enumerate(filepaths, start=1):
+            print(f"\nProcessando [{i}/{total}]: {os.path.basename(filepath)}")
+            with instrumentacao.faixa(os.path.basename(filepath)):
+                resultados.append(analisar_faixa(filepath, modo=modo, incluir_series=incluir_series))
+            if ao_concluir is not None:
+                ao_concluir(i - 1, resultados[-1])
+        return resultados
+
+    if max_em_voo is None:
+        max_em_voo = num_workers * MAX_FAIXAS_EM_VOO_POR_WORKER
+
+    resultados = [None] * total
+    suspeitas = []  # faixas que estavam em análise quando um processo morreu
+    concluidas = 0
+    proximas = iter(enumerate(filepaths))
+
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=_iniciar_worker) as executor:
+        em_voo = {}
+        while True:
+            # Mantém a janela de faixas submetidas cheia, sem nunca a ultrapassar
+            while len(em_voo) < max_em_voo:
+                proxima = next(proximas, None)
+                if proxima is None:
+                    break
+                indice, filepath = proxima
+                try:
+                    em_voo[executor.submit(_analisar_em_worker, filepath, modo, incluir_series)] = indice
+                except BrokenProcessPool:
+                    suspeitas.append(indice)
+            if not em_voo:
+                break
+
+            prontas, _ = wait(em_voo, return_when=FIRST_COMPLETED)
+            for future in prontas:
+                indice = em_voo.pop(future)
+                try:
+                    resultados[indice], medicoes = future.result()
+                except BrokenProcessPool:
+                    suspeitas.append(indice)
+                    continue
+                instrumentacao.registar_faixa(medicoes)
+                concluidas += 1
+                resultado = resultados[indice]
+                estado = f"BPM={resultado['bpm']}, Tonalidade={resultado['key_estimada']}" if resultado else "falhou"
+                print(f"[{concluidas}/{total}] {os.path.basename(filepaths[indice])} -> {estado}")
+                if ao_concluir is not None:
+                    ao_concluir(indice, resultado)
+
+    if suspeitas:
+        print(f"\nAVISO: um processo de análise terminou abruptamente. A reanalisar {len(suspeitas)} faixas isoladamente...")
+        for indice in sorted(suspeitas):
+            resultados[indice] = _analisar_isolado(filepaths[indice], modo, incluir_series)
+            if ao_concluir is not None:
+                ao_concluir(indice, resultados[indice])
+
+    return resultados
+
+def calcular_impressoes(filepaths, cache=None, num_workers=NUM_WORKERS):
+    """Impressão digital de cada ficheiro (ou None), lida da cache ou calculada em paralelo e guardada nela."""
+    impressoes = [cache.obter_impressao(fp) if cache else None for fp in filepaths]
+    em_falta = [i for i, impressao in enumerate(impressoes) if impressao is None]
+    if not em_falta:
+        return impressoes
+    print(f"A calcular a impressão digital de {len(em_falta)} faixas...")
+    caminhos = [filepaths[i] for i in em_falta]
+    if num_workers <= 1 or len(em_falta) == 1:
+        calculadas = map(calcular_impressao, caminhos)
+    else:
+        executor = ProcessPoolExecutor(max_workers=min(num_workers, len(em_falta)), initializer=_iniciar_worker)
+        calculadas = executor.map(calcular_impressao, caminhos, chunksize=4)
+    try:
+        for i, impressao in zip(em_falta, calculadas):
+            impressoes[i] = impressao
+            if cache is not None and impressao is not None:
+                cache.guardar_impressao(filepaths[i], *impressao)
+    finally:
+        if num_workers > 1 and len(em_falta) > 1:
+            executor.shutdown()
+    return impressoes
+
+# --- 6. PROCESSAMENTO PRINCIPAL ---
+
+def listar_ficheiros_audio(pasta=AUDIO_FOLDER_PATH):
+    """Ficheiros .flac da pasta, ordenados para que o dataset seja sempre o mesmo em qualquer sistema de ficheiros."""
+    return sorted(f for f in os.listdir(pasta) if f.endswith('.flac'))
+
+def analisar_pasta(pasta=AUDIO_FOLDER_PATH, num_workers=NUM_WORKERS, max_em_voo=None, modo='auto',
+                   usar_cache=True, caminho_cache=CACHE_PATH, usar_hash=False, incluir_atributos=False,
+                   pasta_series=None, detetar_duplicados=False):
+    """
+    Analisa todos os ficheiros .flac da pasta e devolve o DataFrame com artista, nome da música,
+    BPM, tonalidade estimada e nome do ficheiro (sem as faixas cuja análise falhou).
+    Com a cache ativa, só as faixas novas ou alteradas são analisadas.
+    Com `incluir_atributos`, o DataFrame inclui também o croma médio e os restantes atributos.
+    Com `pasta_series`, as séries temporais de cada faixa ficam guardadas nesse SeriesTemporais
+    (as faixas em cache mas ainda sem séries são analisadas outra vez).
+    Com `detetar_duplicados`, as cópias da mesma faixa (reconhecidas pela impressão digital)
+    reutilizam o resultado de uma delas, e o DataFrame ganha a coluna 'duplicado_de'.
+    Os nomes dos ficheiros que não vieram da cache (analisados nesta execução) ficam em
+    `df.attrs['analisadas']`.
+    """
+    audio_files = listar_ficheiros_audio(pasta)
+    print(f"Encontrados {len(audio_files)} ficheiros de áudio.")
+    if modo == 'previa' and caminho_cache == CACHE_PATH:
+        caminho_cache = CACHE_PREVIA_PATH
+    if modo == 'previa' and pasta_series is not None:
+        print("AVISO: A pré-visualização só lê excertos; as séries temporais não são guardadas.")
+        pasta_series = None
+    filepaths = [os.path.join(pasta, filename) for filename in audio_files]
+
+    # Carrega da cache tudo o que não mudou desde a última execução
+    cache = CacheAnalise(caminho_cache, usar_hash=usar_hash) if usar_cache else None
+    series = SeriesTemporais(pasta_series) if pasta_series is not None else None
+    resultados = [cache.obter(fp) if cache else None for fp in filepaths]
+    if series is not None:
+        resultados = [resultado if series.atualizado(fp) else None for fp, resultado in zip(filepaths, resultados)]
+    analisadas = {filename for filename, resultado in zip(audio_files, resultados) if resultado is None}
+    representantes = list(range(len(filepaths)))
+    if detetar_duplicados:
+        # Num grupo de cópias, representa-o de preferência uma faixa que já tem resultado
+        impressoes = calcular_impressoes(filepaths, cache, num_workers)
+        ordem = sorted(range(len(filepaths)), key=lambda i: (resultados[i] is None, i))
+        representantes = agrupar_duplicados(impressoes, ordem)
+        num_duplicados = sum(r != i for i, r in enumerate(representantes))
+        evitadas = sum(r != i and resultados[i] is None for i, r in enumerate(representantes))
+        print(f"{num_duplicados} duplicados detetados ({evitadas} análises evitadas).")
+    pendentes = [i for i, resultado in enumerate(resultados) if resultado is None and representantes[i] == i]
+    carregadas = sum(resultado is not None for resultado in resultados)
+    print(f"{carregadas} faixas carregadas da cache, {len(pendentes)} por analisar.")
+
+    if pendentes:
+        num_workers = max(1, min(num_workers, len(pendentes)))
+        print(f"A analisar com {num_workers} processo(s)...")
+
+        def guardar_na_cache(indice_pendente, resultado):
+            # Checkpoint: cada resultado fica gravado assim que é produzido
+            if resultado is None:
+                return
+            filepath = filepaths[pendentes[indice_pendente]]
+            # As séries vão para o seu próprio armazém, nunca para a cache nem para o DataFrame
+            series_faixa = resultado.pop('series', None)
+            if series is not None and series_faixa is not None:
+                series.guardar(filepath, series_faixa)
+            if cache is not None:
+                cache.guardar(filepath, resultado)
+
+        novos = analisar_biblioteca([filepaths[i] for i in pendentes], num_workers=num_workers,
+                                    max_em_voo=max_em_voo, ao_concluir=guardar_na_cache, modo=modo,
+                                    incluir_series=series is not None)
+        for i, resultado in zip(pendentes, novos):
+            resultados[i] = resultado
+
+    # As cópias ficam com o resultado da faixa que as representa (e na cache, com o seu próprio caminho)
+    for i, representante in enumerate(representantes):
+        if representante != i and resultados[i] is None and resultados[representante] is not None:
+            resultados[i] = dict(resultados[representante])
+            if cache is not None:
+                cache.guardar(filepaths[i], resultados[i])
+
+    if cache is not None:
+        cache.fechar()
+    if series is not None:
+        # As séries dos ficheiros que saíram da pasta são esquecidas; o espaço das cópias antigas
+        # (faixas reanalisadas ou removidas) é recuperado quando passa do limite
+        series.remover(set(series.faixas) - set(audio_files))
+        if series.fracao_morta() > FRACAO_MORTA_COMPACTAR:
+            print(f"A compactar as séries temporais ({series.fracao_morta():.0%} da arena sem uso)...")
+            series.compactar()
+        print(f"Séries temporais de {len(series)} faixas em: {pasta_series}")
+        series.fechar()
+
+    colunas = ['artista', 'nome_da_musica', 'bpm', 'key_estimada', 'filename']
+    if detetar_duplicados:
+        colunas.append('duplicado_de')
+    if incluir_atributos:
+        colunas += list(ATRIBUTOS_POR_FRAME)
+
+    all_tracks_data = []
+    for i, (filename, resultado) in enumerate(zip(audio_files, resultados)):
+        artista, nome_da_musica = extrair_artista_titulo(filename)
+        faixa = {
+            'artista': artista,
+            'nome_da_musica': nome_da_musica,
+            'bpm': resultado['bpm'] if resultado else None,
+            'key_estimada': resultado['key_estimada'] if resultado else None,
+            'filename': filename
+        }
+        if detetar_duplicados:
+            faixa['duplicado_de'] = audio_files[representantes[i]] if representantes[i] != i else None
+        if incluir_atributos:
+            for nome in ATRIBUTOS_POR_FRAME:
+                faixa[nome] = resultado.get(nome) if resultado else None
+        all_tracks_data.append(faixa)
+
+    df_final = pd.DataFrame(all_tracks_data, columns=colunas)
+    df_final.dropna(subset=['bpm', 'key_estimada'], inplace=True)
+    df_final.attrs['analisadas'] = analisadas
+    return df_final
+
+def gravar_na_biblioteca(biblioteca, df_final):
+    """
+    Atualiza a biblioteca com o resultado de `analisar_pasta`: grava só as faixas analisadas
+    nesta execução e as que ainda lá não estão, e remove as que já não fazem parte do dataset
+    (ficheiro apagado ou análise falhada). A chave Camelot só é apagada, para o
+    engenharia_final.py a recalcular, nas faixas cuja tonalidade estimada mudou.
+    Devolve (faixas gravadas, faixas removidas).
+    """
+    existentes = biblioteca.consultar(colunas=['filename', 'key_estimada'])
+    tonalidades = dict(zip(existentes['filename'], existentes['key_estimada'].astype(object)))
+    analisadas = df_final.attrs.get('analisadas', set(df_final['filename']))
+    a_gravar = df_final[df_final['filename'].isin(analisadas) | ~df_final['filename'].isin(tonalidades)]
+    tonalidade_mudou = a_gravar['filename'].map(tonalidades) != a_gravar['key_estimada']
+    if tonalidade_mudou.any():
+        biblioteca.upsert(a_gravar[tonalidade_mudou].assign(camelot_key=None))
+    if not tonalidade_mudou.all():
+        biblioteca.upsert(a_gravar[~tonalidade_mudou])
+    removidas = sorted(set(tonalidades) - set(df_final['filename']))
+    biblioteca.remover(removidas)
+    return len(a_gravar), len(removidas)
+
+def relatorio_concordancia(df_previa, df_completa):
+    """
+    Compara os resultados da pré-visualização com os da análise completa, faixa a faixa:
+    BPM igual (±1), BPM igual a menos de um erro de oitava, tonalidade igual e tonalidade
+    compatível na roda de Camelot. Devolve o relatório e as faixas em que diferem.
+    """
+    from engenharia_final import encontrar_camelot_key
+    from ordenar_set import INDICE_CAMELOT, TABELA_HARMONICA
+
+    juntos = df_previa.merge(df_completa, on='filename', suffixes=('_previa', '_completa'))
+    bpm_previa, bpm_completa = juntos['bpm_previa'].astype(float), juntos['bpm_completa'].astype(float)
+    bpm_igual = (bpm_previa - bpm_completa).abs() <= 1
+    bpm_oitava = bpm_igual | ((bpm_previa * 2 - bpm_completa).abs() <= 2) | ((bpm_previa / 2 - bpm_completa).abs() <= 2)
+    key_igual = juntos['key_estimada_previa'] == juntos['key_estimada_completa']
+
+    def compativel(linha):
+        previa = encontrar_camelot_key(linha['key_estimada_previa'])
+        completa = encontrar_camelot_key(linha['key_estimada_completa'])
+        if previa is None or completa is None:
+            return False
+        return previa == completa or TABELA_HARMONICA[INDICE_CAMELOT[completa]][INDICE_CAMELOT[previa]] > 0
+
+    key_compativel = juntos.apply(compativel, axis=1) if len(juntos) else pd.Series(dtype=bool)
+    total = max(1, len(juntos))
+    relatorio = {
+        'faixas': len(juntos),
+        'bpm_igual': bpm_igual.sum() / total,
+        'bpm_igual_ou_oitava': bpm_oitava.sum() / total,
+        'key_igual': key_igual.sum() / total,
+        'key_compativel': key_compativel.sum() / total,
+    }
+    divergentes = juntos.loc[~(bpm_igual & key_igual),
+                             ['filename', 'bpm_previa', 'bpm_completa', 'key_estimada_previa', 'key_estimada_completa']]
+    return relatorio, divergentes
+
+def main():
+    parser = argparse.ArgumentParser(description="Analisa BPM e tonalidade dos ficheiros .flac da pasta de músicas.")
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS,
+                        help=f"número de processos de análise (padrão: {NUM_WORKERS}; 1 = sequencial)")
+    parser.add_argument('--max-em-voo', type=int, default=None,
+                        help="máximo de faixas submetidas ao mesmo tempo (padrão: 2 por processo)")
+    modo = parser.add_mutually_exclusive_group()
+    modo.add_argument('--streaming', dest='modo', action='store_const', const='streaming', default='auto',
+                      help="analisa todas as faixas bloco a bloco (memória constante)")
+    modo.add_argument('--completo', dest='modo', action='store_const', const='completo',
+                      help="carrega sempre a faixa inteira em memória")
+    modo.add_argument('--previa', dest='modo', action='store_const', const='previa',
+                      help=f"análise rápida: mono a {SR_PREVIA} Hz e só {JANELAS_PREVIA} excertos de "
+                           f"{DURACAO_JANELA_PREVIA:.0f} s (cache própria: {CACHE_PREVIA_PATH})")
+    parser.add_argument('--comparar-completa', action='store_true',
+                        help="com --previa, corre também a análise completa (usando a sua cache) e mostra a concordância")
+    parser.add_argument('--sem-cache', action='store_true',
+                        help="ignora a cache e reanalisa todos os ficheiros")
+    parser.add_argument('--hash', action='store_true',
+                        help="identifica também os ficheiros pelo hash do conteúdo (deteta ficheiros renomeados)")
+    parser.add_argument('--cache', default=CACHE_PATH,
+                        help=f"ficheiro da cache de análise (padrão: {CACHE_PATH})")
+    parser.add_argument('--biblioteca', nargs='?', const=BIBLIOTECA_PATH, default=None,
+                        help=f"grava também os resultados (com os atributos) na biblioteca SQLite "
+                             f"(padrão: {BIBLIOTECA_PATH})")
+    parser.add_argument('--series', nargs='?', const=SERIES_PATH, default=None,
+                        help=f"guarda as séries temporais de cada faixa (batidas, onsets, croma, energia) "
+                             f"para o planeamento das transições (padrão: {SERIES_PATH})")
+    parser.add_argument('--duplicados', action='store_true',
+                        help="deteta cópias da mesma faixa pela impressão digital, analisa só uma delas "
+                             "e marca as outras na coluna 'duplicado_de'")
+    instrumentacao.adicionar_argumentos(parser)
+    args = parser.parse_args()
+    instrumentacao.configurar(args, etapa='analise')
+
+    print(f"--- Iniciando a análise dos ficheiros na pasta '{AUDIO_FOLDER_PATH}' ---")
+    if not os.path.isdir(AUDIO_FOLDER_PATH):
+        print(f"ERRO: A pasta '{AUDIO_FOLDER_PATH}' não foi encontrada.")
+        sys.exit()
+
+    if not listar_ficheiros_audio():
+        print(f"AVISO: Nenhum ficheiro .flac encontrado na pasta '{AUDIO_FOLDER_PATH}'.")
+        sys.exit()
+
+    inicio = time.perf_counter()
+    with instrumentacao.etapa('analise'):
+        df_final = analisar_pasta(num_workers=args.workers, max_em_voo=args.max_em_voo, modo=args.modo,
+                                  usar_cache=not args.sem_cache, caminho_cache=args.cache, usar_hash=args.hash,
+                                  incluir_atributos=args.biblioteca is not None, pasta_series=args.series,
+                                  detetar_duplicados=args.duplicados)
+    segundos = time.perf_counter() - inicio
+
+    if args.comparar_completa and args.modo == 'previa':
+        print("\n--- A correr a análise completa para comparação ---")
+        inicio = time.perf_counter()
+        with instrumentacao.etapa('analise_completa'):
+            df_completo = analisar_pasta(num_workers=args.workers, max_em_voo=args.max_em_voo, modo='auto',
+                                         usar_cache=not args.sem_cache, usar_hash=args.hash)
+        segundos_completa = time.perf_counter() - inicio
+        relatorio, divergentes = relatorio_concordancia(df_final, df_completo)
+        print(f"\n--- Concordância da pré-visualização com a análise completa ({relatorio['faixas']} faixas) ---")
+        print(f"BPM igual (±1): {relatorio['bpm_igual']:.0%} (incluindo erros de oitava: {relatorio['bpm_igual_ou_oitava']:.0%})")
+        print(f"Tonalidade igual: {relatorio['key_igual']:.0%} (compatível na roda de Camelot: {relatorio['key_compativel']:.0%})")
+        print(f"Tempo: pré-visualização {segundos:.1f} s, completa {segundos_completa:.1f} s "
+              f"(as faixas já em cache não contam)")
+        if not divergentes.empty:
+            print("Faixas com resultados diferentes:")
+            print(divergentes.to_string(index=False))
+
+    # --- 7. RESULTADO FINAL ---
+    print("\n--- Análise concluída. Criando o DataFrame final. ---")
+
+    print("\n--- Amostra do Dataset Final Analisado ---")
+    print(df_final[['artista', 'nome_da_musica', 'bpm', 'key_estimada']].head())
+
+    if args.biblioteca is not None and args.modo == 'previa':
+        # Os resultados da pré-visualização nunca substituem os da análise completa na biblioteca
+        print("\nAVISO: Os resultados da pré-visualização não são gravados na biblioteca.")
+        df_final = df_final.drop(columns=list(ATRIBUTOS_POR_FRAME))
+    elif args.biblioteca is not None:
+        with Biblioteca(args.biblioteca) as biblioteca:
+            gravadas, removidas = gravar_na_biblioteca(biblioteca, df_final)
+        print(f"\n{gravadas} faixas atualizadas e {removidas} removidas na biblioteca: {args.biblioteca}")
+        df_final = df_final.drop(columns=list(ATRIBUTOS_POR_FRAME))
+
+    if args.modo == 'previa':
+        df_final.to_csv(PREVIA_OUTPUT_PATH, index=False, encoding='utf-8')
+        print(f"\nPré-visualização de {len(df_final)} faixas salva em: {PREVIA_OUTPUT_PATH}")
+        print(f"O dataset da análise completa ({FINAL_OUTPUT_PATH}) não foi alterado.")
+        return
+
+    df_final.to_csv(FINAL_OUTPUT_PATH, index=False, encoding='utf-8')
+    print(f"\nDataset final com {len(df_final)} faixas analisadas salvo com sucesso em: {FINAL_OUTPUT_PATH}")
+
+    print("\nBASE DE DADOS COMPLETA E PRONTA PARA A ENGENHARIA DE ATRIBUTOS (CAMELOT)!")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,370 @@
+import os
+import sys
+import json
+import time
+import random
+import resource
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import soundfile as sf
+
+# --- 1. CONFIGURAÇÃO ---
+# Pasta onde ficam os resultados, um ficheiro JSON por commit, para comparar entre versões
+BENCHMARK_FOLDER = 'benchmarks'
+
+# Faixas sintéticas: cada combinação de duração (segundos) e taxa de amostragem é gerada
+# FAIXAS_POR_COMBINACAO vezes, com BPM e tonalidade aleatórios (mas reprodutíveis)
+DURACOES = [30, 120]
+TAXAS_AMOSTRAGEM = [22050, 44100, 48000]
+FAIXAS_POR_COMBINACAO = 2
+BPM_MINIMO, BPM_MAXIMO = 118, 140
+
+# Tamanhos das bibliotecas sintéticas usadas para medir a ordenação
+TAMANHOS_ORDENACAO = [100, 1000, 10000, 100000]
+
+# Consultas medidas no índice de sugestões (sugestoes.py), sobre a maior biblioteca sintética
+CONSULTAS_SUGESTOES = 2000
+
+# Vetores de croma aleatórios usados para medir a estimativa de tonalidade
+NUM_VETORES_TONALIDADE = 10000
+
+# Tolerância (em BPM) para considerar o BPM estimado correto
+TOLERANCIA_BPM = 1
+
+SEMENTE = 0
+
+# --- 2. ÁUDIO SINTÉTICO ---
+
+# Graus dos acordes da progressão I-IV-V-I (maior) e i-iv-v-i (menor), em semitons a partir da tónica
+PROGRESSOES = {
+    'major': [(0, 4, 7), (5, 9, 12), (7, 11, 14), (0, 4, 7)],
+    'minor': [(0, 3, 7), (5, 8, 12), (7, 10, 14), (0, 3, 7)],
+}
+
+def gerar_faixa(bpm, tonica, modo, duracao, sr, rng):
+    """
+    Faixa sintética com tempo e tonalidade conhecidos: cliques de ruído em cada batida
+    (sem altura definida, para não influenciarem o croma) sobre uma progressão de acordes
+    da tonalidade, com a tónica reforçada no baixo. Um acorde por compasso de 4 batidas.
+    """
+    t = np.arange(int(duracao * sr)) / sr
+    y = np.zeros_like(t)
+    f_tonica = 261.63 * 2 ** (tonica / 12)  # C4 transposto para a tónica
+    compasso = 4 * 60 / bpm
+    acorde_atual = (t // compasso).astype(int) % len(PROGRESSOES[modo])
+
+    def nota(frequencia, amplitude, mascara):
+        # Tom com harmónicos (amplitude 1/k), como um instrumento real, em vez de um seno puro
+        for k in range(1, 5):
+            y[mascara] += amplitude / k * np.sin(2 * np.pi * frequencia * k * t[mascara])
+
+    for indice, acorde in enumerate(PROGRESSOES[modo]):
+        mascara = acorde_atual == indice
+        for intervalo in acorde:
+            nota(f_tonica * 2 ** (intervalo / 12), 0.12, mascara)
+        nota(f_tonica / 2 * 2 ** (acorde[0] / 12), 0.08, mascara)
+
+    duracao_clique = int(0.03 * sr)
+    envelope = np.exp(-np.arange(duracao_clique) / (0.004 * sr))
+    for inicio in np.arange(0, duracao, 60 / bpm):
+        i = int(inicio * sr)
+        n = min(duracao_clique, len(y) - i)
+        y[i:i + n] += 0.9 * envelope[:n] * rng.standard_normal(n)
+    return (y / np.max(np.abs(y))).astype(np.float32)
+
+def gerar_biblioteca_audio(pasta, duracoes=DURACOES, taxas=TAXAS_AMOSTRAGEM,
+                           faixas_por_combinacao=FAIXAS_POR_COMBINACAO, semente=SEMENTE):
+    """Escreve as faixas sintéticas em FLAC na pasta e devolve a lista das faixas com os valores verdadeiros."""
+    from analise_acoustica_local import notes
+    rng = np.random.default_rng(semente)
+    faixas = []
+    for duracao in duracoes:
+        for sr in taxas:
+            for _ in range(faixas_por_combinacao):
+                bpm = int(rng.integers(BPM_MINIMO, BPM_MAXIMO + 1))
+                tonica = int(rng.integers(12))
+                modo = 'major' if rng.random() < 0.5 else 'minor'
+                nome = f"Sintetica {len(faixas):03d} - {bpm} BPM {notes[tonica]} {modo} {duracao}s {sr}Hz.flac"
+                caminho = os.path.join(pasta, nome)
+                sf.write(caminho, gerar_faixa(bpm, tonica, modo, duracao, sr, rng), sr)
+                faixas.append({'caminho': caminho, 'bpm': bpm, 'key': f"{notes[tonica]} {modo}",
+                               'duracao': duracao, 'sr': sr})
+    return faixas
+
+# --- 3. MEDIÇÕES DA ANÁLISE ---
+
+def _medir_analise_sequencial(filepaths, modo):
+    """Corre num processo próprio, para que o pico de memória (RSS) seja só o da análise."""
+    from analise_acoustica_local import analisar_faixa
+    # A primeira análise inclui a compilação (numba) do librosa; fica fora das latências
+    inicio = time.perf_counter()
+    analisar_faixa(filepaths[0], modo=modo, verbose=False)
+    aquecimento = time.perf_counter() - inicio
+    latencias, resultados = [], []
+    for filepath in filepaths:
+        inicio = time.perf_counter()
+        resultados.append(analisar_faixa(filepath, modo=modo, verbose=False))
+        latencias.append(time.perf_counter() - inicio)
+    # ru_maxrss vem em KiB no Linux
+    return latencias, resultados, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, aquecimento
+
+def _bpm_correto(estimado, verdadeiro):
+    return estimado is not None and abs(estimado - verdadeiro) <= TOLERANCIA_BPM
+
+def _bpm_correto_oitava(estimado, verdadeiro):
+    return estimado is not None and any(abs(estimado - verdadeiro * fator) <= TOLERANCIA_BPM * 2
+                                        for fator in (0.5, 1, 2))
+
+def _key_compativel(estimada, verdadeira):
+    """A tonalidade estimada é a verdadeira ou uma vizinha na roda de Camelot."""
+    from engenharia_final import CAMELOT_MAP
+    from ordenar_set import INDICE_CAMELOT, TABELA_HARMONICA
+    if estimada == verdadeira:
+        return True
+    if estimada not in CAMELOT_MAP:
+        return False
+    return TABELA_HARMONICA[INDICE_CAMELOT[CAMELOT_MAP[verdadeira]]][INDICE_CAMELOT[CAMELOT_MAP[estimada]]] > 0
+
+def medir_analise(faixas, modo='auto', num_workers=1):
+    """
+    Mede a análise das faixas sintéticas: latência por faixa (sequencial, num processo à parte),
+    faixas por segundo, pico de RSS e precisão de BPM e tonalidade. Com num_workers > 1,
+    mede também o débito com o pool de processos do analisar_biblioteca.
+    """
+    filepaths = [faixa['caminho'] for faixa in faixas]
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        latencias, resultados, pico_rss, aquecimento = executor.submit(_medir_analise_sequencial, filepaths, modo).result()
+
+    bpm_ok = bpm_oitava = key_ok = key_vizinha = 0
+    por_faixa = []
+    for faixa, resultado, latencia in zip(faixas, resultados, latencias):
+        bpm = resultado['bpm'] if resultado else None
+        key = resultado['key_estimada'] if resultado else None
+        bpm_ok += _bpm_correto(bpm, faixa['bpm'])
+        bpm_oitava += _bpm_correto_oitava(bpm, faixa['bpm'])
+        key_ok += key == faixa['key']
+        key_vizinha += key is not None and _key_compativel(key, faixa['key'])
+        por_faixa.append({'ficheiro': os.path.basename(faixa['caminho']), 'segundos': round(latencia, 4),
+                          'bpm': bpm, 'bpm_verdadeiro': faixa['bpm'], 'key': key, 'key_verdadeira': faixa['key']})
+
+    total = len(faixas)
+    relatorio = {
+        'faixas': total,
+        'modo': modo,
+        'faixas_por_segundo': total / sum(latencias),
+        'latencia_p50': float(np.percentile(latencias, 50)),
+        'latencia_p90': float(np.percentile(latencias, 90)),
+        'latencia_p99': float(np.percentile(latencias, 99)),
+        'latencia_max': max(latencias),
+        'aquecimento_segundos': aquecimento,
+        'pico_rss_mb': pico_rss,
+        'precisao_bpm': bpm_ok / total,
+        'precisao_bpm_oitava': bpm_oitava / total,
+        'precisao_key': key_ok / total,
+        'precisao_key_vizinha': key_vizinha / total,
+        'por_faixa': por_faixa,
+    }
+
+    if num_workers > 1:
+        from analise_acoustica_local import analisar_biblioteca
+        # Inclui o arranque dos processos, como numa execução real
+        inicio = time.perf_counter()
+        with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+            analisar_biblioteca(filepaths, num_workers=num_workers, modo=modo)
+        segundos = time.perf_counter() - inicio
+        relatorio['workers'] = num_workers
+        relatorio['faixas_por_segundo_paralelo'] = total / segundos
+        relatorio['pico_rss_workers_mb'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return relatorio
+
+def medir_tonalidade(num_vetores=NUM_VETORES_TONALIDADE, semente=SEMENTE):
+    """Tempo por chamada de estimar_tonalidade_completa e por vetor em lote (estimar_tonalidades_lote)."""
+    from analise_acoustica_local import estimar_tonalidade_completa, estimar_tonalidades_lote
+    chromas = np.random.default_rng(semente).random((num_vetores, 12))
+    inicio = time.perf_counter()
+    for chroma in chromas:
+        estimar_tonalidade_completa(chroma)
+    por_chamada = (time.perf_counter() - inicio) / num_vetores
+    inicio = time.perf_counter()
+    estimar_tonalidades_lote(chromas)
+    em_lote = (time.perf_counter() - inicio) / num_vetores
+    return {'vetores': num_vetores, 'us_por_chamada': por_chamada * 1e6, 'us_por_vetor_lote': em_lote * 1e6}
+
+# --- 4. MEDIÇÕES DA ORDENAÇÃO ---
+
+def biblioteca_sintetica(n, semente=SEMENTE):
+    """BPMs e chaves Camelot aleatórios (reprodutíveis) para n faixas."""
+    from ordenar_set import CAMELOT_KEYS
+    rng = random.Random(semente)
+    bpms = [rng.randint(BPM_MINIMO - 3, BPM_MAXIMO + 5) for _ in range(n)]
+    chaves = [rng.choice(CAMELOT_KEYS) for _ in range(n)]
+    return bpms, chaves
+
+def medir_ordenacao(tamanhos=TAMANHOS_ORDENACAO):
+    from ordenar_set import ordenar_indices
+    resultados = []
+    for n in tamanhos:
+        bpms, chaves = biblioteca_sintetica(n)
+        inicio = time.perf_counter()
+        _, resets = ordenar_indices(bpms, chaves)
+        segundos = time.perf_counter() - inicio
+        resultados.append({'faixas': n, 'segundos': segundos, 'resets': len(resets)})
+        print(f"  {n:>7} faixas: {segundos:.3f} s ({len(resets)} resets)")
+    return resultados
+
+def medir_sugestoes(n, consultas=CONSULTAS_SUGESTOES, k=10):
+    """Tempo de construção do índice de sugestões e latência de cada consulta (top-k) para n faixas."""
+    from sugestoes import IndiceSugestoes
+    bpms, chaves = biblioteca_sintetica(n)
+    faixas = [{'filename': f'{i}.flac', 'bpm': float(bpm), 'camelot_key': chave}
+              for i, (bpm, chave) in enumerate(zip(bpms, chaves))]
+    inicio = time.perf_counter()
+    indice = IndiceSugestoes(faixas)
+    segundos_indice = time.perf_counter() - inicio
+
+    rng = random.Random(SEMENTE)
+    latencias = []
+    for _ in range(consultas):
+        filename = f'{rng.randrange(n)}.flac'
+        inicio = time.perf_counter()
+        indice.sugerir_para(filename, k=k)
+        latencias.append((time.perf_counter() - inicio) * 1e6)
+    latencias.sort()
+    resultado = {
+        'faixas': n,
+        'segundos_indice': segundos_indice,
+        'us_p50': latencias[len(latencias) // 2],
+        'us_p99': latencias[int(len(latencias) * 0.99)],
+    }
+    print(f"  Sugestões (top-{k}) em {n} faixas: índice em {segundos_indice:.2f} s; "
+          f"consulta p50 {resultado['us_p50']:.0f} µs, p99 {resultado['us_p99']:.0f} µs")
+    return resultado
+
+# --- 5. RESULTADOS ---
+
+def identificar_commit():
+    """Hash curto do commit atual (com '-sujo' se houver alterações por gravar), ou 'sem-git'."""
+    pasta = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True, cwd=pasta).stdout.strip()
+        sujo = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                              text=True, check=True, cwd=pasta).stdout.strip()
+        return f"{commit}-sujo" if sujo else commit
+    except (OSError, subprocess.CalledProcessError):
+        return 'sem-git'
+
+def guardar_resultados(resultados, pasta=BENCHMARK_FOLDER):
+    """Grava os resultados do commit; as medições que não foram repetidas agora mantêm-se."""
+    os.makedirs(pasta, exist_ok=True)
+    caminho = os.path.join(pasta, f"{resultados['commit']}.json")
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            resultados = {**json.load(f), **resultados}
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=1)
+    return caminho
+
+def carregar_resultados(referencia, pasta=BENCHMARK_FOLDER):
+    caminho = referencia if os.path.exists(referencia) else os.path.join(pasta, f"{referencia}.json")
+    with open(caminho, encoding='utf-8') as f:
+        return json.load(f)
+
+def comparar(atual, referencia):
+    """Mostra as métricas principais lado a lado com as de outro commit."""
+    print(f"\n--- Comparação com {referencia['commit']} ---")
+    linhas = []
+    for chave in ('faixas_por_segundo', 'latencia_p50', 'latencia_p90', 'pico_rss_mb', 'precisao_bpm', 'precisao_key'):
+        if 'analise' in atual and 'analise' in referencia:
+            linhas.append((f"analise.{chave}", referencia['analise'][chave], atual['analise'][chave]))
+    if 'tonalidade' in atual and 'tonalidade' in referencia:
+        linhas.append(('tonalidade.us_por_chamada', referencia['tonalidade']['us_por_chamada'],
+                       atual['tonalidade']['us_por_chamada']))
+    ordenacao_ref = {r['faixas']: r['segundos'] for r in referencia.get('ordenacao', [])}
+    for r in atual.get('ordenacao', []):
+        if r['faixas'] in ordenacao_ref:
+            linhas.append((f"ordenacao.{r['faixas']}_segundos", ordenacao_ref[r['faixas']], r['segundos']))
+    if 'sugestoes' in atual and 'sugestoes' in referencia:
+        linhas.append(('sugestoes.us_p99', referencia['sugestoes']['us_p99'], atual['sugestoes']['us_p99']))
+    for nome, antes, agora in linhas:
+        razao = f"{agora / antes:.2f}x" if antes else '-'
+        print(f"  {nome:<32} {antes:>12.4f} {agora:>12.4f}  {razao}")
+
+# --- 6. EXECUÇÃO ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede o desempenho e a precisão da análise e da ordenação com dados sintéticos.")
+    parser.add_argument('--rapido', action='store_true',
+                        help="menos faixas e mais curtas, e ordenação só até 10k faixas")
+    parser.add_argument('--sem-analise', action='store_true', help="não mede a análise de áudio")
+    parser.add_argument('--sem-ordenacao', action='store_true', help="não mede a ordenação")
+    parser.add_argument('--modo', choices=['auto', 'completo', 'streaming', 'previa'], default='auto',
+                        help="modo de análise medido (padrão: auto)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="mede também o débito com este número de processos (padrão: 1, só sequencial)")
+    parser.add_argument('--comparar', metavar='COMMIT_OU_FICHEIRO',
+                        help=f"compara com os resultados de outro commit guardados em {BENCHMARK_FOLDER}/")
+    args = parser.parse_args()
+
+    referencia = None
+    if args.comparar:
+        # Lida antes de gravar, para que comparar com o próprio commit use a medição anterior
+        try:
+            referencia = carregar_resultados(args.comparar)
+        except FileNotFoundError:
+            print(f"ERRO: Não foram encontrados resultados para '{args.comparar}'.")
+            sys.exit()
+
+    duracoes, faixas_por_combinacao, tamanhos = DURACOES, FAIXAS_POR_COMBINACAO, TAMANHOS_ORDENACAO
+    if args.rapido:
+        duracoes, faixas_por_combinacao, tamanhos = [15], 1, [t for t in TAMANHOS_ORDENACAO if t <= 10000]
+
+    resultados = {
+        'commit': identificar_commit(),
+        'data': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+    }
+
+    if not args.sem_analise:
+        with tempfile.TemporaryDirectory(prefix='benchmark_') as pasta:
+            print("--- A gerar as faixas sintéticas ---")
+            faixas = gerar_biblioteca_audio(pasta, duracoes=duracoes, faixas_por_combinacao=faixas_por_combinacao)
+            print(f"{len(faixas)} faixas geradas ({', '.join(map(str, duracoes))} s; "
+                  f"{', '.join(map(str, TAXAS_AMOSTRAGEM))} Hz).")
+            print(f"\n--- A medir a análise (modo: {args.modo}) ---")
+            analise = medir_analise(faixas, modo=args.modo, num_workers=args.workers)
+        resultados['analise'] = analise
+        print(f"  {analise['faixas_por_segundo']:.2f} faixas/s; latência p50 {analise['latencia_p50']:.2f} s, "
+              f"p90 {analise['latencia_p90']:.2f} s, p99 {analise['latencia_p99']:.2f} s; "
+              f"pico de RSS {analise['pico_rss_mb']:.0f} MB")
+        if 'faixas_por_segundo_paralelo' in analise:
+            print(f"  Com {analise['workers']} processos: {analise['faixas_por_segundo_paralelo']:.2f} faixas/s")
+        print(f"  Precisão: BPM {analise['precisao_bpm']:.0%} (com erros de oitava: {analise['precisao_bpm_oitava']:.0%}), "
+              f"tonalidade {analise['precisao_key']:.0%} (incluindo vizinhas Camelot: {analise['precisao_key_vizinha']:.0%})")
+
+        resultados['tonalidade'] = medir_tonalidade()
+        print(f"  Estimativa de tonalidade: {resultados['tonalidade']['us_por_chamada']:.1f} µs por chamada, "
+              f"{resultados['tonalidade']['us_por_vetor_lote']:.2f} µs por vetor em lote")
+
+    if not args.sem_ordenacao:
+        print("\n--- A medir a ordenação ---")
+        resultados['ordenacao'] = medir_ordenacao(tamanhos)
+        resultados['sugestoes'] = medir_sugestoes(max(tamanhos))
+
+    caminho = guardar_resultados(resultados)
+    print(f"\nResultados guardados em: {caminho}")
+
+    if referencia is not None:
+        comparar(resultados, referencia)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+
+# --- 1. CONFIGURAÇÃO ---
+BIBLIOTECA_PATH = 'biblioteca.sqlite'
+
+# Colunas da tabela de faixas e o tipo com que são devolvidas num DataFrame
+# (categorias para as tonalidades, float32 para os atributos numéricos)
+COLUNAS = {
+    'filename': 'TEXT PRIMARY KEY',
+    'artista': 'TEXT',
+    'nome_da_musica': 'TEXT',
+    'bpm': 'REAL',
+    'key_estimada': 'TEXT',
+    'camelot_key': 'TEXT',
+    'rms_medio': 'REAL',
+    'centroide_medio': 'REAL',
+    'chroma_mean': 'BLOB',
+    'mfcc_medio': 'BLOB',
+    'duplicado_de': 'TEXT',
+}
+DTYPES = {
+    'filename': 'string',
+    'artista': 'string',
+    'nome_da_musica': 'string',
+    'bpm': 'float32',
+    'key_estimada': 'category',
+    'camelot_key': 'category',
+    'rms_medio': 'float32',
+    'centroide_medio': 'float32',
+    'duplicado_de': 'string',
+}
+# Colunas guardadas como vetores float32 em binário
+COLUNAS_VETORIAIS = {'chroma_mean', 'mfcc_medio'}
+
+
+# --- 2. BIBLIOTECA (SQLite) ---
+
+class Biblioteca:
+    """
+    Base de dados da biblioteca de faixas, em alternativa aos CSV intermédios.
+    Cada faixa é uma linha identificada pelo nome do ficheiro; as etapas atualizam só as
+    colunas que produzem (upsert) e leem só as linhas de que precisam, com índices
+    sobre o BPM e a chave Camelot.
+    """
+
+    def __init__(self, caminho=BIBLIOTECA_PATH):
+        self.caminho = caminho
+        self.conn = sqlite3.connect(caminho)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        definicao = ', '.join(f'{nome} {tipo}' for nome, tipo in COLUNAS.items())
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS faixas ({definicao})")
+        # Bibliotecas criadas antes de alguma das colunas existir
+        existentes = {linha[1] for linha in self.conn.execute("PRAGMA table_info(faixas)")}
+        for nome, tipo in COLUNAS.items():
+            if nome not in existentes:
+                self.conn.execute(f"ALTER TABLE faixas ADD COLUMN {nome} {tipo}")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_faixas_bpm ON faixas (bpm)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_faixas_camelot ON faixas (camelot_key, bpm)")
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def fechar(self):
+        self.conn.close()
+
+    @staticmethod
+    def _valor_sql(nome, valor):
+        if nome in COLUNAS_VETORIAIS:
+            return None if valor is None else np.asarray(valor, dtype=np.float32).tobytes()
+        if valor is None or (isinstance(valor, float) and np.isnan(valor)) or valor is pd.NA:
+            return None
+        if isinstance(valor, np.generic):
+            return valor.item()
+        return valor
+
+    def upsert(self, df):
+        """
+        Insere ou atualiza faixas a partir de um DataFrame com a coluna 'filename'.
+        Só as colunas presentes no DataFrame (e conhecidas da tabela) são escritas;
+        as restantes colunas de faixas já existentes ficam como estavam.
+        """
+        colunas = [c for c in df.columns if c in COLUNAS]
+        if 'filename' not in colunas:
+            raise ValueError("O DataFrame precisa da coluna 'filename'.")
+        atualizacoes = ', '.join(f'{c} = excluded.{c}' for c in colunas if c != 'filename')
+        sql = (f"INSERT INTO faixas ({', '.join(colunas)}) VALUES ({', '.join('?' for _ in colunas)}) "
+               f"ON CONFLICT(filename) DO " + (f"UPDATE SET {atualizacoes}" if atualizacoes else "NOTHING"))
+        linhas = ([self._valor_sql(c, v) for c, v in zip(colunas, registo)]
+                  for registo in df[colunas].itertuples(index=False, name=None))
+        with self.conn:
+            self.conn.executemany(sql, linhas)
+
+    def remover(self, filenames):
+        with self.conn:
+            self.conn.executemany("DELETE FROM faixas WHERE filename = ?", ((f,) for f in filenames))
+
+    def consultar(self, colunas=None, bpm_min=None, bpm_max=None, camelot_keys=None,
+                  filenames=None, sem_camelot=False, com_camelot=False, sem_duplicados=False):
+        """
+        Devolve as faixas que cumprem os filtros, como DataFrame com tipos compactos.
+        Os filtros de BPM e de chave Camelot usam os índices da tabela.
+        """
+        colunas = list(colunas) if colunas else list(COLUNAS)
+        condicoes, parametros = [], []
+        if bpm_min is not None:
+            condicoes.append("bpm >= ?")
+            parametros.append(bpm_min)
+        if bpm_max is not None:
+            condicoes.append("bpm <= ?")
+            parametros.append(bpm_max)
+        if camelot_keys is not None:
+            camelot_keys = list(camelot_keys)
+            condicoes.append(f"camelot_key IN ({', '.join('?' for _ in camelot_keys)})")
+            parametros.extend(camelot_keys)
+        if filenames is not None:
+            filenames = list(filenames)
+            condicoes.append(f"filename IN ({', '.join('?' for _ in filenames)})")
+            parametros.extend(filenames)
+        if sem_camelot:
+            condicoes.append("camelot_key IS NULL")
+        if com_camelot:
+            condicoes.append("camelot_key IS NOT NULL")
+        if sem_duplicados:
+            condicoes.append("duplicado_de IS NULL")
+
+        sql = f"SELECT {', '.join(colunas)} FROM faixas"
+        if condicoes:
+            sql += " WHERE " + " AND ".join(condicoes)
+        # A ordem de inserção (rowid) mantém a ordem do dataset original, usada nos desempates
+        sql += " ORDER BY rowid"
+
+        df = pd.DataFrame(self.conn.execute(sql, parametros).fetchall(), columns=colunas)
+        for coluna in colunas:
+            if coluna in COLUNAS_VETORIAIS:
+                df[coluna] = [None if b is None else np.frombuffer(b, dtype=np.float32) for b in df[coluna]]
+            else:
+                df[coluna] = df[coluna].astype(DTYPES[coluna])
+        return df
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM faixas").fetchone()[0]
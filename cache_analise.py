@@ -0,0 +1,175 @@
+import os
+import json
+import sqlite3
+import hashlib
+import numpy as np
+
+# --- 1. CONFIGURAÇÃO ---
+CACHE_PATH = 'cache_analise.sqlite'
+
+# Incrementar sempre que o algoritmo de análise mudar, para invalidar resultados antigos
+VERSAO_ANALISE = 3
+# O mesmo para as impressões digitais usadas na deteção de duplicados
+VERSAO_IMPRESSAO = 1
+
+# Tamanho dos blocos lidos ao calcular o hash do conteúdo de um ficheiro
+TAMANHO_BLOCO_HASH = 1024 * 1024
+
+
+# --- 2. IDENTIDADE DOS FICHEIROS ---
+
+def calcular_hash_conteudo(filepath):
+    """Calcula o hash BLAKE2b do conteúdo de um ficheiro, lendo-o em blocos."""
+    h = hashlib.blake2b(digest_size=20)
+    with open(filepath, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_BLOCO_HASH), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+# --- 3. CACHE EM DISCO (SQLite) ---
+
+class CacheAnalise:
+    """
+    Guarda os resultados da análise (BPM, tonalidade, croma médio e restantes atributos) por ficheiro.
+    Um resultado é reutilizado enquanto o caminho, o tamanho e a data de modificação
+    do ficheiro não mudarem. Com `usar_hash=True`, um ficheiro renomeado ou apenas
+    "tocado" é reconhecido pelo hash do seu conteúdo.
+    Cada resultado é gravado assim que é produzido, por isso uma execução
+    interrompida não perde o trabalho já feito.
+    """
+
+    def __init__(self, caminho=CACHE_PATH, usar_hash=False):
+        self.caminho = caminho
+        self.usar_hash = usar_hash
+        # Hashes calculados por `obter` sem resultado em cache: caminho -> (tamanho, mtime_ns, hash),
+        # para o `guardar` seguinte da mesma versão do ficheiro não voltar a ler o ficheiro inteiro
+        self._hashes_pendentes = {}
+        self.conn = sqlite3.connect(caminho)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS analises (
+                caminho TEXT PRIMARY KEY,
+                tamanho INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                hash TEXT,
+                versao INTEGER NOT NULL,
+                bpm REAL,
+                key_estimada TEXT,
+                chroma_mean BLOB,
+                atributos TEXT
+            )
+        """)
+        # Caches criadas antes da coluna 'atributos' existir
+        colunas = {linha[1] for linha in self.conn.execute("PRAGMA table_info(analises)")}
+        if 'atributos' not in colunas:
+            self.conn.execute("ALTER TABLE analises ADD COLUMN atributos TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_analises_hash ON analises (hash)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS impressoes (
+                caminho TEXT PRIMARY KEY,
+                tamanho INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                versao INTEGER NOT NULL,
+                duracao REAL NOT NULL,
+                vetor BLOB NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def fechar(self):
+        self.conn.close()
+
+    @staticmethod
+    def _normalizar(filepath):
+        return os.path.normpath(filepath)
+
+    @staticmethod
+    def _linha_para_resultado(linha):
+        bpm, key_estimada, chroma_blob, atributos = linha
+        chroma_mean = np.frombuffer(chroma_blob, dtype=np.float32) if chroma_blob is not None else None
+        resultado = {'bpm': bpm, 'key_estimada': key_estimada, 'chroma_mean': chroma_mean}
+        for nome, valor in json.loads(atributos or '{}').items():
+            resultado[nome] = np.asarray(valor, dtype=np.float32) if isinstance(valor, list) else valor
+        return resultado
+
+    def obter(self, filepath):
+        """Devolve o resultado guardado para o ficheiro, ou None se não houver um válido."""
+        caminho = self._normalizar(filepath)
+        st = os.stat(filepath)
+        linha = self.conn.execute(
+            "SELECT bpm, key_estimada, chroma_mean, atributos FROM analises "
+            "WHERE caminho = ? AND tamanho = ? AND mtime_ns = ? AND versao = ?",
+            (caminho, st.st_size, st.st_mtime_ns, VERSAO_ANALISE)
+        ).fetchone()
+        if linha is not None:
+            return self._linha_para_resultado(linha)
+
+        if not self.usar_hash:
+            return None
+
+        # O ficheiro mudou de nome ou de data: procura o mesmo conteúdo noutra entrada
+        hash_conteudo = calcular_hash_conteudo(filepath)
+        linha = self.conn.execute(
+            "SELECT bpm, key_estimada, chroma_mean, atributos FROM analises WHERE hash = ? AND versao = ? LIMIT 1",
+            (hash_conteudo, VERSAO_ANALISE)
+        ).fetchone()
+        if linha is None:
+            self._hashes_pendentes[caminho] = (st.st_size, st.st_mtime_ns, hash_conteudo)
+            return None
+        resultado = self._linha_para_resultado(linha)
+        self.guardar(filepath, resultado, hash_conteudo=hash_conteudo)
+        return resultado
+
+    def guardar(self, filepath, resultado, hash_conteudo=None):
+        """Grava (e confirma de imediato) o resultado da análise de um ficheiro."""
+        caminho = self._normalizar(filepath)
+        st = os.stat(filepath)
+        pendente = self._hashes_pendentes.pop(caminho, None)
+        if hash_conteudo is None and pendente is not None and pendente[:2] == (st.st_size, st.st_mtime_ns):
+            hash_conteudo = pendente[2]
+        if hash_conteudo is None and self.usar_hash:
+            hash_conteudo = calcular_hash_conteudo(filepath)
+        chroma_mean = resultado.get('chroma_mean')
+        chroma_blob = np.asarray(chroma_mean, dtype=np.float32).tobytes() if chroma_mean is not None else None
+        bpm = resultado.get('bpm')
+        # Os restantes atributos (escalares ou vetores) ficam numa coluna JSON
+        atributos = {nome: (np.asarray(valor).tolist() if isinstance(valor, np.ndarray) else valor)
+                     for nome, valor in resultado.items() if nome not in ('bpm', 'key_estimada', 'chroma_mean')}
+        self.conn.execute(
+            "INSERT OR REPLACE INTO analises "
+            "(caminho, tamanho, mtime_ns, hash, versao, bpm, key_estimada, chroma_mean, atributos) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (caminho, st.st_size, st.st_mtime_ns, hash_conteudo, VERSAO_ANALISE,
+             float(bpm) if bpm is not None else None, resultado.get('key_estimada'), chroma_blob,
+             json.dumps(atributos))
+        )
+        self.conn.commit()
+
+    def obter_impressao(self, filepath):
+        """Devolve a impressão digital guardada para o ficheiro, (vetor, duração), ou None."""
+        st = os.stat(filepath)
+        linha = self.conn.execute(
+            "SELECT vetor, duracao FROM impressoes WHERE caminho = ? AND tamanho = ? AND mtime_ns = ? AND versao = ?",
+            (self._normalizar(filepath), st.st_size, st.st_mtime_ns, VERSAO_IMPRESSAO)
+        ).fetchone()
+        if linha is None:
+            return None
+        return np.frombuffer(linha[0], dtype=np.float32), linha[1]
+
+    def guardar_impressao(self, filepath, vetor, duracao):
+        st = os.stat(filepath)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO impressoes (caminho, tamanho, mtime_ns, versao, duracao, vetor) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (self._normalizar(filepath), st.st_size, st.st_mtime_ns, VERSAO_IMPRESSAO, float(duracao),
+             np.asarray(vetor, dtype=np.float32).tobytes())
+        )
+        self.conn.commit()
@@ -0,0 +1,223 @@
+import re
+import json
+import time
+import sqlite3
+import asyncio
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- 1. CONFIGURAÇÃO ---
+# Endereços das APIs (podem apontar para um servidor local de testes)
+MUSICBRAINZ_URL = 'https://musicbrainz.org/ws/2'
+ACOUSTICBRAINZ_URL = 'https://acousticbrainz.org/api/v1'
+
+# O MusicBrainz exige um User-Agent que identifique a aplicação e um contacto
+USER_AGENT = 'TechnoSetHarmonizado/1.0 ( seu.email@exemplo.com )'
+
+# Limites de pedidos de cada serviço: (pedidos por segundo, rajada máxima)
+# MusicBrainz: 1 pedido por segundo. AcousticBrainz: 10 pedidos a cada 10 segundos.
+# A rajada não pode ir além de 1: com o balde cheio, as fichas da rajada somam-se às que
+# entretanto são repostas (uma rajada de 10 a 1/s deixaria passar ~20 pedidos nos primeiros 10 s).
+LIMITE_MUSICBRAINZ = (1.0, 1)
+LIMITE_ACOUSTICBRAINZ = (1.0, 1)
+
+# Pedidos HTTP em simultâneo (e tamanho do pool de ligações keep-alive)
+MAX_PEDIDOS_SIMULTANEOS = 8
+
+# Cache em disco das respostas, para que as execuções seguintes só consultem faixas novas
+CACHE_BRAINZ_PATH = 'cache_brainz.sqlite'
+
+TIMEOUT_PEDIDO = 30
+# Tentativas quando o serviço responde 503/429 (limite excedido) ou falha a ligação
+MAX_TENTATIVAS = 4
+
+# Caracteres com significado especial na sintaxe de pesquisa (Lucene) do MusicBrainz
+CARACTERES_LUCENE = re.compile(r'([+\-&|!(){}\[\]\^"~*?:\\/])')
+
+# --- 2. LIMITADOR DE PEDIDOS (TOKEN BUCKET) ---
+
+class LimitadorPedidos:
+    """
+    Token bucket: acumula `taxa` fichas por segundo, até `capacidade`. Cada pedido gasta
+    uma ficha e espera, sem bloquear o ciclo de eventos, até haver uma disponível.
+    """
+
+    def __init__(self, taxa, capacidade):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self.fichas = capacidade
+        self.ultimo = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def adquirir(self):
+        async with self._lock:
+            while True:
+                agora = time.monotonic()
+                self.fichas = min(self.capacidade, self.fichas + (agora - self.ultimo) * self.taxa)
+                self.ultimo = agora
+                if self.fichas >= 1:
+                    self.fichas -= 1
+                    return
+                await asyncio.sleep((1 - self.fichas) / self.taxa)
+
+# --- 3. CACHE DAS RESPOSTAS ---
+
+class CacheBrainz:
+    """
+    Guarda as respostas já obtidas: o MBID por artista/título e os dados acústicos por MBID.
+    Resultados "não encontrado" também ficam guardados; erros de rede não.
+    """
+
+    def __init__(self, caminho=CACHE_BRAINZ_PATH):
+        self.conn = sqlite3.connect(caminho)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS respostas (
+                chave TEXT PRIMARY KEY,
+                valor TEXT,
+                gravado REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def obter(self, chave):
+        """Devolve (encontrado, valor)."""
+        linha = self.conn.execute("SELECT valor FROM respostas WHERE chave = ?", (chave,)).fetchone()
+        if linha is None:
+            return False, None
+        return True, json.loads(linha[0])
+
+    def guardar(self, chave, valor):
+        self.conn.execute("INSERT OR REPLACE INTO respostas (chave, valor, gravado) VALUES (?, ?, ?)",
+                          (chave, json.dumps(valor), time.time()))
+        self.conn.commit()
+
+    def fechar(self):
+        self.conn.close()
+
+def _escapar(valor):
+    return CARACTERES_LUCENE.sub(r'\\\1', str(valor).lower())
+
+def chave_gravacao(artista, titulo):
+    return f"mb:{str(artista).strip().lower()}|{str(titulo).strip().lower()}"
+
+def chave_mbid(mbid):
+    return f"ab:{mbid}"
+
+# --- 4. CLIENTE ---
+
+class ErroTemporario(Exception):
+    """Resposta que justifica nova tentativa (limite excedido ou serviço indisponível)."""
+
+class ClienteBrainz:
+    """
+    Cliente assíncrono do MusicBrainz e do AcousticBrainz. Os pedidos usam uma única sessão
+    HTTP com ligações keep-alive reutilizadas, respeitam o limite de cada serviço e passam
+    primeiro pela cache em disco.
+    """
+
+    def __init__(self, musicbrainz_url=MUSICBRAINZ_URL, acousticbrainz_url=ACOUSTICBRAINZ_URL,
+                 caminho_cache=CACHE_BRAINZ_PATH, max_simultaneos=MAX_PEDIDOS_SIMULTANEOS,
+                 limite_musicbrainz=LIMITE_MUSICBRAINZ, limite_acousticbrainz=LIMITE_ACOUSTICBRAINZ):
+        self.musicbrainz_url = musicbrainz_url.rstrip('/')
+        self.acousticbrainz_url = acousticbrainz_url.rstrip('/')
+        self.cache = CacheBrainz(caminho_cache)
+        self.sessao = requests.Session()
+        self.sessao.headers['User-Agent'] = USER_AGENT
+        adaptador = HTTPAdapter(pool_connections=2, pool_maxsize=max_simultaneos)
+        self.sessao.mount('http://', adaptador)
+        self.sessao.mount('https://', adaptador)
+        self.max_simultaneos = max_simultaneos
+        self.limites = (limite_musicbrainz, limite_acousticbrainz)
+        self.pedidos_feitos = 0
+
+    def fechar(self):
+        self.sessao.close()
+        self.cache.fechar()
+
+    async def _pedir_json(self, limitador, url, params=None):
+        """GET com limite de pedidos e novas tentativas; devolve o JSON, ou None em 404."""
+        for tentativa in range(MAX_TENTATIVAS):
+            await limitador.adquirir()
+            async with self._semaforo:
+                try:
+                    self.pedidos_feitos += 1
+                    resposta = await asyncio.to_thread(self.sessao.get, url, params=params, timeout=TIMEOUT_PEDIDO)
+                    if resposta.status_code in (429, 503):
+                        raise ErroTemporario(f"HTTP {resposta.status_code}")
+                    if resposta.status_code == 404:
+                        return None
+                    resposta.raise_for_status()
+                    return resposta.json()
+                except (ErroTemporario, requests.ConnectionError, requests.Timeout):
+                    if tentativa == MAX_TENTATIVAS - 1:
+                        raise
+            await asyncio.sleep(2 ** tentativa)
+
+    async def obter_mbid(self, artista, titulo):
+        """MBID da primeira gravação encontrada para o artista/título, ou None."""
+        chave = chave_gravacao(artista, titulo)
+        encontrado, mbid = self.cache.obter(chave)
+        if encontrado:
+            return mbid
+        print(f"Buscando MBID para: {artista} - {titulo}")
+        # A mesma consulta que o musicbrainzngs.search_recordings(artist=..., recording=...)
+        consulta = f"artist:({_escapar(artista)}) recording:({_escapar(titulo)})"
+        dados = await self._pedir_json(self._limitador_mb, f"{self.musicbrainz_url}/recording/",
+                                       params={'query': consulta, 'limit': 1, 'fmt': 'json'})
+        gravacoes = (dados or {}).get('recordings') or []
+        mbid = gravacoes[0]['id'] if gravacoes else None
+        self.cache.guardar(chave, mbid)
+        return mbid
+
+    async def obter_dados_acusticos(self, mbid):
+        """(bpm, tonalidade) do AcousticBrainz para o MBID, ou (None, None)."""
+        if not mbid:
+            return None, None
+        chave = chave_mbid(mbid)
+        encontrado, dados = self.cache.obter(chave)
+        if not encontrado:
+            print(f"Buscando dados no AcousticBrainz para o MBID: {mbid}")
+            resposta = await self._pedir_json(self._limitador_ab, f"{self.acousticbrainz_url}/{mbid}/low-level")
+            dados = None
+            if resposta is not None:
+                tonal = resposta.get('tonal', {})
+                dados = {'bpm': resposta.get('rhythm', {}).get('bpm'),
+                         'key': f"{tonal.get('key_key')} {tonal.get('key_scale')}"}
+            self.cache.guardar(chave, dados)
+        if dados is None:
+            return None, None
+        return dados['bpm'], dados['key']
+
+    async def _enriquecer_faixa(self, artista, titulo):
+        try:
+            mbid = await self.obter_mbid(artista, titulo)
+        except Exception as e:
+            print(f"Erro na chamada ao MusicBrainz para {artista} - {titulo}: {e}")
+            return None, None, None
+        try:
+            bpm, key = await self.obter_dados_acusticos(mbid)
+        except Exception as e:
+            print(f"Erro na chamada ao AcousticBrainz para {mbid}: {e}")
+            bpm, key = None, None
+        return mbid, bpm, key
+
+    async def enriquecer(self, faixas):
+        """
+        Recebe uma lista de (artista, título) e devolve, pela mesma ordem, uma lista de
+        (mbid, bpm, tonalidade). As faixas são consultadas em simultâneo, dentro dos limites.
+        """
+        # Os objetos asyncio são criados dentro do ciclo de eventos que os vai usar
+        self._semaforo = asyncio.Semaphore(self.max_simultaneos)
+        self._limitador_mb = LimitadorPedidos(*self.limites[0])
+        self._limitador_ab = LimitadorPedidos(*self.limites[1])
+        return await asyncio.gather(*(self._enriquecer_faixa(artista, titulo) for artista, titulo in faixas))
+
+def enriquecer_faixas(faixas, **opcoes):
+    """Versão síncrona de ClienteBrainz.enriquecer; devolve (resultados, pedidos feitos à rede)."""
+    cliente = ClienteBrainz(**opcoes)
+    try:
+        resultados = asyncio.run(cliente.enriquecer(faixas))
+    finally:
+        cliente.fechar()
+    return resultados, cliente.pedidos_feitos
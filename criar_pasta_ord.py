@@ -2,6 +2,11 @@ import pandas as pd
 import os
 import shutil # Biblioteca para operações de ficheiros de alto nível, como copiar
 import sys
+import json
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import instrumentacao
 
 # --- 1. CONFIGURAÇÃO ---
 # O ficheiro que contém a ordem do nosso set
@@ -13,48 +18,285 @@ SOURCE_AUDIO_FOLDER = 'musicas_flac/'
 # O nome da nova pasta que vamos criar para o set final
 FINAL_SET_FOLDER = 'DJ_Set_Final_Ordenado'
 
-# --- 2. CARREGAR A PLAYLIST ORDENADA ---
-print(f"A carregar a ordem do set do ficheiro: {ORDERED_CSV_PATH}")
-try:
-    df_ordered = pd.read_csv(ORDERED_CSV_PATH)
-except FileNotFoundError:
-    print(f"ERRO: O ficheiro ordenado '{ORDERED_CSV_PATH}' não foi encontrado.")
-    print("Por favor, execute o script 'ordenar_set.py' primeiro.")
-    sys.exit()
-
-# --- 3. CRIAR A PASTA DE DESTINO ---
-if not os.path.exists(FINAL_SET_FOLDER):
-    os.makedirs(FINAL_SET_FOLDER)
-    print(f"Pasta de destino '{FINAL_SET_FOLDER}' criada com sucesso.")
-else:
-    print(f"Pasta de destino '{FINAL_SET_FOLDER}' já existe. Os ficheiros serão adicionados ou sobrescritos.")
-    
-# --- 4. COPIAR E RENOMEAR OS FICHEIROS NA ORDEM CORRETA ---
-print("\nIniciando a criação da pasta do DJ set final...")
-
-total_musicas = len(df_ordered)
-# Calcula o número de dígitos necessários para o prefixo (ex: 109 músicas -> 3 dígitos)
-num_digits = len(str(total_musicas))
-
-for index, row in df_ordered.iterrows():
-    ordem = index + 1
-    nome_original = row['filename']
-    
-    # Caminho do ficheiro de origem
-    caminho_origem = os.path.join(SOURCE_AUDIO_FOLDER, nome_original)
-    
-    # Cria o novo nome do ficheiro com o prefixo numérico
+# Como cada ficheiro chega à pasta do set:
+#   'reflink'  - cópia copy-on-write (instantânea e sem ocupar espaço, em Btrfs/XFS); se o sistema
+#                de ficheiros não suportar, faz uma cópia normal
+#   'hardlink' - o mesmo ficheiro com dois nomes (não ocupa espaço, mas as tags escritas no set
+#                também ficam no original)
+#   'symlink'  - atalho para o original (idem)
+#   'copia'    - cópia integral, como antes
+MODOS = ('reflink', 'hardlink', 'symlink', 'copia')
+# Modos em que o ficheiro do set é o próprio original: escrever tags nele altera a origem
+MODOS_LIGADOS = ('hardlink', 'symlink')
+MODO_PADRAO = 'reflink'
+
+# Número de cópias em simultâneo (só as cópias integrais precisam de paralelismo)
+NUM_THREADS_COPIA = 8
+
+# Registo, dentro da pasta do set, da origem de cada ficheiro criado por este script
+MANIFESTO_NOME = '.manifesto_set.json'
+
+# Posições do set alteradas pela última inserção incremental (ordenar_set.py --inserir). Com
+# --alteracoes, só essas posições são verificadas, em vez de todos os ficheiros do set.
+ALTERACOES_PATH = 'alteracoes_set.json'
+
+# ioctl FICLONE do Linux (clonagem copy-on-write de um ficheiro inteiro)
+FICLONE = 0x40049409
+
+# --- 2. FUNÇÕES DE MATERIALIZAÇÃO ---
+
+def nome_numerado(ordem, nome_original, num_digits):
+    """Nome do ficheiro na pasta do set, com o prefixo numérico (ex: 1 -> '001 - Artista - Música.flac')."""
     # str(ordem).zfill(num_digits) garante os zeros à esquerda (ex: 1 -> "001")
-    novo_nome = f"{str(ordem).zfill(num_digits)} - {nome_original}"
-    caminho_destino = os.path.join(FINAL_SET_FOLDER, novo_nome)
-    
-    # Verifica se o ficheiro original existe antes de copiar
-    if os.path.exists(caminho_origem):
-        print(f"Copiando [{ordem}/{total_musicas}]: {novo_nome}")
-        shutil.copy(caminho_origem, caminho_destino)
+    return f"{str(ordem).zfill(num_digits)} - {nome_original}"
+
+def identidade_origem(caminho_origem):
+    """Identifica a versão de um ficheiro de origem pelo caminho, tamanho e data de modificação."""
+    st = os.stat(caminho_origem)
+    return {'origem': os.path.abspath(caminho_origem), 'tamanho': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+def _reflink(origem, destino):
+    import fcntl
+    with open(origem, 'rb') as f_origem, open(destino, 'wb') as f_destino:
+        fcntl.ioctl(f_destino.fileno(), FICLONE, f_origem.fileno())
+    shutil.copystat(origem, destino)
+
+def materializar_ficheiro(origem, destino, modo):
+    """
+    Cria `destino` a partir de `origem` no modo pedido, recorrendo à cópia normal se o
+    modo não for suportado (outro sistema de ficheiros, outro disco, falta de permissões).
+    O ficheiro é criado com um nome temporário e só depois substitui o destino.
+    Devolve o modo efetivamente usado.
+    """
+    temporario = f"{destino}.tmp"
+    if os.path.lexists(temporario):
+        os.remove(temporario)
+    usado = modo
+    try:
+        if modo == 'reflink':
+            _reflink(origem, temporario)
+        elif modo == 'hardlink':
+            os.link(origem, temporario)
+        elif modo == 'symlink':
+            os.symlink(os.path.abspath(origem), temporario)
+        else:
+            shutil.copy2(origem, temporario)
+    except (OSError, ImportError):
+        if os.path.lexists(temporario):
+            os.remove(temporario)
+        usado = 'copia'
+        shutil.copy2(origem, temporario)
+    os.replace(temporario, destino)
+    return usado
+
+def posicoes_alteradas(filenames_antigos, filenames_novos):
+    """
+    Posições (a contar de 1) cujo ficheiro numerado mudou entre duas versões do set: as que
+    passaram a ter outra faixa e, se o número de dígitos do prefixo mudou, todas.
+    """
+    if len(str(len(filenames_antigos))) != len(str(len(filenames_novos))):
+        return list(range(1, len(filenames_novos) + 1))
+    return [ordem for ordem, filename in enumerate(filenames_novos, start=1)
+            if ordem > len(filenames_antigos) or filenames_antigos[ordem - 1] != filename]
+
+def _assinatura_set(filenames):
+    return hashlib.sha1('\n'.join(filenames).encode('utf-8')).hexdigest()
+
+def guardar_alteracoes(filenames, posicoes, caminho=ALTERACOES_PATH):
+    """Regista as posições alteradas do set, com uma assinatura da ordem a que se referem."""
+    with open(f"{caminho}.tmp", 'w', encoding='utf-8') as f:
+        json.dump({'assinatura': _assinatura_set(filenames), 'total': len(filenames), 'posicoes': posicoes},
+                  f, ensure_ascii=False)
+    os.replace(f"{caminho}.tmp", caminho)
+
+def carregar_alteracoes(filenames, caminho=ALTERACOES_PATH):
+    """
+    Posições alteradas registadas para este set, ou None se o registo não existir ou for de
+    outra ordem (o set foi reordenado depois da inserção): nesse caso é preciso ver tudo.
+    """
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            alteracoes = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if alteracoes.get('total') != len(filenames) or alteracoes.get('assinatura') != _assinatura_set(filenames):
+        return None
+    return alteracoes['posicoes']
+
+def carregar_manifesto(pasta):
+    try:
+        with open(os.path.join(pasta, MANIFESTO_NOME), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def guardar_manifesto(pasta, manifesto):
+    caminho = os.path.join(pasta, MANIFESTO_NOME)
+    with open(f"{caminho}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=1)
+    os.replace(f"{caminho}.tmp", caminho)
+
+def _mesma_versao(entrada, identidade, modo):
+    return (entrada['origem'] == identidade['origem'] and entrada['tamanho'] == identidade['tamanho']
+            and entrada['mtime_ns'] == identidade['mtime_ns'] and entrada.get('modo_pedido') == modo)
+
+def criar_pasta_set(df_ordered, pasta_origem=SOURCE_AUDIO_FOLDER, pasta_destino=FINAL_SET_FOLDER,
+                    modo=MODO_PADRAO, limpar=True, num_threads=NUM_THREADS_COPIA, posicoes=None):
+    """
+    Cria (ou atualiza) a pasta do set com os ficheiros numerados pela ordem de `df_ordered`.
+    Ficheiros cuja origem não mudou desde a última execução são mantidos; se só mudaram de
+    posição, são apenas renomeados. Os restantes são criados em paralelo no modo pedido.
+    Com `limpar`, os ficheiros criados anteriormente que já não fazem parte do set são apagados.
+    Com `posicoes` (ver carregar_alteracoes), só essas posições são verificadas: as restantes
+    ficam como o manifesto as regista, sem sequer consultar os ficheiros.
+    Devolve um dicionário com o número de ficheiros mantidos, renomeados, criados, em falta e apagados.
+    """
+    os.makedirs(pasta_destino, exist_ok=True)
+    manifesto = carregar_manifesto(pasta_destino)
+    # Entradas antigas por origem, para reaproveitar ficheiros que só mudaram de posição
+    antigos_por_origem = {}
+    for nome, entrada in manifesto.items():
+        antigos_por_origem.setdefault(entrada['origem'], []).append(nome)
+
+    total_musicas = len(df_ordered)
+    # Calcula o número de dígitos necessários para o prefixo (ex: 109 músicas -> 3 dígitos)
+    num_digits = len(str(total_musicas))
+
+    filenames = list(df_ordered['filename'])
+    novo_manifesto = {}
+    a_criar = []
+    resumo = {'mantidos': 0, 'renomeados': 0, 'criados': 0, 'em_falta': 0, 'apagados': 0}
+
+    ordens = range(1, total_musicas + 1)
+    if posicoes is not None and manifesto:
+        alteradas = set(posicoes)
+        for ordem, nome_original in enumerate(filenames, start=1):
+            nome = nome_numerado(ordem, nome_original, num_digits)
+            if ordem not in alteradas and nome in manifesto:
+                novo_manifesto[nome] = manifesto[nome]
+        resumo['mantidos'] = len(novo_manifesto)
+        ordens = sorted(alteradas)
+
+    for ordem in ordens:
+        nome_original = filenames[ordem - 1]
+        caminho_origem = os.path.join(pasta_origem, nome_original)
+        novo_nome = nome_numerado(ordem, nome_original, num_digits)
+        caminho_destino = os.path.join(pasta_destino, novo_nome)
+
+        # Verifica se o ficheiro original existe antes de copiar
+        if not os.path.exists(caminho_origem):
+            print(f"AVISO: Ficheiro de origem não encontrado e ignorado: {nome_original}")
+            resumo['em_falta'] += 1
+            continue
+
+        identidade = identidade_origem(caminho_origem)
+        entrada_atual = manifesto.get(novo_nome)
+        if entrada_atual and os.path.lexists(caminho_destino) and _mesma_versao(entrada_atual, identidade, modo):
+            novo_manifesto[novo_nome] = entrada_atual
+            resumo['mantidos'] += 1
+            continue
+
+        # A mesma origem já existe na pasta com outro número: basta renomear
+        reaproveitado = None
+        for nome_antigo in antigos_por_origem.get(identidade['origem'], []):
+            entrada = manifesto[nome_antigo]
+            caminho_antigo = os.path.join(pasta_destino, nome_antigo)
+            if nome_antigo != novo_nome and nome_antigo not in novo_manifesto \
+                    and os.path.lexists(caminho_antigo) and _mesma_versao(entrada, identidade, modo):
+                reaproveitado = nome_antigo
+                break
+        if reaproveitado is not None:
+            antigos_por_origem[identidade['origem']].remove(reaproveitado)
+            os.replace(os.path.join(pasta_destino, reaproveitado), caminho_destino)
+            novo_manifesto[novo_nome] = manifesto[reaproveitado]
+            print(f"Renomeando [{ordem}/{total_musicas}]: {reaproveitado} -> {novo_nome}")
+            resumo['renomeados'] += 1
+            continue
+
+        a_criar.append((ordem, novo_nome, caminho_origem, caminho_destino, identidade))
+
+    def criar(tarefa):
+        ordem, novo_nome, caminho_origem, caminho_destino, identidade = tarefa
+        with instrumentacao.faixa(novo_nome):
+            with instrumentacao.medir(modo):
+                usado = materializar_ficheiro(caminho_origem, caminho_destino, modo)
+        print(f"Criando [{ordem}/{total_musicas}] ({usado}): {novo_nome}")
+        return novo_nome, {**identidade, 'modo_pedido': modo, 'modo': usado}
+
+    if a_criar:
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            for novo_nome, entrada in executor.map(criar, a_criar):
+                novo_manifesto[novo_nome] = entrada
+                resumo['criados'] += 1
+
+    if limpar:
+        for nome_antigo in manifesto:
+            caminho_antigo = os.path.join(pasta_destino, nome_antigo)
+            if nome_antigo not in novo_manifesto and os.path.lexists(caminho_antigo):
+                os.remove(caminho_antigo)
+                resumo['apagados'] += 1
     else:
-        print(f"AVISO: Ficheiro de origem não encontrado e ignorado: {nome_original}")
+        # Os ficheiros antigos continuam na pasta; o manifesto continua a conhecê-los
+        for nome_antigo, entrada in manifesto.items():
+            if nome_antigo not in novo_manifesto and os.path.lexists(os.path.join(pasta_destino, nome_antigo)):
+                novo_manifesto[nome_antigo] = entrada
+
+    guardar_manifesto(pasta_destino, novo_manifesto)
+    return resumo
+
+# --- 3. EXECUÇÃO ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Cria a pasta do DJ set com os ficheiros numerados pela ordem do set.")
+    parser.add_argument('--modo', choices=MODOS, default=MODO_PADRAO,
+                        help="como criar os ficheiros: reflink (padrão, copy-on-write com cópia como recurso), "
+                             "hardlink, symlink ou copia. Com hardlink/symlink, as tags escritas pelo "
+                             "escrever_metadados.py também alteram os ficheiros originais.")
+    parser.add_argument('--manter-antigos', action='store_true',
+                        help="não apaga os ficheiros de execuções anteriores que já não fazem parte do set")
+    parser.add_argument('--threads', type=int, default=NUM_THREADS_COPIA,
+                        help=f"número de cópias em simultâneo (padrão: {NUM_THREADS_COPIA})")
+    parser.add_argument('--alteracoes', nargs='?', const=ALTERACOES_PATH, default=None,
+                        help="só atualiza as posições alteradas pela última inserção incremental "
+                             f"(ordenar_set.py --inserir), registadas neste ficheiro (padrão: {ALTERACOES_PATH})")
+    instrumentacao.adicionar_argumentos(parser)
+    args = parser.parse_args()
+    instrumentacao.configurar(args, etapa='pasta')
+
+    # Carregar a playlist ordenada
+    print(f"A carregar a ordem do set do ficheiro: {ORDERED_CSV_PATH}")
+    try:
+        df_ordered = pd.read_csv(ORDERED_CSV_PATH)
+    except FileNotFoundError:
+        print(f"ERRO: O ficheiro ordenado '{ORDERED_CSV_PATH}' não foi encontrado.")
+        print("Por favor, execute o script 'ordenar_set.py' primeiro.")
+        sys.exit()
+
+    if not os.path.exists(FINAL_SET_FOLDER):
+        print(f"Pasta de destino '{FINAL_SET_FOLDER}' será criada.")
+    else:
+        print(f"Pasta de destino '{FINAL_SET_FOLDER}' já existe. Só os ficheiros alterados serão atualizados.")
+
+    posicoes = None
+    if args.alteracoes is not None:
+        posicoes = carregar_alteracoes(list(df_ordered['filename']), args.alteracoes)
+        if posicoes is None:
+            print(f"AVISO: '{args.alteracoes}' não corresponde ao set atual. Todas as posições serão verificadas.")
+        else:
+            print(f"Só as {len(posicoes)} posições alteradas pela última inserção serão atualizadas.")
+
+    print(f"\nIniciando a criação da pasta do DJ set final (modo: {args.modo})...")
+    with instrumentacao.etapa('pasta'):
+        resumo = criar_pasta_set(df_ordered, modo=args.modo, limpar=not args.manter_antigos, num_threads=args.threads,
+                                 posicoes=posicoes)
+
+    print("\n--- PROCESSO CONCLUÍDO! ---")
+    print(f"{resumo['criados']} ficheiros criados, {resumo['renomeados']} renomeados, "
+          f"{resumo['mantidos']} sem alterações, {resumo['apagados']} antigos apagados, "
+          f"{resumo['em_falta']} em falta.")
+    print(f"A sua pasta '{FINAL_SET_FOLDER}' está pronta!")
+    print("Pode agora importar esta pasta para o Rekordbox ou o seu software de DJ preferido, e as músicas estarão na ordem exata do seu set.")
+
 
-print("\n--- PROCESSO CONCLUÍDO! ---")
-print(f"A sua pasta '{FINAL_SET_FOLDER}' está pronta!")
-print("Pode agora importar esta pasta para o Rekordbox ou o seu software de DJ preferido, e as músicas estarão na ordem exata do seu set.")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import numpy as np
+
+# --- 1. CONFIGURAÇÃO ---
+# Deteção de duplicados: a mesma faixa com outro nome, noutra taxa de amostragem ou com
+# outra compressão. A impressão digital de cada faixa (croma e ritmo de alguns excertos,
+# ver analise_acoustica_local.calcular_impressao) é resumida num SimHash de 64 bits.
+BITS_SIMHASH = 64
+
+# O SimHash é dividido em bandas; duas faixas só são comparadas se coincidirem em pelo menos
+# uma banda inteira. Com 8 bandas, duas impressões a menos de 8 bits de distância coincidem
+# sempre numa delas, por isso nenhuma cópia com LIMIAR_HAMMING ou menos bits diferentes escapa.
+BANDAS = 8
+LIMIAR_HAMMING = 7
+
+# Confirmação de cada par candidato: semelhança (cosseno) mínima das impressões completas e
+# diferença máxima de duração (silêncio acrescentado no início ou no fim por outro encoder)
+SEMELHANCA_MINIMA = 0.98
+DIFERENCA_MAXIMA_DURACAO = 2.0
+
+# Semente dos hiperplanos aleatórios do SimHash (tem de ser sempre a mesma)
+SEMENTE_HIPERPLANOS = 7
+
+_BITS_POR_BANDA = BITS_SIMHASH // BANDAS
+_MASCARA_BANDA = (1 << _BITS_POR_BANDA) - 1
+_hiperplanos = {}
+
+# --- 2. SIMHASH ---
+
+def simhash(vetor):
+    """
+    SimHash de um vetor: um bit por hiperplano aleatório, conforme o lado em que o vetor fica.
+    Vetores com um ângulo pequeno entre si diferem em poucos bits.
+    """
+    dimensao = len(vetor)
+    if dimensao not in _hiperplanos:
+        _hiperplanos[dimensao] = np.random.default_rng(SEMENTE_HIPERPLANOS).standard_normal((BITS_SIMHASH, dimensao))
+    bits = _hiperplanos[dimensao] @ np.asarray(vetor, dtype=np.float64) > 0
+    return int(np.packbits(bits).view('>u8')[0])
+
+def _bandas(assinatura):
+    return [(banda, (assinatura >> (banda * _BITS_POR_BANDA)) & _MASCARA_BANDA) for banda in range(BANDAS)]
+
+# --- 3. ÍNDICE LSH ---
+
+class IndiceDuplicados:
+    """
+    Índice das impressões digitais por banda do SimHash: procurar uma faixa só a compara com
+    as faixas que partilham alguma banda com ela, e não com a biblioteca inteira.
+    """
+
+    def __init__(self):
+        self.baldes = {}
+        self.entradas = {}
+
+    def __len__(self):
+        return len(self.entradas)
+
+    def adicionar(self, chave, vetor, duracao):
+        assinatura = simhash(vetor)
+        norma = np.linalg.norm(vetor)
+        self.entradas[chave] = (assinatura, np.asarray(vetor) / norma if norma > 0 else np.asarray(vetor), duracao)
+        for banda in _bandas(assinatura):
+            self.baldes.setdefault(banda, []).append(chave)
+
+    def procurar(self, vetor, duracao):
+        """Chave da faixa já indexada mais parecida que seja um duplicado desta, ou None."""
+        assinatura = simhash(vetor)
+        norma = np.linalg.norm(vetor)
+        unitario = np.asarray(vetor) / norma if norma > 0 else np.asarray(vetor)
+        vistos = set()
+        melhor, melhor_semelhanca = None, SEMELHANCA_MINIMA
+        for banda in _bandas(assinatura):
+            for chave in self.baldes.get(banda, ()):
+                if chave in vistos:
+                    continue
+                vistos.add(chave)
+                assinatura_candidata, unitario_candidato, duracao_candidata = self.entradas[chave]
+                if (assinatura ^ assinatura_candidata).bit_count() > LIMIAR_HAMMING:
+                    continue
+                if abs(duracao - duracao_candidata) > DIFERENCA_MAXIMA_DURACAO:
+                    continue
+                semelhanca = float(unitario @ unitario_candidato)
+                if semelhanca >= melhor_semelhanca:
+                    melhor, melhor_semelhanca = chave, semelhanca
+        return melhor
+
+def agrupar_duplicados(impressoes, ordem=None):
+    """
+    Recebe a impressão digital de cada faixa, (vetor, duração) ou None, e devolve para cada
+    uma o índice da faixa que a representa (ela própria, se não for duplicada). As faixas são
+    indexadas pela `ordem` dada (por omissão, a da lista): num grupo de duplicados, a primeira
+    nessa ordem representa as outras.
+    """
+    indice = IndiceDuplicados()
+    representantes = list(range(len(impressoes)))
+    for i in (range(len(impressoes)) if ordem is None else ordem):
+        if impressoes[i] is None:
+            continue
+        vetor, duracao = impressoes[i]
+        igual = indice.procurar(vetor, duracao)
+        if igual is not None:
+            representantes[i] = representantes[igual]
+        else:
+            indice.adicionar(i, vetor, duracao)
+    return representantes
@@ -1,5 +1,8 @@
 import pandas as pd
 import sys
+import argparse
+from biblioteca import Biblioteca, BIBLIOTECA_PATH
+import instrumentacao
 
 # --- 1. CONFIGURAÇÃO ---
 INPUT_PATH = 'dataset_final_analisado.csv'
@@ -24,17 +27,7 @@ CAMELOT_MAP = {
     'Ab minor': '1A', 'Eb minor': '2A', 'Bb minor': '3A',
 }
 
-# --- 2. CARREGAR O DATASET ANALISADO ---
-print(f"A carregar o dataset de: {INPUT_PATH}")
-try:
-    df = pd.read_csv(INPUT_PATH)
-    print(f"Sucesso. {len(df)} faixas carregadas para a etapa final de engenharia.")
-except FileNotFoundError:
-    print(f"ERRO CRÍTICO: O ficheiro '{INPUT_PATH}' não foi encontrado.")
-    print("Por favor, execute o script 'processar_musicas.py' primeiro.")
-    sys.exit()
-
-# --- 3. ENGENHARIA DA 'CAMELOT_KEY' ---
+# --- 2. ENGENHARIA DA 'CAMELOT_KEY' ---
 
 def encontrar_camelot_key(key_estimada):
     """
@@ -55,27 +48,81 @@ def encontrar_camelot_key(key_estimada):
 
     return CAMELOT_MAP.get(key_completa)
 
-print("\nIniciando a criação do atributo 'camelot_key'...")
+def adicionar_camelot_key(df):
+    """
+    Devolve uma cópia do dataset com a coluna 'camelot_key', sem as faixas
+    que não puderam ser mapeadas para uma chave Camelot.
+    """
+    df = df.copy()
+    # Aplica a função para criar a nova coluna
+    df['camelot_key'] = df['key_estimada'].apply(encontrar_camelot_key)
+
+    # Verifica se alguma música ficou sem a chave Camelot e a remove
+    # (Isso só aconteceria se o nosso algoritmo retornasse uma tonalidade não padrão)
+    linhas_sem_camelot = df['camelot_key'].isnull().sum()
+    if linhas_sem_camelot > 0:
+        print(f"AVISO: {linhas_sem_camelot} faixas não puderam ser mapeadas para uma chave Camelot e foram removidas.")
+        df.dropna(subset=['camelot_key'], inplace=True)
+    return df
+
+# --- 3. EXECUÇÃO ---
+
+def atualizar_biblioteca(caminho=BIBLIOTECA_PATH):
+    """
+    Calcula a chave Camelot só das faixas da biblioteca que ainda não a têm (novas ou
+    reanalisadas) e grava-a. As faixas que não podem ser mapeadas ficam sem chave e,
+    por isso, fora da ordenação. Devolve o número de faixas atualizadas.
+    """
+    with Biblioteca(caminho) as biblioteca:
+        df = biblioteca.consultar(colunas=['filename', 'key_estimada'], sem_camelot=True)
+        if df.empty:
+            return 0
+        df['camelot_key'] = df['key_estimada'].astype(object).apply(encontrar_camelot_key)
+        df = df.dropna(subset=['camelot_key'])
+        biblioteca.upsert(df[['filename', 'camelot_key']])
+        return len(df)
+
+def main():
+    parser = argparse.ArgumentParser(description="Adiciona a chave Camelot ao dataset analisado.")
+    parser.add_argument('--biblioteca', nargs='?', const=BIBLIOTECA_PATH, default=None,
+                        help=f"lê e atualiza a biblioteca SQLite em vez dos CSV (padrão: {BIBLIOTECA_PATH})")
+    instrumentacao.adicionar_argumentos(parser)
+    args = parser.parse_args()
+    instrumentacao.configurar(args, etapa='engenharia')
+
+    if args.biblioteca is not None:
+        print(f"A atualizar a chave Camelot na biblioteca: {args.biblioteca}")
+        with instrumentacao.etapa('engenharia'):
+            atualizadas = atualizar_biblioteca(args.biblioteca)
+        print(f"{atualizadas} faixas novas ou alteradas receberam a chave Camelot.")
+        return
+
+    # Carregar o dataset analisado
+    print(f"A carregar o dataset de: {INPUT_PATH}")
+    try:
+        df = pd.read_csv(INPUT_PATH)
+        print(f"Sucesso. {len(df)} faixas carregadas para a etapa final de engenharia.")
+    except FileNotFoundError:
+        print(f"ERRO CRÍTICO: O ficheiro '{INPUT_PATH}' não foi encontrado.")
+        print("Por favor, execute o script 'processar_musicas.py' primeiro.")
+        sys.exit()
 
-# Aplica a função para criar a nova coluna
-df['camelot_key'] = df['key_estimada'].apply(encontrar_camelot_key)
+    print("\nIniciando a criação do atributo 'camelot_key'...")
+    with instrumentacao.etapa('engenharia'):
+        df = adicionar_camelot_key(df)
+    print("Atributo 'camelot_key' criado com sucesso!")
 
-# Verifica se alguma música ficou sem a chave Camelot e a remove
-# (Isso só aconteceria se o nosso algoritmo retornasse uma tonalidade não padrão)
-linhas_sem_camelot = df['camelot_key'].isnull().sum()
-if linhas_sem_camelot > 0:
-    print(f"AVISO: {linhas_sem_camelot} faixas não puderam ser mapeadas para uma chave Camelot e foram removidas.")
-    df.dropna(subset=['camelot_key'], inplace=True)
+    # --- 4. RESULTADO FINAL ---
+    print("\n--- Tabela Final, Pronta para o Algoritmo de Ordenação ---")
+    # Mostra as colunas mais importantes
+    print(df[['artista', 'nome_da_musica', 'bpm', 'key_estimada', 'camelot_key']].head(10))
 
-print("Atributo 'camelot_key' criado com sucesso!")
+    # Salva o dataset final, pronto para ser ordenado
+    df.to_csv(OUTPUT_PATH, index=False, encoding='utf-8')
+    print(f"\nDataset final com {len(df)} faixas pronto para ordenação, salvo em: {OUTPUT_PATH}")
 
-# --- 4. RESULTADO FINAL ---
-print("\n--- Tabela Final, Pronta para o Algoritmo de Ordenação ---")
-# Mostra as colunas mais importantes
-print(df[['artista', 'nome_da_musica', 'bpm', 'key_estimada', 'camelot_key']].head(10))
+    print("\nTODOS OS DADOS ESTÃO PRONTOS! BEM-VINDO AO MÓDULO FINAL: A LÓGICA DO DJ!")
 
-# Salva o dataset final, pronto para ser ordenado
-df.to_csv(OUTPUT_PATH, index=False, encoding='utf-8')
-print(f"\nDataset final com {len(df)} faixas pronto para ordenação, salvo em: {OUTPUT_PATH}")
 
-print("\nTODOS OS DADOS ESTÃO PRONTOS! BEM-VINDO AO MÓDULO FINAL: A LÓGICA DO DJ!")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
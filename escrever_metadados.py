@@ -1,7 +1,11 @@
 import pandas as pd
 import os
 import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from mutagen.flac import FLAC
+from criar_pasta_ord import nome_numerado, carregar_alteracoes, ALTERACOES_PATH
+import instrumentacao
 
 # --- 1. CONFIGURAÇÃO ---
 # O ficheiro CSV que contém a nossa playlist final e os dados
@@ -10,60 +14,142 @@ ORDERED_CSV_PATH = 'dj_set_final_ordenado.csv'
 # A pasta com os ficheiros numerados que vamos modificar
 SET_FOLDER_PATH = 'DJ_Set_Final_Ordenado/'
 
-# --- 2. CARREGAR OS DADOS FINAIS ---
-print(f"A carregar o set ordenado de: {ORDERED_CSV_PATH}")
-try:
-    df_set = pd.read_csv(ORDERED_CSV_PATH)
-except FileNotFoundError:
-    print(f"ERRO: O ficheiro ordenado '{ORDERED_CSV_PATH}' não foi encontrado.")
-    print("Por favor, execute o script 'ordenar_set.py' e 'criar_pasta_set.py' primeiro.")
-    sys.exit()
-
-# --- 3. ESCREVER OS METADADOS NOS FICHEIROS DE ÁUDIO ---
-print("\nIniciando o processo de escrita de metadados nos ficheiros de áudio...")
-
-total_musicas = len(df_set)
-num_digits = len(str(total_musicas))
-
-for index, row in df_set.iterrows():
-    ordem = index + 1
-    
-    # Recria o nome do ficheiro numerado, como fizemos no script anterior
-    nome_ficheiro_original = row['filename']
-    nome_ficheiro_numerado = f"{str(ordem).zfill(num_digits)} - {nome_ficheiro_original}"
-    
-    caminho_completo = os.path.join(SET_FOLDER_PATH, nome_ficheiro_numerado)
-    
-    # Extrai os dados que vamos escrever
-    bpm = str(round(row['bpm'])) # Converte para string
-    camelot_key = row['camelot_key']
-    
-    # Verifica se o ficheiro existe antes de tentar modificá-lo
-    if os.path.exists(caminho_completo):
-        try:
-            # Abre o ficheiro FLAC com o mutagen
-            audio = FLAC(caminho_completo)
-            
-            # Apaga tags antigas para evitar duplicados
-            if 'BPM' in audio:
-                del audio['BPM']
-            if 'INITIALKEY' in audio:
-                del audio['INITIALKEY']
-            
-            # Escreve as novas tags (metadados)
-            audio['BPM'] = bpm
-            audio['INITIALKEY'] = camelot_key
-            audio['COMMENT'] = f"Analisado e ordenado pelo projeto TechnoSetHarmonizado. Posição no set: {ordem}"
-            
-            # Salva as alterações no ficheiro
-            audio.save()
-            
-            print(f"[{ordem}/{total_musicas}] Metadados escritos com sucesso para: {nome_ficheiro_numerado} (BPM: {bpm}, Key: {camelot_key})")
-
-        except Exception as e:
-            print(f"ERRO ao processar o ficheiro {nome_ficheiro_numerado}: {e}")
-    else:
-        print(f"AVISO: Ficheiro não encontrado, ignorado: {nome_ficheiro_numerado}")
-
-print("\n--- PROCESSO DE METADADOS CONCLUÍDO! ---")
-print("As suas faixas de áudio na pasta 'DJ_Set_Final_Ordenado' agora contêm os dados de BPM e Tom.")
\ No newline at end of file
+# Número de ficheiros processados em simultâneo
+NUM_THREADS_TAGS = 8
+
+# Espaço livre (padding) reservado no bloco de metadados do FLAC. Quando as novas tags cabem
+# no padding existente, o mutagen atualiza o ficheiro no sítio; quando não cabem, o ficheiro é
+# reescrito uma vez com este padding, para que as atualizações seguintes já caibam.
+PADDING_MINIMO = 16 * 1024
+
+# --- 2. FUNÇÕES DE ESCRITA DAS TAGS ---
+
+def tags_esperadas(row, ordem):
+    """Tags que o ficheiro na posição `ordem` do set deve ter."""
+    return {
+        'BPM': str(round(row['bpm'])), # Converte para string
+        'INITIALKEY': row['camelot_key'],
+        'COMMENT': f"Analisado e ordenado pelo projeto TechnoSetHarmonizado. Posição no set: {ordem}",
+    }
+
+def _padding(info):
+    # Mantém o padding que sobra se as tags couberem (escrita no sítio); caso contrário reserva PADDING_MINIMO
+    if info.padding >= 0:
+        return info.padding
+    return PADDING_MINIMO
+
+def escrever_tags_ficheiro(caminho_completo, tags, forcar=False):
+    """
+    Escreve as tags num ficheiro FLAC, se ainda não estiverem corretas.
+    Devolve 'escrito', 'inalterado' ou uma mensagem de erro.
+    """
+    try:
+        # Abre o ficheiro FLAC com o mutagen
+        audio = FLAC(caminho_completo)
+
+        if not forcar and all(audio.get(nome) == [valor] for nome, valor in tags.items()):
+            return 'inalterado'
+
+        # Apaga tags antigas para evitar duplicados
+        for nome in tags:
+            if nome in audio:
+                del audio[nome]
+
+        # Escreve as novas tags (metadados)
+        for nome, valor in tags.items():
+            audio[nome] = valor
+
+        # Salva as alterações no ficheiro
+        audio.save(padding=_padding)
+        return 'escrito'
+
+    except Exception as e:
+        return f"ERRO: {e}"
+
+def escrever_metadados_set(df_set, pasta_set=SET_FOLDER_PATH, num_threads=NUM_THREADS_TAGS, forcar=False,
+                           posicoes=None):
+    """
+    Escreve BPM, chave Camelot e posição no set em cada ficheiro numerado da pasta do set,
+    em paralelo. Ficheiros que já têm as tags corretas não são reescritos.
+    Com `posicoes` (ver criar_pasta_ord.carregar_alteracoes), só essas posições são tratadas.
+    Devolve um dicionário com o número de ficheiros escritos, inalterados, em falta e com erro.
+    """
+    total_musicas = len(df_set)
+    num_digits = len(str(total_musicas))
+
+    alteradas = None if posicoes is None else set(posicoes)
+    tarefas = []
+    for ordem, (_, row) in enumerate(df_set.iterrows(), start=1):
+        if alteradas is not None and ordem not in alteradas:
+            continue
+        # Recria o nome do ficheiro numerado, como no script criar_pasta_ord.py
+        nome_ficheiro_numerado = nome_numerado(ordem, row['filename'], num_digits)
+        caminho_completo = os.path.join(pasta_set, nome_ficheiro_numerado)
+        tarefas.append((ordem, nome_ficheiro_numerado, caminho_completo, tags_esperadas(row, ordem)))
+
+    def processar(tarefa):
+        ordem, nome_ficheiro_numerado, caminho_completo, tags = tarefa
+        # Verifica se o ficheiro existe antes de tentar modificá-lo
+        if not os.path.exists(caminho_completo):
+            print(f"AVISO: Ficheiro não encontrado, ignorado: {nome_ficheiro_numerado}")
+            return 'em_falta'
+        with instrumentacao.faixa(nome_ficheiro_numerado):
+            estado = escrever_tags_ficheiro(caminho_completo, tags, forcar=forcar)
+        if estado == 'escrito':
+            print(f"[{ordem}/{total_musicas}] Metadados escritos com sucesso para: {nome_ficheiro_numerado} "
+                  f"(BPM: {tags['BPM']}, Key: {tags['INITIALKEY']})")
+        elif estado != 'inalterado':
+            print(f"{estado} ({nome_ficheiro_numerado})")
+            return 'erros'
+        return estado
+
+    resumo = {'escrito': 0, 'inalterado': 0, 'em_falta': 0, 'erros': 0}
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        for estado in executor.map(processar, tarefas):
+            resumo[estado] += 1
+    return resumo
+
+# --- 3. EXECUÇÃO ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Escreve BPM, chave Camelot e posição nas tags dos ficheiros do set.")
+    parser.add_argument('--threads', type=int, default=NUM_THREADS_TAGS,
+                        help=f"número de ficheiros processados em simultâneo (padrão: {NUM_THREADS_TAGS})")
+    parser.add_argument('--forcar', action='store_true',
+                        help="reescreve as tags mesmo quando já estão corretas")
+    parser.add_argument('--alteracoes', nargs='?', const=ALTERACOES_PATH, default=None,
+                        help="só trata as posições alteradas pela última inserção incremental "
+                             f"(ordenar_set.py --inserir), registadas neste ficheiro (padrão: {ALTERACOES_PATH})")
+    instrumentacao.adicionar_argumentos(parser)
+    args = parser.parse_args()
+    instrumentacao.configurar(args, etapa='metadados')
+
+    # Carregar os dados finais
+    print(f"A carregar o set ordenado de: {ORDERED_CSV_PATH}")
+    try:
+        df_set = pd.read_csv(ORDERED_CSV_PATH)
+    except FileNotFoundError:
+        print(f"ERRO: O ficheiro ordenado '{ORDERED_CSV_PATH}' não foi encontrado.")
+        print("Por favor, execute o script 'ordenar_set.py' e 'criar_pasta_set.py' primeiro.")
+        sys.exit()
+
+    posicoes = None
+    if args.alteracoes is not None:
+        posicoes = carregar_alteracoes(list(df_set['filename']), args.alteracoes)
+        if posicoes is None:
+            print(f"AVISO: '{args.alteracoes}' não corresponde ao set atual. Todas as posições serão verificadas.")
+        else:
+            print(f"Só as {len(posicoes)} posições alteradas pela última inserção serão tratadas.")
+
+    print("\nIniciando o processo de escrita de metadados nos ficheiros de áudio...")
+    with instrumentacao.etapa('metadados'):
+        resumo = escrever_metadados_set(df_set, num_threads=args.threads, forcar=args.forcar, posicoes=posicoes)
+
+    print("\n--- PROCESSO DE METADADOS CONCLUÍDO! ---")
+    print(f"{resumo['escrito']} ficheiros atualizados, {resumo['inalterado']} já estavam corretos, "
+          f"{resumo['em_falta']} em falta, {resumo['erros']} com erro.")
+    print("As suas faixas de áudio na pasta 'DJ_Set_Final_Ordenado' agora contêm os dados de BPM e Tom.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+import os
+import sys
+import argparse
+from pathlib import Path
+import xml.etree.ElementTree as ET
+import pandas as pd
+from escrever_metadados import tags_esperadas
+import instrumentacao
+
+# --- 1. CONFIGURAÇÃO ---
+# O ficheiro que contém a ordem do nosso set
+ORDERED_CSV_PATH = 'dj_set_final_ordenado.csv'
+
+# A pasta onde estão os ficheiros de áudio originais (a playlist aponta para eles, sem cópias)
+SOURCE_AUDIO_FOLDER = 'musicas_flac/'
+
+# Nome dos ficheiros exportados, sem extensão (ficam <nome>.m3u8 e <nome>.xml)
+SAIDA_PADRAO = 'dj_set_final_ordenado'
+
+# Nome da playlist dentro do XML do rekordbox
+NOME_PLAYLIST = 'DJ Set Harmonizado'
+
+FORMATOS = ('m3u8', 'xml')
+
+# --- 2. FUNÇÕES DE EXPORTAÇÃO ---
+
+def faixas_do_set(df_ordered, pasta_origem=SOURCE_AUDIO_FOLDER, com_duracoes=False):
+    """
+    Lista, pela ordem do set, as faixas cujo ficheiro original existe: dicionários com a posição,
+    o caminho absoluto, o artista, o título, o BPM, a chave Camelot, o comentário com a posição
+    (o mesmo das tags do escrever_metadados.py) e (com `com_duracoes`, lida só do cabeçalho
+    de cada ficheiro) a duração em segundos. Devolve (faixas, em falta).
+    """
+    if com_duracoes:
+        import soundfile as sf
+    faixas = []
+    em_falta = 0
+    for ordem, row in enumerate(df_ordered.itertuples(index=False), start=1):
+        caminho = os.path.abspath(os.path.join(pasta_origem, row.filename))
+        if not os.path.exists(caminho):
+            print(f"AVISO: Ficheiro de origem não encontrado e ignorado: {row.filename}")
+            em_falta += 1
+            continue
+        duracao = None
+        if com_duracoes:
+            try:
+                duracao = sf.info(caminho).duration
+            except RuntimeError:
+                pass
+        faixas.append({'ordem': ordem, 'caminho': caminho, 'artista': str(row.artista),
+                       'titulo': str(row.nome_da_musica), 'bpm': float(row.bpm),
+                       'camelot_key': str(row.camelot_key), 'duracao': duracao,
+                       'comentario': tags_esperadas(row._asdict(), ordem)['COMMENT']})
+    return faixas, em_falta
+
+def escrever_m3u8(faixas, caminho_saida, caminhos_relativos=False, nome_playlist=NOME_PLAYLIST):
+    """
+    Escreve a playlist em M3U estendido (UTF-8). Cada faixa tem uma linha de comentário com a
+    posição, o BPM e a chave Camelot, a linha #EXTINF (duração, ou -1 se desconhecida) e o caminho
+    do ficheiro original, absoluto ou relativo à pasta da playlist.
+    """
+    pasta_saida = os.path.dirname(os.path.abspath(caminho_saida))
+    linhas = ['#EXTM3U', f'#PLAYLIST:{nome_playlist}']
+    for faixa in faixas:
+        duracao = round(faixa['duracao']) if faixa['duracao'] is not None else -1
+        caminho = os.path.relpath(faixa['caminho'], pasta_saida) if caminhos_relativos else faixa['caminho']
+        linhas.append(f"# {faixa['ordem']:03d} | {faixa['bpm']:.2f} BPM | {faixa['camelot_key']}")
+        linhas.append(f"#EXTINF:{duracao},{faixa['artista']} - {faixa['titulo']}")
+        linhas.append(caminho)
+    with open(f"{caminho_saida}.tmp", 'w', encoding='utf-8', newline='\n') as f:
+        f.write('\n'.join(linhas) + '\n')
+    os.replace(f"{caminho_saida}.tmp", caminho_saida)
+
+def localizacao_rekordbox(caminho):
+    """URI do ficheiro no formato do rekordbox (ex: 'file://localhost/C:/Musica/Faixa%201.flac')."""
+    return 'file://localhost/' + Path(caminho).as_uri()[len('file:///'):]
+
+def escrever_rekordbox_xml(faixas, caminho_saida, nome_playlist=NOME_PLAYLIST):
+    """
+    Escreve uma coleção rekordbox (DJ_PLAYLISTS) com uma faixa por ficheiro original e uma
+    playlist com as faixas pela ordem do set. BPM (AverageBpm), chave Camelot (Tonality) e
+    posição (Comments, como nas tags) ficam nos atributos de cada faixa.
+    """
+    raiz = ET.Element('DJ_PLAYLISTS', Version='1.0.0')
+    ET.SubElement(raiz, 'PRODUCT', Name='TechnoSetHarmonizado', Version='1.0', Company='')
+    colecao = ET.SubElement(raiz, 'COLLECTION', Entries=str(len(faixas)))
+    for faixa in faixas:
+        atributos = {
+            'TrackID': str(faixa['ordem']),
+            'Name': faixa['titulo'],
+            'Artist': faixa['artista'],
+            'Kind': f"{os.path.splitext(faixa['caminho'])[1].lstrip('.').upper()} File",
+            'AverageBpm': f"{faixa['bpm']:.2f}",
+            'Tonality': faixa['camelot_key'],
+            'Comments': faixa['comentario'],
+            'Location': localizacao_rekordbox(faixa['caminho']),
+        }
+        if faixa['duracao'] is not None:
+            atributos['TotalTime'] = str(round(faixa['duracao']))
+        ET.SubElement(colecao, 'TRACK', atributos)
+
+    playlists = ET.SubElement(raiz, 'PLAYLISTS')
+    pasta_raiz = ET.SubElement(playlists, 'NODE', Type='0', Name='ROOT', Count='1')
+    playlist = ET.SubElement(pasta_raiz, 'NODE', Name=nome_playlist, Type='1', KeyType='0', Entries=str(len(faixas)))
+    for faixa in faixas:
+        ET.SubElement(playlist, 'TRACK', Key=str(faixa['ordem']))
+
+    ET.indent(raiz)
+    ET.ElementTree(raiz).write(f"{caminho_saida}.tmp", encoding='UTF-8', xml_declaration=True)
+    os.replace(f"{caminho_saida}.tmp", caminho_saida)
+
+def exportar_playlist(df_ordered, saida=SAIDA_PADRAO, formatos=FORMATOS, pasta_origem=SOURCE_AUDIO_FOLDER,
+                      nome_playlist=NOME_PLAYLIST, caminhos_relativos=False, com_duracoes=False):
+    """
+    Exporta o set ordenado para os formatos pedidos, a apontar para os ficheiros originais.
+    Devolve um dicionário com o número de faixas exportadas, as em falta e os ficheiros escritos.
+    """
+    faixas, em_falta = faixas_do_set(df_ordered, pasta_origem, com_duracoes=com_duracoes)
+    ficheiros = []
+    if 'm3u8' in formatos:
+        escrever_m3u8(faixas, f"{saida}.m3u8", caminhos_relativos=caminhos_relativos, nome_playlist=nome_playlist)
+        ficheiros.append(f"{saida}.m3u8")
+    if 'xml' in formatos:
+        escrever_rekordbox_xml(faixas, f"{saida}.xml", nome_playlist=nome_playlist)
+        ficheiros.append(f"{saida}.xml")
+    return {'exportadas': len(faixas), 'em_falta': em_falta, 'ficheiros': ficheiros}
+
+# --- 3. EXECUÇÃO ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta o DJ set ordenado para M3U8 e para XML do rekordbox, "
+                                                 "a apontar para os ficheiros originais (sem cópias).")
+    parser.add_argument('--entrada', default=ORDERED_CSV_PATH,
+                        help=f"CSV com o set ordenado (padrão: {ORDERED_CSV_PATH})")
+    parser.add_argument('--saida', default=SAIDA_PADRAO,
+                        help=f"nome dos ficheiros exportados, sem extensão (padrão: {SAIDA_PADRAO})")
+    parser.add_argument('--formato', choices=FORMATOS, action='append',
+                        help="formato a exportar (pode repetir-se; padrão: m3u8 e xml)")
+    parser.add_argument('--nome', default=NOME_PLAYLIST, help=f"nome da playlist (padrão: {NOME_PLAYLIST})")
+    parser.add_argument('--pasta-audio', default=SOURCE_AUDIO_FOLDER,
+                        help=f"pasta dos ficheiros originais (padrão: {SOURCE_AUDIO_FOLDER})")
+    parser.add_argument('--caminhos-relativos', action='store_true',
+                        help="no M3U8, escreve os caminhos relativos à pasta da playlist em vez de absolutos")
+    parser.add_argument('--duracoes', action='store_true',
+                        help="lê a duração de cada faixa (só o cabeçalho do ficheiro) para o #EXTINF e o TotalTime")
+    instrumentacao.adicionar_argumentos(parser)
+    args = parser.parse_args()
+    instrumentacao.configurar(args, etapa='playlist')
+
+    print(f"A carregar a ordem do set do ficheiro: {args.entrada}")
+    try:
+        df_ordered = pd.read_csv(args.entrada)
+    except FileNotFoundError:
+        print(f"ERRO: O ficheiro ordenado '{args.entrada}' não foi encontrado.")
+        print("Por favor, execute o script 'ordenar_set.py' primeiro.")
+        sys.exit()
+
+    with instrumentacao.etapa('playlist'):
+        resumo = exportar_playlist(df_ordered, saida=args.saida, formatos=args.formato or FORMATOS,
+                                   pasta_origem=args.pasta_audio, nome_playlist=args.nome,
+                                   caminhos_relativos=args.caminhos_relativos, com_duracoes=args.duracoes)
+
+    print("\n--- EXPORTAÇÃO CONCLUÍDA! ---")
+    print(f"{resumo['exportadas']} faixas exportadas, {resumo['em_falta']} em falta.")
+    for ficheiro in resumo['ficheiros']:
+        print(f"Playlist gravada em: {ficheiro}")
+    print("No rekordbox, importe o XML em Preferências > Avançado > rekordbox xml, ou abra o M3U8 como playlist.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import time
+import atexit
+import cProfile
+import resource
+import threading
+import contextlib
+
+# --- 1. CONFIGURAÇÃO ---
+# Variáveis de ambiente que ativam a instrumentação. Ficam definidas por `ativar`, para que
+# os processos de análise (que as herdam) também meçam o seu trabalho.
+VARIAVEL_RELATORIO = 'TECHNOSET_RELATORIO'
+VARIAVEL_CPROFILE = 'TECHNOSET_CPROFILE'
+
+# Número de funções mostradas no resumo do cProfile
+LINHAS_CPROFILE = 25
+
+# --- 2. ESTADO ---
+# Sem instrumentação ativa, todas as funções de medição devolvem este contexto vazio
+_NULO = contextlib.nullcontext()
+
+_ativa = False
+_caminho_relatorio = None
+_etapa_cprofile = None
+_etapas = []
+_faixas = {}
+_etapa_atual = None
+_lock = threading.Lock()
+# A faixa a ser medida em cada thread (as cópias e a escrita de tags correm em threads)
+_local = threading.local()
+
+def ativa():
+    return _ativa
+
+def ativar(caminho_relatorio, etapa_cprofile=None):
+    """
+    Liga a instrumentação: mede cada etapa e cada faixa e grava o relatório JSON em
+    `caminho_relatorio` quando o programa termina. Com `etapa_cprofile`, essa etapa
+    corre também sob o cProfile.
+    """
+    global _ativa, _caminho_relatorio, _etapa_cprofile
+    primeira_vez = not _ativa
+    _ativa = True
+    _caminho_relatorio = caminho_relatorio
+    _etapa_cprofile = etapa_cprofile
+    os.environ[VARIAVEL_RELATORIO] = caminho_relatorio
+    if etapa_cprofile:
+        os.environ[VARIAVEL_CPROFILE] = etapa_cprofile
+    if primeira_vez:
+        atexit.register(gravar_relatorio)
+
+def _ativar_pelo_ambiente():
+    global _ativa
+    caminho = os.environ.get(VARIAVEL_RELATORIO)
+    if not caminho:
+        return
+    import multiprocessing
+    if multiprocessing.parent_process() is None:
+        ativar(caminho, os.environ.get(VARIAVEL_CPROFILE))
+    else:
+        # Nos processos de análise basta medir: as faixas voltam ao processo principal com o resultado
+        _ativa = True
+
+def adicionar_argumentos(parser, etapas=None):
+    """Acrescenta --relatorio e --cprofile a um ArgumentParser."""
+    parser.add_argument('--relatorio', metavar='FICHEIRO_JSON',
+                        help="mede tempo, CPU e memória por etapa e por faixa e grava o relatório neste ficheiro")
+    if etapas:
+        parser.add_argument('--cprofile', choices=etapas, help="corre esta etapa sob o cProfile (requer --relatorio)")
+    else:
+        parser.add_argument('--cprofile', action='store_true', help="corre a etapa sob o cProfile (requer --relatorio)")
+
+def configurar(args, etapa=None):
+    """Ativa a instrumentação a partir dos argumentos de adicionar_argumentos."""
+    if args.relatorio:
+        etapa_cprofile = args.cprofile if isinstance(args.cprofile, str) else (etapa if args.cprofile else None)
+        ativar(args.relatorio, etapa_cprofile)
+
+# --- 3. MEDIÇÕES ---
+
+def _pico_rss_mb():
+    # ru_maxrss vem em KiB no Linux; o pico dos processos filhos só conta depois de terminarem
+    proprio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    filhos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(proprio, filhos) / 1024
+
+def _reiniciar_pico_rss():
+    # Escrever "5" em clear_refs repõe o pico de RSS do processo (VmHWM) no RSS atual (só Linux)
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _pico_rss_desde_reinicio_mb():
+    # VmHWM vem em kB em /proc/self/status
+    try:
+        with open('/proc/self/status') as f:
+            for linha in f:
+                if linha.startswith('VmHWM:'):
+                    return int(linha.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def _cpu_total():
+    proprio = resource.getrusage(resource.RUSAGE_SELF)
+    filhos = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return proprio.ru_utime + proprio.ru_stime + filhos.ru_utime + filhos.ru_stime
+
+@contextlib.contextmanager
+def _medir_etapa(nome):
+    global _etapa_atual
+    anterior = _etapa_atual
+    _etapa_atual = nome
+    perfil = cProfile.Profile() if nome == _etapa_cprofile else None
+    inicio, cpu_inicio = time.perf_counter(), _cpu_total()
+    if perfil is not None:
+        perfil.enable()
+    try:
+        yield
+    finally:
+        if perfil is not None:
+            perfil.disable()
+        registo = {
+            'etapa': nome,
+            'segundos': time.perf_counter() - inicio,
+            'cpu_segundos': _cpu_total() - cpu_inicio,
+            'pico_rss_mb': _pico_rss_mb(),
+        }
+        if perfil is not None:
+            registo['cprofile'] = _gravar_cprofile(perfil, nome)
+        with _lock:
+            _etapas.append(registo)
+        _etapa_atual = anterior
+
+def etapa(nome):
+    """Mede uma etapa inteira (tempo real, CPU incluindo processos filhos e pico de memória)."""
+    if not _ativa:
+        return _NULO
+    return _medir_etapa(nome)
+
+@contextlib.contextmanager
+def _medir_faixa(nome, registar):
+    registo = {'faixa': nome, 'medicoes': {}}
+    _local.faixa = registo
+    pico_reiniciado = _reiniciar_pico_rss()
+    inicio, cpu_inicio = time.perf_counter(), time.thread_time()
+    try:
+        yield registo
+    finally:
+        _local.faixa = None
+        registo['segundos'] = time.perf_counter() - inicio
+        registo['cpu_segundos'] = time.thread_time() - cpu_inicio
+        # Pico de RSS do processo desde o início da faixa (inclui a descodificação e a STFT, já
+        # libertadas aqui). O ru_maxrss não serve: é o pico de toda a vida do processo. Com threads,
+        # o pico é partilhado pelas faixas em curso no mesmo processo. Sem clear_refs fica None.
+        registo['pico_rss_mb'] = _pico_rss_desde_reinicio_mb() if pico_reiniciado else None
+        if registar:
+            registar_faixa(registo)
+
+def faixa(nome, registar=True):
+    """
+    Mede o trabalho feito sobre uma faixa e agrupa as medições internas (`medir`) feitas
+    durante ele. Devolve o registo (ou None, sem instrumentação). Nos processos de análise
+    usa-se registar=False e o registo é devolvido ao processo principal, que o regista.
+    """
+    if not _ativa:
+        return contextlib.nullcontext(None)
+    return _medir_faixa(nome, registar)
+
+def registar_faixa(registo, etapa_faixa=None):
+    if registo is None:
+        return
+    with _lock:
+        _faixas.setdefault(etapa_faixa or _etapa_atual or 'sem_etapa', []).append(registo)
+
+@contextlib.contextmanager
+def _medir_passo(nome):
+    registo = getattr(_local, 'faixa', None)
+    inicio, cpu_inicio = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        if registo is not None:
+            acumulado = registo['medicoes'].setdefault(nome, {'segundos': 0.0, 'cpu_segundos': 0.0})
+            acumulado['segundos'] += time.perf_counter() - inicio
+            acumulado['cpu_segundos'] += time.thread_time() - cpu_inicio
+
+def medir(nome):
+    """Mede um passo dentro da faixa atual (ex: 'load', 'beat_track'); passos repetidos são somados."""
+    if not _ativa:
+        return _NULO
+    return _medir_passo(nome)
+
+def medir_iteracao(nome, iteravel):
+    """Devolve o iterável, somando em `nome` o tempo gasto a obter cada elemento (ex: blocos lidos do disco)."""
+    if not _ativa:
+        return iteravel
+    return _iterar_medindo(nome, iteravel)
+
+def _iterar_medindo(nome, iteravel):
+    iterador = iter(iteravel)
+    while True:
+        with _medir_passo(nome):
+            try:
+                elemento = next(iterador)
+            except StopIteration:
+                return
+        yield elemento
+
+# --- 4. RELATÓRIO ---
+
+def _gravar_cprofile(perfil, nome):
+    import io
+    import pstats
+    base = os.path.splitext(_caminho_relatorio)[0]
+    caminho = f"{base}.{nome}.prof"
+    perfil.dump_stats(caminho)
+    texto = io.StringIO()
+    pstats.Stats(perfil, stream=texto).sort_stats('cumulative').print_stats(LINHAS_CPROFILE)
+    print(f"[instrumentação] cProfile da etapa '{nome}' gravado em: {caminho}")
+    return {'ficheiro': caminho, 'resumo': texto.getvalue()}
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+def _resumo_faixas(registos):
+    """Totais e percentis das faixas de uma etapa, e o total de cada passo medido."""
+    segundos = [r['segundos'] for r in registos]
+    passos = {}
+    for registo in registos:
+        for nome, medicao in registo['medicoes'].items():
+            total = passos.setdefault(nome, {'segundos': 0.0, 'cpu_segundos': 0.0})
+            total['segundos'] += medicao['segundos']
+            total['cpu_segundos'] += medicao['cpu_segundos']
+    return {
+        'faixas': len(registos),
+        'segundos_total': sum(segundos),
+        'latencia_p50': _percentil(segundos, 50),
+        'latencia_p90': _percentil(segundos, 90),
+        'latencia_max': max(segundos),
+        'pico_rss_mb': max((r['pico_rss_mb'] for r in registos if r['pico_rss_mb'] is not None), default=None),
+        'passos': passos,
+        'mais_lentas': [r['faixa'] for r in sorted(registos, key=lambda r: -r['segundos'])[:5]],
+    }
+
+def gerar_relatorio():
+    with _lock:
+        return {
+            'comando': ' '.join(sys.argv),
+            'data': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'etapas': list(_etapas),
+            'resumo_faixas': {etapa_faixas: _resumo_faixas(registos) for etapa_faixas, registos in _faixas.items()},
+            'faixas': {etapa_faixas: list(registos) for etapa_faixas, registos in _faixas.items()},
+        }
+
+def gravar_relatorio():
+    if not _ativa or not _caminho_relatorio:
+        return
+    with open(f"{_caminho_relatorio}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(gerar_relatorio(), f, ensure_ascii=False, indent=1)
+    os.replace(f"{_caminho_relatorio}.tmp", _caminho_relatorio)
+    print(f"[instrumentação] Relatório gravado em: {_caminho_relatorio}")
+
+_ativar_pelo_ambiente()
@@ -1,63 +1,185 @@
 import os
 import sys
+import json
+import argparse
 import spotipy
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from spotipy.oauth2 import SpotifyOAuth
 
-# --- 1. CONFIGURAÇÃO E VERIFICAÇÃO ---
-load_dotenv()
-print("Configurações carregadas...")
-client_id = os.getenv('SPOTIPY_CLIENT_ID')
-client_secret = os.getenv('SPOTIPY_CLIENT_SECRET')
-redirect_uri = os.getenv('SPOTIPY_REDIRECT_URI')
-playlist_id = os.getenv('PLAYLIST_ID')
-if not all([client_id, client_secret, redirect_uri, playlist_id]):
-    print("ERRO CRÍTICO: Verifique as variáveis de ambiente.")
-    sys.exit()
+# --- 1. CONFIGURAÇÃO ---
+OUTPUT_PATH = 'playlist_tracklist.csv'
+
+# Estado da última sincronização (snapshot_id de cada playlist), para saltar playlists sem alterações
+ESTADO_SYNC_PATH = '.spotify_sync.json'
+
+# Endereço da API (pode apontar para uma API de testes local)
+SPOTIFY_API_URL = 'https://api.spotify.com/v1/'
+
+# Máximo de faixas por página aceite pela API e número de páginas pedidas em simultâneo
+FAIXAS_POR_PAGINA = 100
+NUM_THREADS_PAGINAS = 8
+
+# Só os campos de que o tracklist precisa, em vez dos objetos completos das faixas
+CAMPOS_PLAYLIST = 'snapshot_id,tracks.total'
+CAMPOS_FAIXAS = 'items(track(id,name,is_local,artists(name)))'
+
+COLUNAS_TRACKLIST = ['track_id', 'artista', 'nome_da_musica']
 
 # --- 2. AUTENTICAÇÃO ---
-# Usaremos um scope vazio, pois a playlist é pública.
-scope = "" 
-print("A conectar ao Spotify com acesso a dados públicos...")
-try:
-    auth_manager = SpotifyOAuth(client_id=client_id, client_secret=client_secret, redirect_uri=redirect_uri, scope=scope)
-    sp = spotipy.Spotify(auth_manager=auth_manager)
-    print("Conexão com o Spotify bem-sucedida!")
-except Exception as e:
-    print(f"Erro na autenticação: {e}")
-    sys.exit()
-
-# --- 3. EXTRAÇÃO DAS MÚSICAS DA PLAYLIST E SALVAMENTO ---
-print(f"A buscar músicas da Playlist ID: {playlist_id}")
-try:
-    results = sp.playlist_tracks(playlist_id)
-    tracks = results['items']
-    while results['next']:
-        results = sp.next(results)
-        tracks.extend(results['items'])
-    
-    tracks_data = []
-    for item in tracks:
+
+def conectar_spotify(client_id, client_secret, redirect_uri, api_url=SPOTIFY_API_URL, token=None):
+    """
+    Cria o cliente do Spotify. Com `token`, usa esse token de acesso diretamente
+    (útil contra uma API de testes); caso contrário, autentica por OAuth.
+    """
+    if token:
+        sp = spotipy.Spotify(auth=token)
+    else:
+        # Usaremos um scope vazio, pois a playlist é pública.
+        auth_manager = SpotifyOAuth(client_id=client_id, client_secret=client_secret,
+                                    redirect_uri=redirect_uri, scope="")
+        sp = spotipy.Spotify(auth_manager=auth_manager)
+    sp.prefix = api_url if api_url.endswith('/') else f'{api_url}/'
+    return sp
+
+# --- 3. EXTRAÇÃO DAS MÚSICAS DA PLAYLIST ---
+
+def linhas_da_pagina(pagina):
+    linhas = []
+    for item in pagina['items']:
         track = item.get('track')
         if track and not track.get('is_local'):
-            tracks_data.append({
+            linhas.append({
                 'track_id': track['id'],
                 'artista': ", ".join([artist['name'] for artist in track['artists']]),
                 'nome_da_musica': track['name']
             })
-    
-    df_playlist = pd.DataFrame(tracks_data)
-    print(f"Total de {len(df_playlist)} músicas válidas carregadas da playlist.")
+    return linhas
+
+def buscar_faixas(sp, playlist_id, total, num_threads=NUM_THREADS_PAGINAS):
+    """
+    Busca todas as faixas da playlist, pedindo as páginas em simultâneo (o total é conhecido,
+    por isso os offsets também). Devolve a lista das faixas válidas, pela ordem da playlist.
+    """
+    def buscar_pagina(offset):
+        return sp.playlist_items(playlist_id, fields=CAMPOS_FAIXAS, limit=FAIXAS_POR_PAGINA,
+                                 offset=offset, additional_types=('track',))
+
+    offsets = range(0, total, FAIXAS_POR_PAGINA)
+    with ThreadPoolExecutor(max_workers=max(1, min(num_threads, len(offsets)))) as executor:
+        paginas = list(executor.map(buscar_pagina, offsets))
+    return [linha for pagina in paginas for linha in linhas_da_pagina(pagina)]
+
+# --- 4. SINCRONIZAÇÃO INCREMENTAL ---
+
+def carregar_estado(caminho=ESTADO_SYNC_PATH):
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def guardar_estado(estado, caminho=ESTADO_SYNC_PATH):
+    with open(f'{caminho}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(estado, f, indent=1)
+    os.replace(f'{caminho}.tmp', caminho)
 
-    # Salvando nosso progresso em um ficheiro CSV
-    output_path = 'playlist_tracklist.csv'
+def juntar_tracklist(df_atual, faixas):
+    """
+    Junta ao tracklist existente só as faixas adicionadas e retira as removidas; as linhas
+    das faixas que se mantêm ficam como estavam (incluindo colunas acrescentadas depois).
+    O resultado segue a ordem atual da playlist. Devolve (df, adicionadas, removidas).
+    """
+    df_novo = pd.DataFrame(faixas, columns=COLUNAS_TRACKLIST)
+    ids_novos = set(df_novo['track_id'])
+    ids_atuais = set(df_atual['track_id']) if df_atual is not None else set()
+    adicionadas = ids_novos - ids_atuais
+    removidas = ids_atuais - ids_novos
+    if df_atual is None:
+        return df_novo, len(adicionadas), 0
+
+    # Linhas existentes por faixa (a mesma faixa pode aparecer mais do que uma vez na playlist)
+    existentes = df_atual.drop_duplicates('track_id').set_index('track_id', drop=False)
+    linhas = [existentes.loc[track_id].to_dict() if track_id in existentes.index else faixa
+              for track_id, faixa in zip(df_novo['track_id'], faixas)]
+    colunas = list(df_atual.columns) + [c for c in COLUNAS_TRACKLIST if c not in df_atual.columns]
+    return pd.DataFrame(linhas, columns=colunas), len(adicionadas), len(removidas)
+
+def sincronizar_playlist(sp, playlist_id, output_path=OUTPUT_PATH, estado_path=ESTADO_SYNC_PATH,
+                         completo=False, num_threads=NUM_THREADS_PAGINAS):
+    """
+    Atualiza o tracklist da playlist. Se o snapshot_id não mudou desde a última sincronização
+    (e o CSV ainda existe), não busca nada. Devolve (df ou None se saltado, resumo).
+    """
+    info = sp.playlist(playlist_id, fields=CAMPOS_PLAYLIST, additional_types=('track',))
+    snapshot_id, total = info['snapshot_id'], info['tracks']['total']
+
+    estado = carregar_estado(estado_path)
+    df_atual = None
+    if not completo and os.path.exists(output_path):
+        if estado.get(playlist_id, {}).get('snapshot_id') == snapshot_id:
+            return None, {'total': total, 'adicionadas': 0, 'removidas': 0}
+        df_atual = pd.read_csv(output_path)
+
+    faixas = buscar_faixas(sp, playlist_id, total, num_threads=num_threads)
+    df_playlist, adicionadas, removidas = juntar_tracklist(df_atual, faixas)
     df_playlist.to_csv(output_path, index=False, encoding='utf-8')
-    print(f"\nTracklist salvo com sucesso em: {output_path}")
 
-except Exception as e:
-    print(f"Erro ao buscar as músicas ou salvar o ficheiro: {e}")
-    sys.exit()
+    estado[playlist_id] = {'snapshot_id': snapshot_id}
+    guardar_estado(estado, estado_path)
+    return df_playlist, {'total': len(df_playlist), 'adicionadas': adicionadas, 'removidas': removidas}
+
+# --- 5. EXECUÇÃO ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta o tracklist de uma playlist do Spotify para CSV.")
+    parser.add_argument('--completo', action='store_true',
+                        help="reconstrói o tracklist do zero, mesmo que a playlist não tenha mudado")
+    parser.add_argument('--api-url', default=os.getenv('SPOTIFY_API_URL', SPOTIFY_API_URL),
+                        help="endereço da API do Spotify (ex: uma API de testes local)")
+    parser.add_argument('--threads', type=int, default=NUM_THREADS_PAGINAS,
+                        help=f"páginas pedidas em simultâneo (padrão: {NUM_THREADS_PAGINAS})")
+    args = parser.parse_args()
+
+    load_dotenv()
+    print("Configurações carregadas...")
+    client_id = os.getenv('SPOTIPY_CLIENT_ID')
+    client_secret = os.getenv('SPOTIPY_CLIENT_SECRET')
+    redirect_uri = os.getenv('SPOTIPY_REDIRECT_URI')
+    playlist_id = os.getenv('PLAYLIST_ID')
+    # Token de acesso fixo, em alternativa ao OAuth (ex: contra uma API de testes)
+    token = os.getenv('SPOTIFY_ACCESS_TOKEN')
+    if not playlist_id or not (token or all([client_id, client_secret, redirect_uri])):
+        print("ERRO CRÍTICO: Verifique as variáveis de ambiente.")
+        sys.exit()
+
+    print("A conectar ao Spotify com acesso a dados públicos...")
+    try:
+        sp = conectar_spotify(client_id, client_secret, redirect_uri, api_url=args.api_url, token=token)
+        print("Conexão com o Spotify bem-sucedida!")
+    except Exception as e:
+        print(f"Erro na autenticação: {e}")
+        sys.exit()
+
+    print(f"A buscar músicas da Playlist ID: {playlist_id}")
+    try:
+        df_playlist, resumo = sincronizar_playlist(sp, playlist_id, completo=args.completo, num_threads=args.threads)
+    except Exception as e:
+        print(f"Erro ao buscar as músicas ou salvar o ficheiro: {e}")
+        sys.exit()
+
+    if df_playlist is None:
+        print(f"A playlist não mudou desde a última sincronização. '{OUTPUT_PATH}' já está atualizado.")
+    else:
+        print(f"Total de {resumo['total']} músicas válidas carregadas da playlist "
+              f"({resumo['adicionadas']} adicionadas, {resumo['removidas']} removidas).")
+        print(f"\nTracklist salvo com sucesso em: {OUTPUT_PATH}")
+
+    print("\nProcesso concluído. A busca de atributos do Spotify foi ignorada devido à depreciação do endpoint.")
+    print("Próximo passo: Usar o ficheiro 'playlist_tracklist.csv' com a API do AcousticBrainz.")
+
 
-print("\nProcesso concluído. A busca de atributos do Spotify foi ignorada devido à depreciação do endpoint.")
-print("Próximo passo: Usar o ficheiro 'playlist_tracklist.csv' com a API do AcousticBrainz.")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
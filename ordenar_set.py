@@ -1,22 +1,19 @@
 import pandas as pd
 import sys
+import argparse
+from bisect import bisect_left, bisect_right
+from biblioteca import Biblioteca, BIBLIOTECA_PATH
+from series_temporais import SeriesTemporais, SERIES_PATH, criar_desempate
+import instrumentacao
 
 # --- 1. CONFIGURAÇÃO ---
 INPUT_PATH = 'playlist_pronta_para_ordenar.csv'
 OUTPUT_PATH = 'dj_set_final_ordenado.csv'
 
-# --- 2. CARREGAR O DATASET FINAL ---
-print(f"A carregar o dataset final de: {INPUT_PATH}")
-try:
-    df = pd.read_csv(INPUT_PATH)
-    # Converte o DataFrame para uma lista de dicionários para facilitar a manipulação
-    musicas_disponiveis = df.to_dict('records')
-    print(f"Sucesso. {len(musicas_disponiveis)} faixas prontas para serem ordenadas.")
-except FileNotFoundError:
-    print(f"ERRO CRÍTICO: O ficheiro '{INPUT_PATH}' não foi encontrado.")
-    sys.exit()
+# Aumento máximo de BPM permitido entre duas faixas seguidas (7.5%)
+AUMENTO_MAXIMO_BPM = 1.075
 
-# --- 3. FUNÇÕES AUXILIARES PARA A LÓGICA DO DJ ---
+# --- 2. FUNÇÕES AUXILIARES PARA A LÓGICA DO DJ ---
 
 def extrair_camelot(camelot_key):
     """Extrai o número e a letra de uma chave Camelot (ex: '8A' -> (8, 'A'))."""
@@ -46,69 +43,276 @@ def calcular_pontuacao_harmonica(key_atual, key_candidata):
     # Tratamento especial da diagonal 12 -> 1
     if letra_atual != letra_cand and sorted([num_atual, num_cand]) == [1, 12]:
         return 1
-        
+
     # Se não for compatível
     return 0
 
-# --- 4. O ALGORITMO DE ORDENAÇÃO PRINCIPAL ---
-print("\n--- Iniciando o algoritmo de ordenação do DJ Set ---")
-
-playlist_ordenada = []
-
-# REGRA 1: Ponto de Partida -> Menor BPM
-musica_atual = min(musicas_disponiveis, key=lambda x: x['bpm'])
-playlist_ordenada.append(musica_atual)
-musicas_disponiveis.remove(musica_atual)
-
-print(f"Música de Partida: {musica_atual['artista']} - {musica_atual['nome_da_musica']} ({musica_atual['bpm']} BPM, {musica_atual['camelot_key']})")
-
-# Loop principal para ordenar o resto do set
-while musicas_disponiveis:
-    candidatas_pontuadas = []
-    
-    # REGRA 2: Filtro Rígido de BPM
-    bpm_atual = musica_atual['bpm']
-    bpm_maximo = bpm_atual * 1.075 # Limite de 7.5% de aumento
-
-    candidatas_bpm_ok = [m for m in musicas_disponiveis if m['bpm'] >= bpm_atual and m['bpm'] <= bpm_maximo]
-
-    # REGRA 3: Sistema de Pontuação Harmônica
-    if candidatas_bpm_ok:
-        for candidata in candidatas_bpm_ok:
-            pontuacao = calcular_pontuacao_harmonica(musica_atual['camelot_key'], candidata['camelot_key'])
-            if pontuacao > 0:
-                # Adiciona um critério de desempate: menor aumento de BPM é melhor
-                desempate = 1 - ((candidata['bpm'] - bpm_atual) / (bpm_maximo - bpm_atual + 0.01))
-                pontuacao_final = pontuacao + desempate
-                candidatas_pontuadas.append((pontuacao_final, candidata))
-    
-    # Escolhe a melhor candidata
-    if candidatas_pontuadas:
-        # Ordena pela maior pontuação e escolhe a melhor
-        candidatas_pontuadas.sort(key=lambda x: x[0], reverse=True)
-        melhor_proxima_musica = candidatas_pontuadas[0][1]
+# As 24 chaves Camelot e a tabela 24x24 com a pontuação de cada transição, calculada uma única vez
+CAMELOT_KEYS = [f'{numero}{letra}' for numero in range(1, 13) for letra in 'AB']
+INDICE_CAMELOT = {key: i for i, key in enumerate(CAMELOT_KEYS)}
+TABELA_HARMONICA = [[calcular_pontuacao_harmonica(key_atual, key_candidata) for key_candidata in CAMELOT_KEYS]
+                    for key_atual in CAMELOT_KEYS]
+# Para cada chave, só as chaves de destino compatíveis (pontuação > 0)
+CHAVES_COMPATIVEIS = [[(j, pontuacao) for j, pontuacao in enumerate(linha) if pontuacao > 0]
+                      for linha in TABELA_HARMONICA]
+
+def pontuacao_transicao(bpm_atual, bpm_candidata, pontuacao_harmonica):
+    """
+    Pontuação de uma transição compatível: a pontuação harmônica mais um critério de
+    desempate em que um menor aumento de BPM é melhor.
+    """
+    bpm_maximo = bpm_atual * AUMENTO_MAXIMO_BPM
+    desempate = 1 - ((bpm_candidata - bpm_atual) / (bpm_maximo - bpm_atual + 0.01))
+    return pontuacao_harmonica + desempate
+
+# --- 3. O ALGORITMO DE ORDENAÇÃO PRINCIPAL ---
+
+def ordenar_indices(bpms, chaves, desempate=None):
+    """
+    Ordena as faixas com as regras do DJ e devolve (ordem, resets): a lista dos índices
+    das faixas pela ordem do set e o conjunto dos índices escolhidos por "reset".
+
+    REGRA 1: começa pela faixa de menor BPM.
+    REGRA 2: a próxima faixa tem de ter BPM entre o atual e +7.5%.
+    REGRA 3: entre essas, ganha a de maior pontuação harmônica (desempate: menor aumento de BPM;
+             em caso de empate total, a que aparece primeiro no dataset).
+    REGRA 4: se nenhuma for compatível, "reseta" com a faixa de menor BPM restante.
+
+    Com `desempate(i, j)`, um empate total na REGRA 3 é decidido pelo maior valor devolvido
+    para a transição da faixa atual i para a candidata j (ex: compatibilidade do final com a
+    introdução, ver series_temporais.criar_desempate); só depois conta a ordem no dataset.
+
+    Em vez de percorrer todas as faixas em cada passo, usa um índice por chave Camelot
+    com as faixas ordenadas por BPM: a melhor candidata de cada chave compatível é a
+    primeira com BPM >= atual, encontrada por pesquisa binária.
+    """
+    n = len(bpms)
+    if n == 0:
+        return [], set()
+
+    chaves = [INDICE_CAMELOT[key] for key in chaves]
+    baldes = [[] for _ in CAMELOT_KEYS]
+    for i in range(n):
+        baldes[chaves[i]].append((bpms[i], i))
+    for balde in baldes:
+        balde.sort()
+
+    def retirar(i):
+        balde = baldes[chaves[i]]
+        del balde[bisect_left(balde, (bpms[i], i))]
+
+    def menor_bpm_restante():
+        return min(balde[0] for balde in baldes if balde)[1]
+
+    atual = menor_bpm_restante()
+    retirar(atual)
+    ordem = [atual]
+    resets = set()
+
+    for _ in range(n - 1):
+        bpm_atual = bpms[atual]
+        bpm_maximo = bpm_atual * AUMENTO_MAXIMO_BPM
+        melhor = None
+        melhor_pontuacao = None
+        empatadas = []  # (balde, início, fim) das candidatas com a melhor pontuação
+
+        for chave_candidata, pontuacao_harmonica in CHAVES_COMPATIVEIS[chaves[atual]]:
+            balde = baldes[chave_candidata]
+            j = bisect_left(balde, (bpm_atual, -1))
+            pontuacao_balde = None
+            # A pontuação só desce com o BPM; avança de BPM em BPM enquanto houver empate
+            while j < len(balde) and balde[j][0] <= bpm_maximo:
+                bpm_candidata, i = balde[j]
+                pontuacao = pontuacao_transicao(bpm_atual, bpm_candidata, pontuacao_harmonica)
+                if pontuacao_balde is not None and pontuacao < pontuacao_balde:
+                    break
+                pontuacao_balde = pontuacao
+                fim = bisect_right(balde, (bpm_candidata, n))
+                if desempate is not None:
+                    if melhor is None or pontuacao > melhor_pontuacao:
+                        empatadas = [(balde, j, fim)]
+                    elif pontuacao == melhor_pontuacao:
+                        empatadas.append((balde, j, fim))
+                if melhor is None or pontuacao > melhor_pontuacao or (pontuacao == melhor_pontuacao and i < melhor):
+                    melhor, melhor_pontuacao = i, pontuacao
+                j = fim
+
+        if desempate is not None and sum(fim - inicio for _, inicio, fim in empatadas) > 1:
+            candidatas = [k for balde, inicio, fim in empatadas for _, k in balde[inicio:fim]]
+            melhor = max(candidatas, key=lambda k: (desempate(atual, k), -k))
+
+        if melhor is None:
+            melhor = menor_bpm_restante()
+            resets.add(melhor)
+
+        retirar(melhor)
+        ordem.append(melhor)
+        atual = melhor
+
+    return ordem, resets
+
+def ordenar_set(musicas, desempate=None):
+    """Ordena uma lista de faixas (dicionários com 'bpm' e 'camelot_key'); devolve (playlist, resets)."""
+    ordem, resets = ordenar_indices([m['bpm'] for m in musicas], [m['camelot_key'] for m in musicas],
+                                    desempate=desempate)
+    return [musicas[i] for i in ordem], [i in resets for i in ordem]
+
+# --- 4. EXECUÇÃO ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Ordena as faixas analisadas num DJ set harmônico.")
+    parser.add_argument('--otimizar', action='store_true',
+                        help="usa o otimizador global (pesquisa em feixe + 2-opt/or-opt) em vez do algoritmo guloso")
+    parser.add_argument('--orcamento', type=float, default=10.0,
+                        help="segundos de computação dados ao otimizador (padrão: 10)")
+    parser.add_argument('--biblioteca', nargs='?', const=BIBLIOTECA_PATH, default=None,
+                        help=f"lê as faixas da biblioteca SQLite em vez do CSV (padrão: {BIBLIOTECA_PATH})")
+    parser.add_argument('--bpm-min', type=float, default=None, help="só ordena faixas com BPM >= este valor (com --biblioteca)")
+    parser.add_argument('--bpm-max', type=float, default=None, help="só ordena faixas com BPM <= este valor (com --biblioteca)")
+    parser.add_argument('--manter-duplicados', action='store_true',
+                        help="ordena também as faixas marcadas como cópias de outras (coluna 'duplicado_de')")
+    parser.add_argument('--semelhanca', nargs='?', const=BIBLIOTECA_PATH, default=None,
+                        help="desempata as transições pela semelhança de croma, timbre, energia e BPM, "
+                             f"com os atributos guardados na biblioteca SQLite (padrão: {BIBLIOTECA_PATH})")
+    parser.add_argument('--series', nargs='?', const=SERIES_PATH, default=None,
+                        help="desempata as transições pela compatibilidade do final de cada faixa com a introdução "
+                             f"da seguinte, a partir das séries temporais guardadas na análise (padrão: {SERIES_PATH})")
+    parser.add_argument('--inserir', action='store_true',
+                        help=f"em vez de reordenar tudo, insere as faixas que ainda não estão em {OUTPUT_PATH} nas "
+                             "posições onde o set menos perde (ou mais ganha) e regista as posições alteradas para "
+                             "o criar_pasta_ord.py e o escrever_metadados.py (--alteracoes)")
+    instrumentacao.adicionar_argumentos(parser)
+    args = parser.parse_args()
+    instrumentacao.configurar(args, etapa='ordenacao')
+
+    if args.biblioteca is not None:
+        # Só as faixas com chave Camelot (e no intervalo de BPM pedido) são lidas da base de dados
+        print(f"A carregar as faixas da biblioteca: {args.biblioteca}")
+        with Biblioteca(args.biblioteca) as biblioteca:
+            df = biblioteca.consultar(colunas=['artista', 'nome_da_musica', 'bpm', 'key_estimada', 'filename', 'camelot_key'],
+                                      bpm_min=args.bpm_min, bpm_max=args.bpm_max, com_camelot=True,
+                                      sem_duplicados=not args.manter_duplicados)
+        df['bpm'] = df['bpm'].astype(float)
+        musicas_disponiveis = df.astype(object).to_dict('records')
+        print(f"Sucesso. {len(musicas_disponiveis)} faixas prontas para serem ordenadas.")
     else:
-        # REGRA 4: Plano de Contingência (Fallback)
-        # Nenhuma música compatível encontrada, "reseta" pegando a de menor BPM restante
-        print("AVISO: Nenhuma candidata compatível encontrada. Resetando com o menor BPM...")
-        melhor_proxima_musica = min(musicas_disponiveis, key=lambda x: x['bpm'])
-
-    # Adiciona a música escolhida à playlist e a remove das disponíveis
-    musica_atual = melhor_proxima_musica
-    playlist_ordenada.append(musica_atual)
-    musicas_disponiveis.remove(musica_atual)
-    
-    print(f" -> Próxima: {musica_atual['artista']} - {musica_atual['nome_da_musica']} ({musica_atual['bpm']} BPM, {musica_atual['camelot_key']})")
-
-# --- 5. RESULTADO FINAL ---
-print("\n--- DJ SET FINAL ORDENADO ---")
-df_final_ordenado = pd.DataFrame(playlist_ordenada)
-
-# Mostra a ordem final
-for index, row in df_final_ordenado.iterrows():
-    print(f"{index+1:02d}. {row['artista']} - {row['nome_da_musica']} ({row['bpm']:.0f} BPM, {row['camelot_key']})")
-
-# Salva o resultado final
-df_final_ordenado.to_csv(OUTPUT_PATH, index=False, encoding='utf-8')
-print(f"\nDJ Set com {len(df_final_ordenado)} músicas salvo com sucesso em: {OUTPUT_PATH}")
-print("\nPROJETO CONCLUÍDO! PARABÉNS!")
\ No newline at end of file
+        # Carregar o dataset final
+        print(f"A carregar o dataset final de: {INPUT_PATH}")
+        try:
+            df = pd.read_csv(INPUT_PATH)
+            # Cada faixa entra uma só vez no set, mesmo que haja várias cópias dela na pasta
+            if 'duplicado_de' in df.columns and not args.manter_duplicados:
+                duplicados = df['duplicado_de'].notna()
+                if duplicados.any():
+                    print(f"{duplicados.sum()} cópias de faixas já presentes retiradas antes da ordenação.")
+                df = df[~duplicados].reset_index(drop=True)
+            # Converte o DataFrame para uma lista de dicionários para facilitar a manipulação
+            musicas_disponiveis = df.to_dict('records')
+            print(f"Sucesso. {len(musicas_disponiveis)} faixas prontas para serem ordenadas.")
+        except FileNotFoundError:
+            print(f"ERRO CRÍTICO: O ficheiro '{INPUT_PATH}' não foi encontrado.")
+            sys.exit()
+
+    from otimizador_set import MAX_FAIXAS_OTIMIZADOR, otimizar_set, inserir_set
+    from criar_pasta_ord import posicoes_alteradas, guardar_alteracoes, ALTERACOES_PATH
+    if args.inserir:
+        # O set já ordenado fica como está; só as faixas que ainda não fazem parte dele são colocadas
+        try:
+            set_anterior = pd.read_csv(OUTPUT_PATH).to_dict('records')
+        except FileNotFoundError:
+            print(f"ERRO: O set ordenado '{OUTPUT_PATH}' não foi encontrado. Execute primeiro o ordenar_set.py sem --inserir.")
+            sys.exit()
+        no_set = {m['filename'] for m in set_anterior}
+        novas = [m for m in musicas_disponiveis if m['filename'] not in no_set]
+        print(f"{len(set_anterior)} faixas no set atual, {len(novas)} faixas novas a inserir.")
+        if args.otimizar or args.series is not None or args.semelhanca is not None:
+            print("AVISO: O otimizador e os desempates não são usados na inserção incremental.")
+        args.otimizar = False
+
+    if args.otimizar and len(musicas_disponiveis) > MAX_FAIXAS_OTIMIZADOR:
+        print(f"AVISO: O otimizador aceita até {MAX_FAIXAS_OTIMIZADOR} faixas. A usar o algoritmo guloso.")
+        args.otimizar = False
+
+    if args.otimizar and (args.series is not None or args.semelhanca is not None):
+        print("AVISO: O desempate pelas séries temporais ou pela semelhança só é usado pelo algoritmo guloso.")
+
+    if args.inserir:
+        print("\n--- Inserindo as faixas novas no DJ Set ---")
+        with instrumentacao.etapa('ordenacao'):
+            playlist_ordenada, foi_reset, relatorio = inserir_set(set_anterior, novas)
+        aviso = "AVISO: Transição incompatível (BPM ou tonalidade fora das regras)."
+    elif args.otimizar:
+        print(f"\n--- Iniciando o otimizador do DJ Set (orçamento: {args.orcamento:.0f} s) ---")
+        with instrumentacao.etapa('ordenacao'):
+            playlist_ordenada, foi_reset, relatorio = otimizar_set(musicas_disponiveis, args.orcamento)
+        aviso = "AVISO: Transição incompatível (BPM ou tonalidade fora das regras)."
+    else:
+        print("\n--- Iniciando o algoritmo de ordenação do DJ Set ---")
+        with instrumentacao.etapa('ordenacao'):
+            filenames = [m['filename'] for m in musicas_disponiveis]
+            desempates = []
+            if args.series is not None:
+                series = SeriesTemporais(args.series)
+                print(f"Séries temporais de {len(series)} faixas carregadas de: {args.series}")
+                desempates.append(criar_desempate(series, filenames))
+            if args.semelhanca is not None:
+                import similaridade
+                indice = similaridade.carregar_indice(args.semelhanca)
+                print(f"Atributos de {len(indice)} faixas carregados de: {args.semelhanca}")
+                desempates.append(similaridade.criar_desempate(indice, filenames))
+            # Com os dois desempates, conta a soma das duas pontuações (ambas de 0 a 1)
+            desempate = (lambda i, j: sum(d(i, j) for d in desempates)) if desempates else None
+            playlist_ordenada, foi_reset = ordenar_set(musicas_disponiveis, desempate=desempate)
+        aviso = "AVISO: Nenhuma candidata compatível encontrada. Resetando com o menor BPM..."
+
+    inseridas = set(relatorio['inseridas']) if args.inserir else set()
+    for posicao, (musica, reset) in enumerate(zip(playlist_ordenada, foi_reset)):
+        descricao = f"{musica['artista']} - {musica['nome_da_musica']} ({musica['bpm']} BPM, {musica['camelot_key']})"
+        if posicao in inseridas:
+            descricao += " [nova]"
+        if posicao == 0:
+            print(f"Música de Partida: {descricao}")
+            continue
+        if reset:
+            print(aviso)
+        print(f" -> Próxima: {descricao}")
+
+    if args.inserir and relatorio['sem_transicao_compativel']:
+        print(f"\nAVISO: {len(relatorio['sem_transicao_compativel'])} faixas novas não têm nenhuma posição com "
+              "transições compatíveis e foram postas no fim do set:")
+        for posicao in relatorio['sem_transicao_compativel']:
+            musica = playlist_ordenada[posicao]
+            print(f"  {posicao + 1:02d}. {musica['artista']} - {musica['nome_da_musica']} "
+                  f"({musica['bpm']} BPM, {musica['camelot_key']})")
+
+    if args.otimizar:
+        print(f"\nPontuação do set: {relatorio['pontuacao']:.2f} "
+              f"({relatorio['incompativeis']} transições incompatíveis, {relatorio['segundos']:.1f} s)")
+        print(f"Algoritmo guloso:  {relatorio['pontuacao_gulosa']:.2f} "
+              f"({relatorio['incompativeis_gulosa']} transições incompatíveis)")
+
+    # --- 5. RESULTADO FINAL ---
+    print("\n--- DJ SET FINAL ORDENADO ---")
+    df_final_ordenado = pd.DataFrame(playlist_ordenada)
+
+    # Mostra a ordem final
+    for index, row in df_final_ordenado.iterrows():
+        print(f"{index+1:02d}. {row['artista']} - {row['nome_da_musica']} ({row['bpm']:.0f} BPM, {row['camelot_key']})")
+
+    # Salva o resultado final
+    df_final_ordenado.to_csv(OUTPUT_PATH, index=False, encoding='utf-8')
+    print(f"\nDJ Set com {len(df_final_ordenado)} músicas salvo com sucesso em: {OUTPUT_PATH}")
+
+    if args.inserir:
+        # Só as posições que passaram a ter outra faixa precisam de ser refeitas na pasta e nas tags
+        filenames = [m['filename'] for m in playlist_ordenada]
+        posicoes = posicoes_alteradas([m['filename'] for m in set_anterior], filenames)
+        guardar_alteracoes(filenames, posicoes)
+        print(f"Pontuação do set: {relatorio['pontuacao']:.2f} ({relatorio['incompativeis']} transições incompatíveis)")
+        print(f"{len(posicoes)} de {len(filenames)} posições alteradas, registadas em: {ALTERACOES_PATH}")
+        print("Use criar_pasta_ord.py --alteracoes e escrever_metadados.py --alteracoes para atualizar só essas posições.")
+    print("\nPROJETO CONCLUÍDO! PARABÉNS!")
+
+
+if __name__ == '__main__':
+    main()
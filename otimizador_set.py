@@ -0,0 +1,375 @@
+import time
+import numpy as np
+from ordenar_set import TABELA_HARMONICA, INDICE_CAMELOT, AUMENTO_MAXIMO_BPM, ordenar_indices
+
+# --- 1. CONFIGURAÇÃO ---
+# Tempo de computação (segundos) dado ao otimizador por omissão
+ORCAMENTO_PADRAO = 10.0
+
+# Pontuação de uma transição que não cumpre as regras (BPM fora da janela ou chaves incompatíveis).
+# É muito mais negativa do que qualquer transição válida (entre 1 e 4 pontos), por isso
+# o otimizador reduz primeiro o número de transições incompatíveis e só depois melhora as restantes.
+PENALIZACAO_INCOMPATIVEL = -10.0
+
+# Parâmetros da pesquisa em feixe (beam search)
+LARGURA_FEIXE = 16
+CANDIDATAS_POR_ESTADO = 6
+# Fração do orçamento reservada à construção inicial; o resto vai para a melhoria local
+FRACAO_ORCAMENTO_FEIXE = 0.3
+
+# Acima deste número de faixas a matriz de transições (N x N) fica demasiado grande
+MAX_FAIXAS_OTIMIZADOR = 5000
+
+# Tamanho máximo dos segmentos deslocados pelo or-opt
+TAMANHO_MAXIMO_SEGMENTO = 3
+
+_TABELA_HARMONICA = np.asarray(TABELA_HARMONICA, dtype=np.float64)
+
+
+# --- 2. MATRIZ DE TRANSIÇÕES ---
+
+def construir_matriz_transicoes(bpms, chaves):
+    """
+    Calcula a pontuação de todas as transições i -> j com as mesmas regras do algoritmo guloso:
+    pontuação harmônica + desempate pelo menor aumento de BPM, se j estiver na janela de BPM
+    de i e as chaves forem compatíveis; PENALIZACAO_INCOMPATIVEL caso contrário.
+    """
+    bpms = np.asarray(bpms, dtype=np.float64)
+    indices_chaves = np.array([INDICE_CAMELOT[key] for key in chaves])
+    matriz = pontuacoes_transicoes(bpms[:, np.newaxis], indices_chaves[:, np.newaxis],
+                                   bpms[np.newaxis, :], indices_chaves[np.newaxis, :])
+    np.fill_diagonal(matriz, PENALIZACAO_INCOMPATIVEL)
+    return matriz
+
+def pontuacoes_transicoes(bpm_atual, chave_atual, bpm_candidata, chave_candidata):
+    """
+    Pontuação das transições atual -> candidata (arrays NumPy de BPM e de índices Camelot,
+    combinados por broadcasting), com as regras de `construir_matriz_transicoes`.
+    """
+    harmonica = _TABELA_HARMONICA[chave_atual, chave_candidata]
+    bpm_maximo = bpm_atual * AUMENTO_MAXIMO_BPM
+    desempate = 1 - ((bpm_candidata - bpm_atual) / (bpm_maximo - bpm_atual + 0.01))
+    compativel = (bpm_candidata >= bpm_atual) & (bpm_candidata <= bpm_maximo) & (harmonica > 0)
+    return np.where(compativel, harmonica + desempate, PENALIZACAO_INCOMPATIVEL)
+
+def avaliar_set(ordem, matriz):
+    """Devolve (pontuação total das transições válidas, número de transições incompatíveis)."""
+    if len(ordem) < 2:
+        return 0.0, 0
+    ganhos = matriz[ordem[:-1], ordem[1:]]
+    validas = ganhos > PENALIZACAO_INCOMPATIVEL
+    return float(ganhos[validas].sum()), int((~validas).sum())
+
+def _ganho_total(ordem, matriz):
+    return float(matriz[ordem[:-1], ordem[1:]].sum()) if len(ordem) > 1 else 0.0
+
+
+# --- 3. CONSTRUÇÃO INICIAL: PESQUISA EM FEIXE ---
+
+def _completar_guloso(caminho, visitadas, matriz):
+    """Completa um caminho escolhendo sempre a melhor transição seguinte."""
+    caminho = list(caminho)
+    visitadas = visitadas.copy()
+    while not visitadas.all():
+        linha = np.where(visitadas, -np.inf, matriz[caminho[-1]])
+        proxima = int(np.argmax(linha))
+        caminho.append(proxima)
+        visitadas[proxima] = True
+    return caminho
+
+def pesquisa_em_feixe(matriz, bpms, prazo, largura=LARGURA_FEIXE, candidatas=CANDIDATAS_POR_ESTADO):
+    """
+    Constrói o set faixa a faixa mantendo os `largura` melhores caminhos parciais.
+    Começa pelas faixas de menor BPM. Se o prazo terminar antes do fim, o melhor
+    caminho parcial é completado de forma gulosa.
+    """
+    n = len(matriz)
+    inicios = np.argsort(bpms, kind='stable')[:largura]
+    feixe = []
+    for inicio in inicios:
+        visitadas = np.zeros(n, dtype=bool)
+        visitadas[inicio] = True
+        feixe.append((0.0, [int(inicio)], visitadas))
+
+    for _ in range(n - 1):
+        if time.perf_counter() > prazo:
+            pontuacao, caminho, visitadas = max(feixe, key=lambda estado: estado[0])
+            return _completar_guloso(caminho, visitadas, matriz)
+
+        expansoes = []
+        for pontuacao, caminho, visitadas in feixe:
+            linha = np.where(visitadas, -np.inf, matriz[caminho[-1]])
+            k = min(candidatas, n - len(caminho))
+            melhores = np.argpartition(-linha, k - 1)[:k]
+            for proxima in melhores:
+                expansoes.append((pontuacao + linha[proxima], caminho, visitadas, int(proxima)))
+
+        expansoes.sort(key=lambda expansao: expansao[0], reverse=True)
+        novo_feixe = []
+        for pontuacao, caminho, visitadas, proxima in expansoes[:largura]:
+            visitadas = visitadas.copy()
+            visitadas[proxima] = True
+            novo_feixe.append((pontuacao, caminho + [proxima], visitadas))
+        feixe = novo_feixe
+
+    return max(feixe, key=lambda estado: estado[0])[1]
+
+
+# --- 4. MELHORIA LOCAL: 2-OPT E OR-OPT ---
+
+def _matriz_com_extremos(matriz):
+    """Acrescenta um nó fictício (índice n) com ganho 0, para tratar o início e o fim do set como transições."""
+    n = len(matriz)
+    estendida = np.zeros((n + 1, n + 1))
+    estendida[:n, :n] = matriz
+    return estendida
+
+def _melhor_or_opt(caminho, matriz):
+    """Procura a melhor deslocação de um segmento de 1 a TAMANHO_MAXIMO_SEGMENTO faixas. Devolve (ganho, novo caminho)."""
+    p = np.asarray(caminho)
+    m = len(p)
+    melhor_ganho, melhor_caminho = 1e-9, None
+    ganhos_arestas = matriz[p[:-1], p[1:]]
+    for tamanho in range(1, TAMANHO_MAXIMO_SEGMENTO + 1):
+        for i in range(1, m - tamanho):
+            fim = i + tamanho - 1
+            anterior, seguinte = p[i - 1], p[fim + 1]
+            ganho_remocao = matriz[anterior, seguinte] - matriz[anterior, p[i]] - matriz[p[fim], seguinte]
+            # Inserção entre p[j] e p[j+1], para todas as posições fora do segmento
+            j = np.arange(m - 1)
+            fora = (j < i - 1) | (j > fim)
+            ganho_insercao = matriz[p[j], p[i]] + matriz[p[fim], p[j + 1]] - ganhos_arestas
+            ganhos = np.where(fora, ganho_remocao + ganho_insercao, -np.inf)
+            k = int(np.argmax(ganhos))
+            if ganhos[k] > melhor_ganho:
+                segmento = list(p[i:fim + 1])
+                resto = list(p[:i]) + list(p[fim + 1:])
+                posicao = k + 1 if k < i else k + 1 - tamanho
+                melhor_ganho = float(ganhos[k])
+                melhor_caminho = resto[:posicao] + segmento + resto[posicao:]
+    return melhor_ganho, melhor_caminho
+
+def _melhor_2opt(caminho, matriz):
+    """Procura a melhor inversão de um segmento (transições dirigidas). Devolve (ganho, novo caminho)."""
+    p = np.asarray(caminho)
+    m = len(p)
+    frente = np.concatenate([[0.0], np.cumsum(matriz[p[:-1], p[1:]])])
+    tras = np.concatenate([[0.0], np.cumsum(matriz[p[1:], p[:-1]])])
+    melhor_ganho, melhor_caminho = 1e-9, None
+    for i in range(1, m - 2):
+        j = np.arange(i + 1, m - 1)
+        ganhos = (matriz[p[i - 1], p[j]] + matriz[p[i], p[j + 1]]
+                  - matriz[p[i - 1], p[i]] - matriz[p[j], p[j + 1]]
+                  + (tras[j] - tras[i]) - (frente[j] - frente[i]))
+        k = int(np.argmax(ganhos))
+        if ganhos[k] > melhor_ganho:
+            melhor_ganho = float(ganhos[k])
+            fim = int(j[k])
+            melhor_caminho = list(p[:i]) + list(p[i:fim + 1][::-1]) + list(p[fim + 1:])
+    return melhor_ganho, melhor_caminho
+
+def _otimo_local(caminho, matriz, prazo):
+    """Aplica or-opt e 2-opt enquanto houver melhorias e o prazo não terminar."""
+    while time.perf_counter() < prazo:
+        _, novo = _melhor_or_opt(caminho, matriz)
+        if novo is None:
+            _, novo = _melhor_2opt(caminho, matriz)
+        if novo is None:
+            break
+        caminho = novo
+    return caminho
+
+def _perturbar(caminho, rng):
+    """Desloca um segmento aleatório para outra posição aleatória (sem mexer nos nós fictícios)."""
+    m = len(caminho)
+    if m < 5:
+        return list(caminho)
+    tamanho = int(rng.integers(1, min(8, m - 3) + 1))
+    i = int(rng.integers(1, m - tamanho))
+    segmento = caminho[i:i + tamanho]
+    resto = caminho[:i] + caminho[i + tamanho:]
+    posicao = int(rng.integers(1, len(resto)))
+    return resto[:posicao] + segmento + resto[posicao:]
+
+def melhoria_local(caminho, matriz, prazo, semente=0):
+    """
+    Pesquisa local iterada: chega a um ótimo local com or-opt e 2-opt e, enquanto houver
+    orçamento, perturba o melhor set encontrado e volta a otimizá-lo, ficando com o melhor.
+    """
+    n = len(matriz)
+    estendida = _matriz_com_extremos(matriz)
+    rng = np.random.default_rng(semente)
+
+    melhor = _otimo_local([n] + list(caminho) + [n], estendida, prazo)
+    melhor_ganho = _ganho_total(np.asarray(melhor), estendida)
+    while time.perf_counter() < prazo and n > 3:
+        candidato = _otimo_local(_perturbar(melhor, rng), estendida, prazo)
+        ganho = _ganho_total(np.asarray(candidato), estendida)
+        if ganho > melhor_ganho + 1e-9:
+            melhor, melhor_ganho = candidato, ganho
+    return [int(i) for i in melhor[1:-1]]
+
+
+# --- 5. OTIMIZADOR ---
+
+def otimizar_indices(bpms, chaves, orcamento=ORCAMENTO_PADRAO):
+    """
+    Ordena as faixas tratando o set como um caminho que maximiza a soma das pontuações
+    das transições, dentro de um orçamento de tempo (segundos).
+    Devolve (ordem, relatório) com a pontuação e o número de transições incompatíveis
+    do set otimizado e do set guloso, para comparação.
+    """
+    inicio = time.perf_counter()
+    if len(bpms) == 0:
+        return [], {'pontuacao': 0.0, 'incompativeis': 0, 'pontuacao_gulosa': 0.0, 'incompativeis_gulosa': 0}
+
+    matriz = construir_matriz_transicoes(bpms, chaves)
+
+    # Pontos de partida: o set guloso e o da pesquisa em feixe; fica o melhor
+    ordem_gulosa, _ = ordenar_indices(list(bpms), list(chaves))
+    ordem_feixe = pesquisa_em_feixe(matriz, np.asarray(bpms), inicio + orcamento * FRACAO_ORCAMENTO_FEIXE)
+    ordem = max([ordem_gulosa, ordem_feixe], key=lambda o: _ganho_total(np.asarray(o), matriz))
+
+    ordem = melhoria_local(ordem, matriz, inicio + orcamento)
+
+    pontuacao, incompativeis = avaliar_set(np.asarray(ordem), matriz)
+    pontuacao_gulosa, incompativeis_gulosa = avaliar_set(np.asarray(ordem_gulosa), matriz)
+    relatorio = {
+        'pontuacao': pontuacao,
+        'incompativeis': incompativeis,
+        'pontuacao_gulosa': pontuacao_gulosa,
+        'incompativeis_gulosa': incompativeis_gulosa,
+        'transicoes_incompativeis': [bool(matriz[a, b] <= PENALIZACAO_INCOMPATIVEL)
+                                     for a, b in zip(ordem[:-1], ordem[1:])],
+        'segundos': time.perf_counter() - inicio,
+    }
+    return ordem, relatorio
+
+def otimizar_set(musicas, orcamento=ORCAMENTO_PADRAO):
+    """
+    Versão de `ordenar_set` com o otimizador global. Devolve (playlist, incompatíveis, relatório),
+    em que `incompatíveis` marca as faixas que chegam por uma transição fora das regras.
+    """
+    ordem, relatorio = otimizar_indices([m['bpm'] for m in musicas], [m['camelot_key'] for m in musicas], orcamento)
+    marcadas = [False] + relatorio['transicoes_incompativeis']
+    return [musicas[i] for i in ordem], marcadas[:len(ordem)], relatorio
+
+
+# --- 6. INSERÇÃO INCREMENTAL ---
+
+def inserir_indices(bpms, chaves, bpms_novas, chaves_novas):
+    """
+    Insere faixas novas num set já ordenado sem o reordenar: cada faixa nova vai para a
+    posição onde a soma das pontuações das transições mais sobe (ou menos desce), com as
+    mesmas regras de `construir_matriz_transicoes`. Só contam as posições em que as transições
+    de e para a faixa nova são ambas compatíveis. As faixas são inseridas uma a uma, a de
+    maior ganho primeiro; em caso de empate fica a posição mais perto do fim, que desloca
+    menos faixas do set. As que não têm nenhuma posição compatível (nem depois de inseridas
+    as outras) vão para o fim do set, pela ordem em que foram dadas.
+    As faixas do set têm os índices 0..n-1 e as novas n..n+k-1; devolve a nova ordem e a
+    lista das faixas novas postas no fim sem transição compatível.
+    """
+    n = len(bpms)
+    ordem = list(range(n))
+    bpm_set = np.asarray(bpms, dtype=np.float64)
+    chave_set = np.array([INDICE_CAMELOT[key] for key in chaves], dtype=np.int64)
+    bpm_novas = np.asarray(bpms_novas, dtype=np.float64)
+    chave_novas = np.array([INDICE_CAMELOT[key] for key in chaves_novas], dtype=np.int64)
+
+    def ligacoes():
+        return pontuacoes_transicoes(bpm_set[:-1], chave_set[:-1], bpm_set[1:], chave_set[1:])
+
+    def compativel(pontuacoes):
+        # Uma posição com alguma transição incompatível de ou para a faixa nova não conta
+        return np.where(pontuacoes <= PENALIZACAO_INCOMPATIVEL, -np.inf, pontuacoes)
+
+    def ganhos(x):
+        # Ganho de pôr a faixa nova x antes da faixa p do set, para p = 0..m (p = m: no fim)
+        m = len(bpm_set)
+        resultado = np.zeros(m + 1)
+        if m:
+            resultado[1:] += compativel(pontuacoes_transicoes(bpm_set, chave_set, bpm_novas[x], chave_novas[x]))
+            resultado[:-1] += compativel(pontuacoes_transicoes(bpm_novas[x], chave_novas[x], bpm_set, chave_set))
+            resultado[1:-1] -= atuais
+        return resultado
+
+    def ganho_em(xs, p):
+        # Ganho das faixas novas xs (array) na posição p
+        m = len(bpm_set)
+        ganho = np.zeros(len(xs))
+        if p > 0:
+            ganho += compativel(pontuacoes_transicoes(bpm_set[p - 1], chave_set[p - 1], bpm_novas[xs], chave_novas[xs]))
+        if p < m:
+            ganho += compativel(pontuacoes_transicoes(bpm_novas[xs], chave_novas[xs], bpm_set[p], chave_set[p]))
+        if 0 < p < m:
+            ganho -= atuais[p - 1]
+        return ganho
+
+    def melhor_posicao(x):
+        resultado = ganhos(x)
+        p = len(resultado) - 1 - int(np.argmax(resultado[::-1]))
+        return resultado[p], p
+
+    # A melhor posição de cada faixa nova só muda quando a inserção de outra parte essa transição
+    atuais = ligacoes()
+    k = len(bpm_novas)
+    melhor_ganho = np.empty(k)
+    melhor_posicao_nova = np.empty(k, dtype=np.int64)
+    for x in range(k):
+        melhor_ganho[x], melhor_posicao_nova[x] = melhor_posicao(x)
+    restantes = np.arange(k)
+    while len(restantes):
+        # Maior ganho; depois a posição mais perto do fim; depois a primeira faixa nova
+        escolhida = np.lexsort((-restantes, melhor_posicao_nova[restantes], melhor_ganho[restantes]))[-1]
+        if melhor_ganho[restantes[escolhida]] == -np.inf:
+            break
+        x, p = int(restantes[escolhida]), int(melhor_posicao_nova[restantes[escolhida]])
+        restantes = np.delete(restantes, escolhida)
+        ordem.insert(p, n + x)
+        bpm_set = np.insert(bpm_set, p, bpm_novas[x])
+        chave_set = np.insert(chave_set, p, chave_novas[x])
+        # Só as transições que entram e saem da faixa inserida são novas
+        inicio, fim = max(p - 1, 0), min(p + 1, len(bpm_set) - 1)
+        atuais = np.concatenate((atuais[:inicio],
+                                 pontuacoes_transicoes(bpm_set[inicio:fim], chave_set[inicio:fim],
+                                                       bpm_set[inicio + 1:fim + 1], chave_set[inicio + 1:fim + 1]),
+                                 atuais[p:]))
+        if not len(restantes):
+            break
+        partidas = restantes[melhor_posicao_nova[restantes] == p]
+        melhor_posicao_nova[restantes[melhor_posicao_nova[restantes] > p]] += 1
+        for y in partidas:
+            melhor_ganho[y], melhor_posicao_nova[y] = melhor_posicao(y)
+        # As duas posições novas: antes e depois da faixa inserida
+        for nova in (p, p + 1):
+            ganho = ganho_em(restantes, nova)
+            melhor = (ganho > melhor_ganho[restantes]) | ((ganho == melhor_ganho[restantes]) & (nova > melhor_posicao_nova[restantes]))
+            melhor_ganho[restantes[melhor]] = ganho[melhor]
+            melhor_posicao_nova[restantes[melhor]] = nova
+    sem_posicao = [n + int(x) for x in restantes]
+    ordem.extend(sem_posicao)
+    return ordem, sem_posicao
+
+def inserir_set(set_atual, novas):
+    """
+    Versão de `inserir_indices` para listas de faixas (dicionários com 'bpm' e 'camelot_key').
+    Devolve (playlist, incompatíveis, relatório), como o `otimizar_set`; o relatório indica
+    também as posições (a contar de 0) das faixas inseridas e, dessas, das que ficaram no fim
+    do set por não terem nenhuma posição com transições compatíveis.
+    """
+    ordem, sem_posicao = inserir_indices([m['bpm'] for m in set_atual], [m['camelot_key'] for m in set_atual],
+                            [m['bpm'] for m in novas], [m['camelot_key'] for m in novas])
+    faixas = list(set_atual) + list(novas)
+    playlist = [faixas[i] for i in ordem]
+    bpms = np.array([m['bpm'] for m in playlist], dtype=np.float64)
+    chaves = np.array([INDICE_CAMELOT[m['camelot_key']] for m in playlist], dtype=np.int64)
+    transicoes = pontuacoes_transicoes(bpms[:-1], chaves[:-1], bpms[1:], chaves[1:])
+    incompativeis = transicoes <= PENALIZACAO_INCOMPATIVEL
+    relatorio = {
+        'pontuacao': float(transicoes[~incompativeis].sum()),
+        'incompativeis': int(incompativeis.sum()),
+        'inseridas': [posicao for posicao, i in enumerate(ordem) if i >= len(set_atual)],
+        'sem_transicao_compativel': [ordem.index(i) for i in sem_posicao],
+    }
+    marcadas = [False] + [bool(b) for b in incompativeis]
+    return playlist, marcadas[:len(playlist)], relatorio
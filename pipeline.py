@@ -0,0 +1,284 @@
+import os
+import sys
+import ast
+import json
+import hashlib
+import argparse
+import pandas as pd
+import instrumentacao
+
+# --- 1. CONFIGURAÇÃO ---
+# Pasta onde o orquestrador guarda o estado de cada etapa e os dados intermédios (em pickle)
+ESTADO_FOLDER = '.pipeline'
+
+# As etapas, pela ordem em que correm
+ETAPAS = ['analise', 'engenharia', 'ordenacao', 'pasta', 'metadados']
+
+# Módulos cujo código faz parte da "entrada" de cada etapa: se o código mudar, a etapa volta a correr.
+# Contam também todos os módulos do projeto que eles importam (ver modulos_da_etapa).
+MODULOS_ETAPA = {
+    'analise': ['analise_acoustica_local.py', 'cache_analise.py'],
+    'engenharia': ['engenharia_final.py'],
+    'ordenacao': ['ordenar_set.py', 'otimizador_set.py'],
+    'pasta': ['criar_pasta_ord.py'],
+    'metadados': ['escrever_metadados.py'],
+}
+
+# --- 2. IDENTIFICAÇÃO DAS ENTRADAS ---
+
+def _hash(*partes):
+    h = hashlib.sha1()
+    for parte in partes:
+        h.update(parte if isinstance(parte, bytes) else json.dumps(parte, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+def hash_dataframe(df):
+    """Hash do conteúdo de um DataFrame (colunas, valores e ordem das linhas)."""
+    return _hash(list(df.columns), pd.util.hash_pandas_object(df, index=False).values.tobytes())
+
+def modulos_da_etapa(etapa):
+    """
+    Os módulos de MODULOS_ETAPA e, transitivamente, todos os módulos do projeto que eles importam
+    (também os importados dentro de funções), para que nenhuma dependência mude sem ser notada.
+    """
+    pasta = os.path.dirname(os.path.abspath(__file__))
+    por_ver = list(MODULOS_ETAPA[etapa])
+    vistos = set()
+    while por_ver:
+        modulo = por_ver.pop()
+        if modulo in vistos:
+            continue
+        vistos.add(modulo)
+        with open(os.path.join(pasta, modulo), encoding='utf-8') as f:
+            arvore = ast.parse(f.read(), filename=modulo)
+        for no in ast.walk(arvore):
+            if isinstance(no, ast.Import):
+                nomes = [alias.name for alias in no.names]
+            elif isinstance(no, ast.ImportFrom) and no.module and not no.level:
+                nomes = [no.module]
+            else:
+                continue
+            for nome in nomes:
+                ficheiro = f"{nome.split('.')[0]}.py"
+                if os.path.exists(os.path.join(pasta, ficheiro)):
+                    por_ver.append(ficheiro)
+    return sorted(vistos)
+
+def hash_codigo(etapa):
+    pasta = os.path.dirname(os.path.abspath(__file__))
+    conteudos = []
+    for modulo in modulos_da_etapa(etapa):
+        with open(os.path.join(pasta, modulo), 'rb') as f:
+            conteudos.append(f.read())
+    return _hash(*conteudos)
+
+def hash_pasta_audio(pasta):
+    """Identifica o conteúdo da pasta de áudio pelo nome, tamanho e data de modificação de cada ficheiro."""
+    ficheiros = []
+    for entrada in sorted(os.scandir(pasta), key=lambda e: e.name):
+        if entrada.name.endswith('.flac'):
+            st = entrada.stat()
+            ficheiros.append((entrada.name, st.st_size, st.st_mtime_ns))
+    return _hash(ficheiros)
+
+# --- 3. ESTADO DO PIPELINE ---
+
+class EstadoPipeline:
+    """
+    Guarda, para cada etapa, o hash das entradas com que correu pela última vez e o hash
+    da saída produzida. As saídas em DataFrame ficam em pickle, para que as etapas
+    seguintes as possam usar sem voltar a ler e converter um CSV.
+    """
+
+    def __init__(self, pasta=ESTADO_FOLDER):
+        self.pasta = pasta
+        self.caminho = os.path.join(pasta, 'estado.json')
+        os.makedirs(pasta, exist_ok=True)
+        try:
+            with open(self.caminho, encoding='utf-8') as f:
+                self.etapas = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.etapas = {}
+
+    def caminho_saida(self, etapa):
+        return os.path.join(self.pasta, f'{etapa}.pkl')
+
+    def atualizada(self, etapa, hash_entrada):
+        registo = self.etapas.get(etapa)
+        if registo is None or registo['entrada'] != hash_entrada:
+            return False
+        return not registo.get('tem_dados') or os.path.exists(self.caminho_saida(etapa))
+
+    def hash_saida(self, etapa):
+        return self.etapas[etapa]['saida']
+
+    def carregar_saida(self, etapa):
+        return pd.read_pickle(self.caminho_saida(etapa))
+
+    def registar(self, etapa, hash_entrada, df=None, hash_saida=None):
+        if df is not None:
+            df.to_pickle(self.caminho_saida(etapa))
+            hash_saida = hash_dataframe(df)
+        self.etapas[etapa] = {'entrada': hash_entrada, 'saida': hash_saida, 'tem_dados': df is not None}
+        with open(f'{self.caminho}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.etapas, f, indent=1)
+        os.replace(f'{self.caminho}.tmp', self.caminho)
+
+# --- 4. AS ETAPAS ---
+
+def etapa_analise(_df, opcoes):
+    from analise_acoustica_local import analisar_pasta
+    return analisar_pasta(opcoes['pasta_audio'], num_workers=opcoes['workers'], modo=opcoes['modo_analise'])
+
+def etapa_engenharia(df, opcoes):
+    from engenharia_final import adicionar_camelot_key
+    return adicionar_camelot_key(df)
+
+def etapa_ordenacao(df, opcoes):
+    from ordenar_set import ordenar_set
+    musicas = df.to_dict('records')
+    if opcoes['otimizar']:
+        from otimizador_set import otimizar_set
+        playlist, _, relatorio = otimizar_set(musicas, opcoes['orcamento'])
+        print(f"Pontuação do set: {relatorio['pontuacao']:.2f} ({relatorio['incompativeis']} transições incompatíveis)")
+    else:
+        playlist, _ = ordenar_set(musicas)
+    return pd.DataFrame(playlist, columns=df.columns)
+
+def etapa_pasta(df, opcoes):
+    from criar_pasta_ord import criar_pasta_set
+    resumo = criar_pasta_set(df, pasta_origem=opcoes['pasta_audio'], pasta_destino=opcoes['pasta_set'],
+                             modo=opcoes['modo_pasta'])
+    print(f"{resumo['criados']} ficheiros criados, {resumo['renomeados']} renomeados, {resumo['mantidos']} sem alterações.")
+    return None
+
+def etapa_metadados(df, opcoes):
+    from escrever_metadados import escrever_metadados_set
+    from criar_pasta_ord import MODOS_LIGADOS
+    if opcoes['modo_pasta'] in MODOS_LIGADOS:
+        # As tags mudariam a data de modificação dos originais, e com ela o hash da pasta de áudio
+        # e a cache da análise: a execução seguinte voltaria a analisar tudo
+        print(f"AVISO: Com --modo-pasta {opcoes['modo_pasta']}, as tags não são escritas (alterariam os ficheiros originais).")
+        return None
+    resumo = escrever_metadados_set(df, pasta_set=opcoes['pasta_set'])
+    print(f"{resumo['escrito']} ficheiros atualizados, {resumo['inalterado']} já estavam corretos.")
+    return None
+
+FUNCOES_ETAPA = {
+    'analise': etapa_analise,
+    'engenharia': etapa_engenharia,
+    'ordenacao': etapa_ordenacao,
+    'pasta': etapa_pasta,
+    'metadados': etapa_metadados,
+}
+
+# Opções que influenciam o resultado de cada etapa (as restantes, como o número de processos, não)
+OPCOES_ETAPA = {
+    'analise': ['modo_analise'],
+    'engenharia': [],
+    'ordenacao': ['otimizar', 'orcamento'],
+    'pasta': ['pasta_audio', 'pasta_set', 'modo_pasta'],
+    'metadados': ['pasta_set', 'modo_pasta'],
+}
+
+# Cópias em CSV dos dados de cada etapa, para quem continua a usar os scripts individuais
+CSV_ETAPA = {
+    'analise': 'dataset_final_analisado.csv',
+    'engenharia': 'playlist_pronta_para_ordenar.csv',
+    'ordenacao': 'dj_set_final_ordenado.csv',
+}
+
+# --- 5. ORQUESTRADOR ---
+
+def executar_pipeline(opcoes, desde=None, ate=None, exportar_csv=False):
+    """
+    Corre as etapas pela ordem, passando os dados em memória de uma para a seguinte.
+    Uma etapa cujas entradas (dados da etapa anterior, opções relevantes e código) não mudaram
+    desde a última execução é saltada; os seus dados só são lidos do disco se uma etapa
+    seguinte precisar de correr. `desde` força a execução a partir dessa etapa e `ate`
+    para depois dessa etapa.
+    """
+    estado = EstadoPipeline(opcoes.get('pasta_estado', ESTADO_FOLDER))
+    etapas = ETAPAS[:ETAPAS.index(ate) + 1] if ate else ETAPAS
+    forcar_a_partir = ETAPAS.index(desde) if desde else len(ETAPAS)
+
+    df = None
+    hash_anterior = None
+    etapa_anterior = None
+    # A análise e a cópia para a pasta do set leem os ficheiros de áudio de origem
+    hash_audio = hash_pasta_audio(opcoes['pasta_audio'])
+    for posicao, etapa in enumerate(etapas):
+        if etapa == 'analise':
+            entrada_dados = hash_audio
+        elif etapa == 'pasta':
+            entrada_dados = (hash_anterior, hash_audio)
+        else:
+            entrada_dados = hash_anterior
+        hash_entrada = _hash(entrada_dados, {k: opcoes[k] for k in OPCOES_ETAPA[etapa]}, hash_codigo(etapa))
+
+        # As etapas que só escrevem ficheiros no set também dependem de a pasta do set ainda existir
+        pasta_ok = etapa not in ('pasta', 'metadados') or os.path.isdir(opcoes['pasta_set'])
+        if posicao < forcar_a_partir and pasta_ok and estado.atualizada(etapa, hash_entrada):
+            print(f"[{etapa}] Sem alterações, etapa saltada.")
+            if estado.etapas[etapa]['tem_dados']:
+                df = None  # só é lido do disco se uma etapa seguinte precisar
+                etapa_anterior = etapa
+            hash_anterior = estado.hash_saida(etapa)
+            continue
+
+        if df is None and etapa_anterior is not None:
+            df = estado.carregar_saida(etapa_anterior)
+
+        print(f"\n[{etapa}] A executar...")
+        with instrumentacao.etapa(etapa):
+            saida = FUNCOES_ETAPA[etapa](df, opcoes)
+        if saida is not None:
+            estado.registar(etapa, hash_entrada, df=saida)
+            df = saida
+            hash_anterior = estado.hash_saida(etapa)
+            etapa_anterior = etapa
+            if exportar_csv or etapa == 'ordenacao':
+                saida.to_csv(CSV_ETAPA[etapa], index=False, encoding='utf-8')
+        else:
+            # Etapas sem dados de saída (ficheiros no set): a seguinte depende das entradas desta
+            estado.registar(etapa, hash_entrada, hash_saida=hash_entrada)
+            hash_anterior = hash_entrada
+
+    return df
+
+def main():
+    parser = argparse.ArgumentParser(description="Corre o pipeline completo (análise -> Camelot -> ordenação -> pasta -> metadados).")
+    parser.add_argument('--desde', choices=ETAPAS, help="força a execução a partir desta etapa")
+    parser.add_argument('--ate', choices=ETAPAS, help="para depois desta etapa")
+    parser.add_argument('--exportar-csv', action='store_true',
+                        help="grava também os CSV intermédios (o CSV do set ordenado é sempre gravado)")
+    parser.add_argument('--pasta-audio', default='musicas_flac/')
+    parser.add_argument('--pasta-set', default='DJ_Set_Final_Ordenado')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--modo-analise', choices=['auto', 'completo', 'streaming', 'previa'], default='auto')
+    parser.add_argument('--otimizar', action='store_true', help="usa o otimizador global na ordenação")
+    parser.add_argument('--orcamento', type=float, default=10.0, help="segundos dados ao otimizador")
+    parser.add_argument('--modo-pasta', choices=['reflink', 'hardlink', 'symlink', 'copia'], default='reflink')
+    instrumentacao.adicionar_argumentos(parser, etapas=ETAPAS)
+    args = parser.parse_args()
+    instrumentacao.configurar(args)
+
+    if not os.path.isdir(args.pasta_audio):
+        print(f"ERRO: A pasta '{args.pasta_audio}' não foi encontrada.")
+        sys.exit()
+
+    opcoes = {
+        'pasta_audio': args.pasta_audio,
+        'pasta_set': args.pasta_set,
+        'workers': args.workers,
+        'modo_analise': args.modo_analise,
+        'otimizar': args.otimizar,
+        'orcamento': args.orcamento,
+        'modo_pasta': args.modo_pasta,
+    }
+    executar_pipeline(opcoes, desde=args.desde, ate=args.ate, exportar_csv=args.exportar_csv)
+    print("\n--- PIPELINE CONCLUÍDO! ---")
+
+
+if __name__ == '__main__':
+    main()
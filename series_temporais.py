@@ -0,0 +1,230 @@
+import os
+import json
+import numpy as np
+
+# --- 1. CONFIGURAÇÃO ---
+# Séries temporais de cada faixa (grelha de batidas, envelope de onsets, croma e tonalidade por
+# segmento, curva de energia), guardadas durante a análise para que as etapas seguintes possam
+# ler a introdução e o final de uma faixa sem voltar a descodificar o áudio.
+SERIES_PATH = 'series_temporais/'
+
+# Todas as séries ficam seguidas num único ficheiro de float32 (a "arena"), lido por memory-map;
+# o índice JSON guarda, por faixa e por série, a posição, a forma e a taxa (valores por segundo).
+FICHEIRO_ARENA = 'series.f32'
+FICHEIRO_INDICE = 'indice.json'
+VERSAO_SERIES = 1
+
+# O índice é regravado a cada N faixas guardadas, para uma execução interrompida perder pouco
+GRAVAR_INDICE_A_CADA = 50
+
+# A arena é compactada quando mais do que esta fração dela pertence a séries já substituídas ou removidas
+FRACAO_MORTA_COMPACTAR = 0.5
+
+# Duração (em segundos) da introdução e do final comparados numa transição (16 compassos a 120 BPM)
+SEGUNDOS_MISTURA = 32.0
+
+# Diferença de energia (em dB) a partir da qual a transição perde mais de metade da pontuação de energia
+ESCALA_ENERGIA_DB = 6.0
+
+_TAMANHO_FLOAT = np.dtype(np.float32).itemsize
+
+
+# --- 2. ARMAZÉM EM DISCO (arena + índice) ---
+
+class SeriesTemporais:
+    """
+    Guarda as séries temporais de cada faixa numa arena de float32 e devolve-as como vistas
+    sobre um memory-map: ler os primeiros ou os últimos segundos de uma série não copia nem
+    descodifica nada. As faixas são identificadas pelo nome do ficheiro, como na biblioteca,
+    e uma faixa cujo tamanho ou data de modificação mudou deixa de contar como atualizada.
+    """
+
+    def __init__(self, pasta=SERIES_PATH):
+        self.pasta = pasta
+        os.makedirs(pasta, exist_ok=True)
+        self.caminho_arena = os.path.join(pasta, FICHEIRO_ARENA)
+        self.caminho_indice = os.path.join(pasta, FICHEIRO_INDICE)
+        self.faixas = {}
+        try:
+            with open(self.caminho_indice, encoding='utf-8') as f:
+                indice = json.load(f)
+            if indice.get('versao') == VERSAO_SERIES:
+                self.faixas = indice['faixas']
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        self._mapa = None
+        self._por_gravar = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def __contains__(self, filename):
+        return filename in self.faixas
+
+    def __len__(self):
+        return len(self.faixas)
+
+    def fechar(self):
+        if self._por_gravar:
+            self.gravar_indice()
+        self._mapa = None
+
+    def gravar_indice(self):
+        with open(f'{self.caminho_indice}.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'versao': VERSAO_SERIES, 'faixas': self.faixas}, f)
+        os.replace(f'{self.caminho_indice}.tmp', self.caminho_indice)
+        self._por_gravar = 0
+
+    def atualizado(self, filepath):
+        """Indica se as séries guardadas correspondem ao ficheiro tal como está agora."""
+        entrada = self.faixas.get(os.path.basename(filepath))
+        if entrada is None:
+            return False
+        st = os.stat(filepath)
+        return entrada['tamanho'] == st.st_size and entrada['mtime_ns'] == st.st_mtime_ns
+
+    def guardar(self, filepath, series):
+        """
+        Acrescenta à arena as séries de uma faixa: um dicionário nome -> (valores, taxa), com a
+        taxa em valores por segundo (None para séries de instantes, como a grelha de batidas).
+        """
+        st = os.stat(filepath)
+        entrada = {'tamanho': st.st_size, 'mtime_ns': st.st_mtime_ns, 'duracao': None, 'series': {}}
+        with open(self.caminho_arena, 'ab') as f:
+            posicao = f.tell() // _TAMANHO_FLOAT
+            for nome, (valores, taxa) in series.items():
+                valores = np.ascontiguousarray(valores, dtype=np.float32)
+                f.write(valores.tobytes())
+                entrada['series'][nome] = {'inicio': posicao, 'forma': list(valores.shape), 'taxa': taxa}
+                posicao += valores.size
+                # O último segmento pode estar incompleto: a duração vem da série que a arredonda menos
+                if taxa and (entrada['duracao'] is None or len(valores) / taxa < entrada['duracao']):
+                    entrada['duracao'] = len(valores) / taxa
+        entrada['duracao'] = entrada['duracao'] or 0.0
+        self.faixas[os.path.basename(filepath)] = entrada
+        self._por_gravar += 1
+        if self._por_gravar >= GRAVAR_INDICE_A_CADA:
+            self.gravar_indice()
+
+    def remover(self, filenames):
+        """Esquece as faixas indicadas; o espaço na arena só é recuperado por `compactar`."""
+        for filename in filenames:
+            if self.faixas.pop(filename, None) is not None:
+                self._por_gravar += 1
+
+    def _arena(self):
+        # O memory-map é refeito quando a arena cresce (novas faixas guardadas desde a última leitura)
+        tamanho = os.path.getsize(self.caminho_arena) // _TAMANHO_FLOAT if os.path.exists(self.caminho_arena) else 0
+        if self._mapa is None or len(self._mapa) != tamanho:
+            self._mapa = np.memmap(self.caminho_arena, dtype=np.float32, mode='r') if tamanho else np.zeros(0, np.float32)
+        return self._mapa
+
+    def duracao(self, filename):
+        return self.faixas[filename]['duracao']
+
+    def taxa(self, filename, nome):
+        return self.faixas[filename]['series'][nome]['taxa']
+
+    def serie(self, filename, nome):
+        """A série completa, como vista (só de leitura) sobre a arena."""
+        info = self.faixas[filename]['series'][nome]
+        tamanho = int(np.prod(info['forma']))
+        return self._arena()[info['inicio']:info['inicio'] + tamanho].reshape(info['forma'])
+
+    def trecho(self, filename, nome, inicio, fim):
+        """A parte da série entre os instantes `inicio` e `fim` (em segundos), sem cópias."""
+        valores = self.serie(filename, nome)
+        taxa = self.taxa(filename, nome)
+        if taxa is None:
+            # Série de instantes: os que caem no intervalo, por pesquisa binária
+            return valores[np.searchsorted(valores, inicio):np.searchsorted(valores, fim)]
+        return valores[max(0, int(inicio * taxa)):max(0, int(np.ceil(fim * taxa)))]
+
+    def introducao(self, filename, nome, segundos=SEGUNDOS_MISTURA):
+        return self.trecho(filename, nome, 0.0, segundos)
+
+    def final(self, filename, nome, segundos=SEGUNDOS_MISTURA):
+        duracao = self.duracao(filename)
+        return self.trecho(filename, nome, max(0.0, duracao - segundos), duracao)
+
+    def fracao_morta(self):
+        """Fração da arena ocupada por séries que já não estão no índice (faixas reanalisadas ou removidas)."""
+        total = os.path.getsize(self.caminho_arena) // _TAMANHO_FLOAT if os.path.exists(self.caminho_arena) else 0
+        vivos = sum(int(np.prod(info['forma'])) for entrada in self.faixas.values() for info in entrada['series'].values())
+        return 1 - vivos / total if total else 0.0
+
+    def compactar(self):
+        """Reescreve a arena só com as séries das faixas ainda no índice."""
+        arena = self._arena()
+        caminho_novo = f'{self.caminho_arena}.tmp'
+        with open(caminho_novo, 'wb') as f:
+            posicao = 0
+            for entrada in self.faixas.values():
+                for info in entrada['series'].values():
+                    tamanho = int(np.prod(info['forma']))
+                    f.write(np.asarray(arena[info['inicio']:info['inicio'] + tamanho]).tobytes())
+                    info['inicio'] = posicao
+                    posicao += tamanho
+        arena = self._mapa = None
+        os.replace(caminho_novo, self.caminho_arena)
+        self.gravar_indice()
+
+
+# --- 3. COMPATIBILIDADE ENTRE O FINAL E A INTRODUÇÃO ---
+
+def _resumo_extremo(croma, rms, batidas):
+    """Croma normalizado, energia em dB e regularidade da grelha de batidas de um trecho."""
+    croma_medio = croma.mean(axis=0) if len(croma) else np.zeros(12)
+    norma = np.linalg.norm(croma_medio)
+    energia_db = 20 * np.log10(max(float(rms.mean()) if len(rms) else 0.0, 1e-6))
+    intervalos = np.diff(batidas)
+    # 1 para batidas perfeitamente regulares, 0 sem batidas ou com um ritmo instável
+    regularidade = 0.0
+    if len(intervalos) >= 2 and intervalos.mean() > 0:
+        regularidade = max(0.0, 1.0 - float(intervalos.std() / intervalos.mean()))
+    return (croma_medio / norma if norma > 0 else croma_medio), energia_db, regularidade
+
+def resumo_final(series, filename, segundos=SEGUNDOS_MISTURA):
+    return _resumo_extremo(series.final(filename, 'croma', segundos), series.final(filename, 'rms', segundos),
+                           series.final(filename, 'batidas', segundos))
+
+def resumo_introducao(series, filename, segundos=SEGUNDOS_MISTURA):
+    return _resumo_extremo(series.introducao(filename, 'croma', segundos),
+                           series.introducao(filename, 'rms', segundos),
+                           series.introducao(filename, 'batidas', segundos))
+
+def pontuacao_extremos(resumo_saida, resumo_entrada):
+    """
+    Compatibilidade (0 a 1) entre o final de uma faixa e a introdução da seguinte: a média da
+    semelhança harmônica dos dois trechos, da proximidade de energia e da regularidade das
+    batidas dos dois lados (uma mistura precisa de batidas estáveis para acertar o tempo).
+    """
+    croma_saida, energia_saida, ritmo_saida = resumo_saida
+    croma_entrada, energia_entrada, ritmo_entrada = resumo_entrada
+    harmonia = max(0.0, float(croma_saida @ croma_entrada))
+    energia = float(np.exp(-abs(energia_saida - energia_entrada) / ESCALA_ENERGIA_DB))
+    return (harmonia + energia + ritmo_saida * ritmo_entrada) / 3
+
+def criar_desempate(series, filenames, segundos=SEGUNDOS_MISTURA):
+    """
+    Função desempate(i, j) para o `ordenar_indices`: a compatibilidade do final da faixa i com
+    a introdução da faixa j, calculada só com as séries guardadas. Os resumos de cada faixa são
+    calculados na primeira vez que são pedidos; faixas sem séries valem 0.
+    """
+    saidas, entradas = {}, {}
+
+    def resumo(cache, funcao, i):
+        if i not in cache:
+            cache[i] = funcao(series, filenames[i], segundos) if filenames[i] in series else None
+        return cache[i]
+
+    def desempate(i, j):
+        saida, entrada = resumo(saidas, resumo_final, i), resumo(entradas, resumo_introducao, j)
+        if saida is None or entrada is None:
+            return 0.0
+        return pontuacao_extremos(saida, entrada)
+
+    return desempate
@@ -0,0 +1,173 @@
+import sys
+import heapq
+import argparse
+import numpy as np
+from sklearn.neighbors import BallTree
+from biblioteca import Biblioteca, BIBLIOTECA_PATH
+from ordenar_set import AUMENTO_MAXIMO_BPM, INDICE_CAMELOT, CHAVES_COMPATIVEIS, CAMELOT_KEYS
+
+# --- 1. CONFIGURAÇÃO ---
+# Vetor de atributos de cada faixa, a partir do que a análise guarda na biblioteca:
+# croma médio (harmonia), MFCC médios (timbre), energia e brilho, e BPM.
+COLUNAS_ATRIBUTOS = ['filename', 'artista', 'nome_da_musica', 'bpm', 'camelot_key',
+                     'chroma_mean', 'mfcc_medio', 'rms_medio', 'centroide_medio']
+
+# Peso de cada grupo de atributos na distância (cada grupo vale o mesmo antes do peso)
+PESO_CROMA = 1.0
+PESO_TIMBRE = 1.0
+PESO_ENERGIA = 0.5
+PESO_BPM = 0.5
+
+# Número de faixas por folha da árvore
+TAMANHO_FOLHA = 40
+
+# A árvore só é consultada quando o intervalo de BPM abrange mais do que esta fração das faixas da
+# chave (o filtro de BPM quase não rejeita vizinhos); num intervalo mais estreito, as faixas dentro
+# dele são encontradas por pesquisa binária e comparadas diretamente
+FRACAO_INTERVALO_ARVORE = 0.5
+
+# --- 2. VETORES DE ATRIBUTOS ---
+
+def _padronizar(matriz):
+    # Média 0 e desvio 1 por coluna; dividir pela raiz do número de colunas dá ao grupo norma média 1
+    desvio = matriz.std(axis=0)
+    desvio[desvio == 0] = 1
+    return (matriz - matriz.mean(axis=0)) / desvio / np.sqrt(matriz.shape[1])
+
+def matriz_atributos(df):
+    """
+    Uma linha por faixa com os grupos de atributos na mesma escala e pesados: o croma com
+    norma 1 (só a forma do perfil harmônico conta) e os restantes padronizados na biblioteca.
+    """
+    chroma = np.stack(df['chroma_mean'].to_numpy()).astype(np.float64)
+    normas = np.linalg.norm(chroma, axis=1, keepdims=True)
+    chroma /= np.where(normas > 0, normas, 1)
+    mfcc = np.stack(df['mfcc_medio'].to_numpy()).astype(np.float64)
+    energia = np.column_stack([20 * np.log10(np.maximum(df['rms_medio'].to_numpy(dtype=np.float64), 1e-6)),
+                               df['centroide_medio'].to_numpy(dtype=np.float64)])
+    bpm = df['bpm'].to_numpy(dtype=np.float64)[:, np.newaxis]
+    return np.hstack([PESO_CROMA * chroma, PESO_TIMBRE * _padronizar(mfcc),
+                      PESO_ENERGIA * _padronizar(energia), PESO_BPM * _padronizar(bpm)])
+
+# --- 3. ÍNDICE DE VIZINHOS MAIS PRÓXIMOS ---
+
+class IndiceSimilaridade:
+    """
+    Uma ball tree por chave Camelot sobre os vetores de atributos, com as faixas de cada chave
+    ordenadas por BPM. Procurar as faixas mais parecidas e compatíveis com uma faixa só vê as
+    chaves compatíveis (as regras do `calcular_pontuacao_harmonica`) e, em cada uma, só o
+    intervalo de BPM permitido, encontrado por pesquisa binária; a árvore serve os intervalos
+    largos. Nunca se percorre a biblioteca inteira.
+    """
+
+    def __init__(self, df):
+        completas = df['chroma_mean'].notna() & df['mfcc_medio'].notna() & df['camelot_key'].notna()
+        self.df = df[completas].reset_index(drop=True)
+        self.matriz = matriz_atributos(self.df) if len(self.df) else np.zeros((0, 0))
+        self.por_filename = {filename: i for i, filename in enumerate(self.df['filename'])}
+        self.bpms = self.df['bpm'].to_numpy(dtype=np.float64)
+        chaves = self.df['camelot_key'].astype(str).to_numpy()
+        self.arvores = {}
+        for chave in CAMELOT_KEYS:
+            linhas = np.flatnonzero(chaves == chave)
+            if len(linhas):
+                linhas = linhas[np.argsort(self.bpms[linhas], kind='stable')]
+                self.arvores[INDICE_CAMELOT[chave]] = (BallTree(self.matriz[linhas], leaf_size=TAMANHO_FOLHA),
+                                                       linhas, self.bpms[linhas])
+
+    def __len__(self):
+        return len(self.df)
+
+    def __contains__(self, filename):
+        return filename in self.por_filename
+
+    def distancia(self, filename_a, filename_b):
+        return float(np.linalg.norm(self.matriz[self.por_filename[filename_a]] - self.matriz[self.por_filename[filename_b]]))
+
+    def semelhantes(self, filename, k=10, bpm_min=None, bpm_max=None):
+        """
+        As k faixas mais parecidas com esta entre as compatíveis (chave Camelot compatível e,
+        por omissão, BPM entre o atual e +7.5%, como na REGRA 2). Devolve [(distância, linha), ...].
+        """
+        atual = self.por_filename[filename]
+        bpm = self.bpms[atual]
+        bpm_min = bpm if bpm_min is None else bpm_min
+        bpm_max = bpm * AUMENTO_MAXIMO_BPM if bpm_max is None else bpm_max
+        vetor = self.matriz[atual:atual + 1]
+        candidatas = []
+        for chave, _ in CHAVES_COMPATIVEIS[INDICE_CAMELOT[self.df['camelot_key'].iloc[atual]]]:
+            if chave not in self.arvores:
+                continue
+            arvore, linhas, bpms = self.arvores[chave]
+            inicio, fim = np.searchsorted(bpms, bpm_min, 'left'), np.searchsorted(bpms, bpm_max, 'right')
+            if fim - inicio <= FRACAO_INTERVALO_ARVORE * len(linhas):
+                no_intervalo = linhas[inicio:fim]
+                no_intervalo = no_intervalo[no_intervalo != atual]
+                distancias = np.linalg.norm(self.matriz[no_intervalo] - vetor, axis=1)
+                if len(distancias) > k:
+                    mais_perto = np.argpartition(distancias, k)[:k]
+                    no_intervalo, distancias = no_intervalo[mais_perto], distancias[mais_perto]
+                candidatas.extend(zip(distancias, no_intervalo))
+                continue
+            # Intervalo largo: pede mais vizinhos à árvore enquanto o filtro de BPM deixar menos de k
+            pedidos = min(k, len(linhas))
+            while True:
+                distancias, indices = arvore.query(vetor, k=pedidos)
+                encontradas = [(d, linhas[i]) for d, i in zip(distancias[0], indices[0])
+                               if bpm_min <= self.bpms[linhas[i]] <= bpm_max and linhas[i] != atual]
+                if len(encontradas) >= k or pedidos == len(linhas):
+                    break
+                pedidos = min(len(linhas), pedidos * 4)
+            candidatas.extend(encontradas[:k])
+        return heapq.nsmallest(k, candidatas)
+
+def carregar_indice(caminho=BIBLIOTECA_PATH):
+    with Biblioteca(caminho) as biblioteca:
+        df = biblioteca.consultar(colunas=COLUNAS_ATRIBUTOS, com_camelot=True, sem_duplicados=True)
+    df['bpm'] = df['bpm'].astype(float)
+    return IndiceSimilaridade(df)
+
+def criar_desempate(indice, filenames):
+    """
+    Função desempate(i, j) para o `ordenar_indices`: a semelhança (0 a 1) entre os vetores de
+    atributos das faixas i e j. Só é chamada para as candidatas empatadas de cada passo, por isso
+    nunca compara todas as faixas entre si. Faixas sem atributos na biblioteca valem 0.
+    """
+    linhas = [indice.por_filename.get(filename) for filename in filenames]
+
+    def desempate(i, j):
+        if linhas[i] is None or linhas[j] is None:
+            return 0.0
+        return 1.0 / (1.0 + float(np.linalg.norm(indice.matriz[linhas[i]] - indice.matriz[linhas[j]])))
+
+    return desempate
+
+# --- 4. EXECUÇÃO ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Mostra as faixas mais parecidas e compatíveis com uma faixa.")
+    parser.add_argument('filename', help="nome do ficheiro da faixa (como na coluna 'filename')")
+    parser.add_argument('-k', type=int, default=10, help="número de faixas mostradas (padrão: 10)")
+    parser.add_argument('--biblioteca', default=BIBLIOTECA_PATH,
+                        help=f"biblioteca SQLite com os atributos da análise (padrão: {BIBLIOTECA_PATH})")
+    parser.add_argument('--bpm-min', type=float, default=None, help="BPM mínimo (padrão: o da faixa)")
+    parser.add_argument('--bpm-max', type=float, default=None, help="BPM máximo (padrão: o da faixa +7.5%%)")
+    args = parser.parse_args()
+
+    indice = carregar_indice(args.biblioteca)
+    print(f"Índice com {len(indice)} faixas carregado de: {args.biblioteca}")
+    if args.filename not in indice:
+        print(f"ERRO: A faixa '{args.filename}' não tem atributos na biblioteca "
+              f"(corra a análise com --biblioteca e o engenharia_final.py --biblioteca).")
+        sys.exit()
+
+    print(f"\nFaixas mais parecidas e compatíveis com: {args.filename}")
+    for posicao, (distancia, linha) in enumerate(indice.semelhantes(args.filename, k=args.k,
+                                                                   bpm_min=args.bpm_min, bpm_max=args.bpm_max), start=1):
+        faixa = indice.df.iloc[linha]
+        print(f"{posicao:02d}. {faixa['artista']} - {faixa['nome_da_musica']} "
+              f"({faixa['bpm']:.0f} BPM, {faixa['camelot_key']}) distância {distancia:.3f}")
+
+
+if __name__ == '__main__':
+    main()
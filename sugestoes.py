@@ -0,0 +1,305 @@
+import os
+import sys
+import json
+import time
+import heapq
+import argparse
+import threading
+from bisect import bisect_left, bisect_right
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import pandas as pd
+from biblioteca import Biblioteca, BIBLIOTECA_PATH
+from ordenar_set import (INPUT_PATH, AUMENTO_MAXIMO_BPM, INDICE_CAMELOT, CHAVES_COMPATIVEIS,
+                         pontuacao_transicao)
+
+# --- 1. CONFIGURAÇÃO ---
+# O serviço só aceita ligações locais (é consultado durante o set, na mesma máquina)
+ENDERECO = '127.0.0.1'
+PORTA = 8765
+
+# Número de sugestões devolvidas por omissão
+SUGESTOES_POR_OMISSAO = 10
+
+# Intervalo (em segundos) entre verificações de alterações no dataset, para o recarregar
+INTERVALO_RECARGA = 2.0
+
+COLUNAS_FAIXA = ['artista', 'nome_da_musica', 'bpm', 'camelot_key', 'filename']
+
+# --- 2. ÍNDICE EM MEMÓRIA ---
+
+class IndiceSugestoes:
+    """
+    Faixas da biblioteca agrupadas por chave Camelot e, dentro de cada chave, ordenadas por
+    BPM. Uma consulta só percorre as chaves compatíveis com a atual (as regras do
+    `calcular_pontuacao_harmonica`) e, em cada uma, só o intervalo de BPM permitido,
+    encontrado por pesquisa binária: o tempo não depende do tamanho da biblioteca.
+    """
+
+    def __init__(self, faixas):
+        self.faixas = faixas
+        self.por_filename = {faixa['filename']: i for i, faixa in enumerate(faixas)}
+        baldes = [[] for _ in INDICE_CAMELOT]
+        for i, faixa in enumerate(faixas):
+            baldes[INDICE_CAMELOT[faixa['camelot_key']]].append((faixa['bpm'], i))
+        # Duas listas paralelas por chave: os BPMs (para o bisect) e os índices das faixas
+        self.baldes = []
+        for balde in baldes:
+            balde.sort()
+            self.baldes.append(([bpm for bpm, _ in balde], [i for _, i in balde]))
+
+    def __len__(self):
+        return len(self.faixas)
+
+    def sugerir(self, bpm, camelot_key, k=SUGESTOES_POR_OMISSAO, excluir=(), bpm_min=None, bpm_max=None):
+        """
+        As k melhores faixas para tocar a seguir a uma faixa com este BPM e chave Camelot,
+        pelas regras do `ordenar_set`: primeiro a pontuação harmônica, depois a menor diferença
+        de BPM. Por omissão o BPM pode subir até AUMENTO_MAXIMO_BPM, como na REGRA 2; `bpm_min`
+        e `bpm_max` alargam ou estreitam esse intervalo (também para baixo do BPM atual).
+        Devolve [(pontuacao, índice), ...], com a pontuação do `pontuacao_transicao` (o desempate
+        fica sempre entre 0 e 1, por isso nunca passa à frente de uma chave com mais pontos).
+        """
+        bpm_min = bpm if bpm_min is None else bpm_min
+        bpm_max = bpm * AUMENTO_MAXIMO_BPM if bpm_max is None else bpm_max
+        candidatas = []
+        for chave_candidata, pontuacao_harmonica in CHAVES_COMPATIVEIS[INDICE_CAMELOT[camelot_key]]:
+            bpms, indices = self.baldes[chave_candidata]
+            inicio, fim = bisect_left(bpms, bpm_min), bisect_right(bpms, bpm_max)
+            # Dentro de uma chave, percorre o intervalo a partir do BPM atual para os dois lados, pela
+            # ordem da diferença de BPM, um BPM de cada vez (os índices de um mesmo BPM estão por ordem
+            # crescente): bastam as k primeiras não excluídas
+            direita = min(max(bisect_left(bpms, bpm), inicio), fim)
+            esquerda = direita - 1
+            encontradas = 0
+            while encontradas < k and (esquerda >= inicio or direita < fim):
+                diferenca_direita = bpms[direita] - bpm if direita < fim else float('inf')
+                diferenca_esquerda = bpm - bpms[esquerda] if esquerda >= inicio else float('inf')
+                diferenca = min(diferenca_direita, diferenca_esquerda)
+                blocos = []
+                if diferenca_direita == diferenca:
+                    fim_bloco = bisect_right(bpms, bpms[direita], direita, fim)
+                    blocos.append(range(direita, fim_bloco))
+                    direita = fim_bloco
+                if diferenca_esquerda == diferenca:
+                    inicio_bloco = bisect_left(bpms, bpms[esquerda], inicio, esquerda + 1)
+                    blocos.append(range(inicio_bloco, esquerda + 1))
+                    esquerda = inicio_bloco - 1
+                desempate = min(1.0, max(0.0, pontuacao_transicao(bpm, bpm + diferenca, 0)))
+                em_falta = k - encontradas
+                for bloco in blocos:
+                    tomadas = 0
+                    for j in bloco:
+                        if tomadas == em_falta:
+                            break
+                        if indices[j] not in excluir:
+                            candidatas.append((-pontuacao_harmonica, diferenca, indices[j],
+                                               pontuacao_harmonica + desempate))
+                            tomadas += 1
+                    encontradas += tomadas
+        # Empates: ganha a que aparece primeiro no dataset, como no ordenar_set
+        return [(pontuacao, i) for _, _, i, pontuacao in heapq.nsmallest(k, candidatas)]
+
+    def sugerir_para(self, filename, k=SUGESTOES_POR_OMISSAO, excluir=(), bpm_min=None, bpm_max=None):
+        """Como `sugerir`, a partir da faixa que está a tocar (que nunca é sugerida)."""
+        atual = self.por_filename[filename]
+        faixa = self.faixas[atual]
+        return self.sugerir(faixa['bpm'], faixa['camelot_key'], k=k, excluir=set(excluir) | {atual},
+                            bpm_min=bpm_min, bpm_max=bpm_max)
+
+# --- 3. CARREGAMENTO E RECARGA ---
+
+def carregar_faixas(caminho, usar_biblioteca=False):
+    """Faixas com BPM e chave Camelot, do CSV pronto para ordenar ou da biblioteca SQLite."""
+    if usar_biblioteca:
+        with Biblioteca(caminho) as biblioteca:
+            df = biblioteca.consultar(colunas=COLUNAS_FAIXA, com_camelot=True, sem_duplicados=True)
+    else:
+        df = pd.read_csv(caminho, usecols=lambda coluna: coluna in COLUNAS_FAIXA + ['duplicado_de'])
+        # As cópias de uma faixa nunca são sugeridas (a original já o é)
+        if 'duplicado_de' in df.columns:
+            df = df[df['duplicado_de'].isna()].drop(columns='duplicado_de')
+    df = df.dropna(subset=['bpm', 'camelot_key'])
+    df = df[df['camelot_key'].isin(INDICE_CAMELOT.keys())]
+    df['bpm'] = df['bpm'].astype(float)
+    return df.astype(object).to_dict('records')
+
+def assinatura_fonte(caminho):
+    """Tamanho e data de modificação do dataset (e do WAL, no caso da biblioteca SQLite)."""
+    assinatura = []
+    for ficheiro in (caminho, f'{caminho}-wal'):
+        try:
+            st = os.stat(ficheiro)
+            assinatura.append((st.st_size, st.st_mtime_ns))
+        except FileNotFoundError:
+            assinatura.append(None)
+    return tuple(assinatura)
+
+class ServicoSugestoes:
+    """
+    Mantém o índice da biblioteca atualizado: uma thread verifica o dataset a cada
+    `intervalo` segundos e, se mudou, constrói um índice novo e troca-o pelo atual.
+    As consultas em curso terminam sobre o índice antigo; nenhuma fica à espera.
+    """
+
+    def __init__(self, caminho, usar_biblioteca=False, intervalo=INTERVALO_RECARGA):
+        self.caminho = caminho
+        self.usar_biblioteca = usar_biblioteca
+        self.intervalo = intervalo
+        self._lock_recarga = threading.Lock()
+        self._parar = threading.Event()
+        self.assinatura = None
+        self.indice = None
+        self.recarregado_em = None
+        self.recarregar()
+
+    def recarregar(self, forcar=True):
+        """Reconstrói o índice (se `forcar` ou se o dataset mudou); devolve True se o fez."""
+        with self._lock_recarga:
+            assinatura = assinatura_fonte(self.caminho)
+            if not forcar and assinatura == self.assinatura:
+                return False
+            inicio = time.perf_counter()
+            indice = IndiceSugestoes(carregar_faixas(self.caminho, self.usar_biblioteca))
+            self.indice, self.assinatura, self.recarregado_em = indice, assinatura, time.time()
+            print(f"Índice com {len(indice)} faixas carregado de '{self.caminho}' "
+                  f"em {time.perf_counter() - inicio:.2f} s.")
+            return True
+
+    def _vigiar(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.recarregar(forcar=False)
+            except Exception as e:
+                # Um dataset a meio de ser escrito: fica o índice anterior e tenta-se na próxima volta
+                print(f"AVISO: Não foi possível recarregar o dataset: {e}")
+
+    def iniciar_recarga(self):
+        threading.Thread(target=self._vigiar, daemon=True).start()
+
+    def parar(self):
+        self._parar.set()
+
+    def consultar(self, parametros):
+        """Responde a um pedido de sugestões (parâmetros já lidos do URL); devolve um dicionário."""
+        indice = self.indice
+        inicio = time.perf_counter()
+        k = int(parametros.get('k', SUGESTOES_POR_OMISSAO))
+        excluir = {indice.por_filename[f] for f in parametros.get('excluir', []) if f in indice.por_filename}
+        limites = {nome: float(parametros[nome]) for nome in ('bpm_min', 'bpm_max') if nome in parametros}
+        if 'filename' in parametros:
+            sugestoes = indice.sugerir_para(parametros['filename'], k=k, excluir=excluir, **limites)
+        else:
+            sugestoes = indice.sugerir(float(parametros['bpm']), parametros['camelot_key'], k=k,
+                                       excluir=excluir, **limites)
+        microssegundos = (time.perf_counter() - inicio) * 1e6
+        return {
+            'sugestoes': [{**indice.faixas[i], 'pontuacao': round(pontuacao, 4)} for pontuacao, i in sugestoes],
+            'microssegundos': round(microssegundos, 1),
+        }
+
+# --- 4. SERVIDOR HTTP ---
+
+def criar_servidor(servico, endereco=ENDERECO, porta=PORTA):
+    """
+    Servidor HTTP local com três rotas:
+      GET  /sugestoes?filename=...&k=10&excluir=...   (ou ?bpm=128&camelot_key=8A)
+      GET  /estado
+      POST /recarregar
+    """
+
+    class Pedido(BaseHTTPRequestHandler):
+
+        def _responder(self, codigo, corpo):
+            dados = json.dumps(corpo, ensure_ascii=False).encode('utf-8')
+            self.send_response(codigo)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/estado':
+                self._responder(200, {'faixas': len(servico.indice), 'fonte': servico.caminho,
+                                      'recarregado_em': time.strftime('%Y-%m-%d %H:%M:%S',
+                                                                      time.localtime(servico.recarregado_em))})
+                return
+            if url.path != '/sugestoes':
+                self._responder(404, {'erro': 'rota desconhecida'})
+                return
+            consulta = parse_qs(url.query)
+            parametros = {nome: valores[-1] for nome, valores in consulta.items()}
+            # 'excluir' pode repetir-se ou vir separado por vírgulas (ex: as faixas já tocadas)
+            parametros['excluir'] = [f for valor in consulta.get('excluir', []) for f in valor.split(',') if f]
+            try:
+                self._responder(200, servico.consultar(parametros))
+            except KeyError as e:
+                self._responder(404 if 'filename' in parametros else 400,
+                                {'erro': f"faixa, chave ou parâmetro desconhecido: {e}"})
+            except ValueError as e:
+                self._responder(400, {'erro': str(e)})
+
+        def do_POST(self):
+            if urlparse(self.path).path != '/recarregar':
+                self._responder(404, {'erro': 'rota desconhecida'})
+                return
+            servico.recarregar()
+            self._responder(200, {'faixas': len(servico.indice)})
+
+        def log_message(self, formato, *args):
+            # Sem uma linha por pedido na consola
+            pass
+
+    return ThreadingHTTPServer((endereco, porta), Pedido)
+
+# --- 5. EXECUÇÃO ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Serviço local de sugestões da próxima faixa, para sets ao vivo.")
+    parser.add_argument('--dataset', default=INPUT_PATH,
+                        help=f"CSV com as faixas e as chaves Camelot (padrão: {INPUT_PATH})")
+    parser.add_argument('--biblioteca', nargs='?', const=BIBLIOTECA_PATH, default=None,
+                        help=f"lê as faixas da biblioteca SQLite em vez do CSV (padrão: {BIBLIOTECA_PATH})")
+    parser.add_argument('--porta', type=int, default=PORTA, help=f"porta HTTP em {ENDERECO} (padrão: {PORTA})")
+    parser.add_argument('--intervalo', type=float, default=INTERVALO_RECARGA,
+                        help=f"segundos entre verificações de alterações no dataset (padrão: {INTERVALO_RECARGA:.0f})")
+    parser.add_argument('--consulta', metavar='FILENAME',
+                        help="mostra as sugestões para esta faixa e termina, sem iniciar o servidor")
+    parser.add_argument('-k', type=int, default=SUGESTOES_POR_OMISSAO,
+                        help=f"número de sugestões (padrão: {SUGESTOES_POR_OMISSAO})")
+    args = parser.parse_args()
+
+    caminho = args.biblioteca if args.biblioteca is not None else args.dataset
+    try:
+        servico = ServicoSugestoes(caminho, usar_biblioteca=args.biblioteca is not None, intervalo=args.intervalo)
+    except FileNotFoundError:
+        print(f"ERRO CRÍTICO: O ficheiro '{caminho}' não foi encontrado.")
+        sys.exit()
+
+    if args.consulta:
+        try:
+            resposta = servico.consultar({'filename': args.consulta, 'k': args.k})
+        except KeyError:
+            print(f"ERRO: A faixa '{args.consulta}' não está no dataset.")
+            sys.exit()
+        print(f"Sugestões para: {args.consulta} ({resposta['microssegundos']:.0f} µs)")
+        for posicao, faixa in enumerate(resposta['sugestoes'], start=1):
+            print(f"{posicao:02d}. {faixa['artista']} - {faixa['nome_da_musica']} "
+                  f"({faixa['bpm']:.0f} BPM, {faixa['camelot_key']}) pontuação {faixa['pontuacao']:.2f}")
+        return
+
+    servico.iniciar_recarga()
+    servidor = criar_servidor(servico, porta=args.porta)
+    print(f"A servir sugestões em http://{ENDERECO}:{args.porta}/sugestoes?filename=... (Ctrl+C para terminar)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServiço terminado.")
+    finally:
+        servico.parar()
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    main()
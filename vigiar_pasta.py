@@ -0,0 +1,364 @@
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pandas as pd
+import instrumentacao
+from analise_acoustica_local import (AUDIO_FOLDER_PATH, FINAL_OUTPUT_PATH, CACHE_PATH, CACHE_PREVIA_PATH, NUM_WORKERS,
+                                     analisar_pasta, extrair_artista_titulo, _iniciar_worker,
+                                     _analisar_em_worker, _analisar_isolado)
+from cache_analise import CacheAnalise
+from engenharia_final import adicionar_camelot_key, OUTPUT_PATH as PLAYLIST_PATH
+from ordenar_set import ordenar_set, OUTPUT_PATH as ORDERED_CSV_PATH
+from otimizador_set import inserir_set
+from criar_pasta_ord import (criar_pasta_set, posicoes_alteradas, guardar_alteracoes, FINAL_SET_FOLDER, MODOS,
+                             MODOS_LIGADOS, MODO_PADRAO)
+from escrever_metadados import escrever_metadados_set
+
+# --- 1. CONFIGURAÇÃO ---
+# Segundos sem novos eventos num ficheiro antes de o analisar (um download ainda a ser escrito
+# gera eventos seguidos; só quando param é que o ficheiro está completo)
+DEBOUNCE_SEGUNDOS = 2.0
+
+# Intervalo entre verificações da pasta quando o inotify não está disponível
+INTERVALO_POLLING = 2.0
+
+# Eventos do inotify (ver <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+MASCARA_EVENTOS = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+TAMANHO_CABECALHO_EVENTO = struct.calcsize('iIII')
+
+# --- 2. VIGIAR A PASTA ---
+
+class VigiaInotify:
+    """Eventos de ficheiros da pasta através do inotify do Linux (via ctypes, sem dependências)."""
+
+    def __init__(self, pasta):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "inotify não disponível")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falhou")
+        if libc.inotify_add_watch(self.fd, os.fsencode(pasta), MASCARA_EVENTOS) < 0:
+            erro = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(erro, f"inotify_add_watch falhou para '{pasta}'")
+
+    def eventos(self, timeout):
+        """Espera até `timeout` segundos e devolve a lista de (nome, removido) dos ficheiros com eventos."""
+        prontos, _, _ = select.select([self.fd], [], [], timeout)
+        if not prontos:
+            return []
+        try:
+            dados = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        eventos = []
+        posicao = 0
+        while posicao < len(dados):
+            _, mascara, _, tamanho = struct.unpack_from('iIII', dados, posicao)
+            inicio_nome = posicao + TAMANHO_CABECALHO_EVENTO
+            nome = os.fsdecode(dados[inicio_nome:inicio_nome + tamanho].rstrip(b'\0'))
+            posicao = inicio_nome + tamanho
+            if nome:
+                eventos.append((nome, bool(mascara & (IN_DELETE | IN_MOVED_FROM))))
+        return eventos
+
+    def fechar(self):
+        os.close(self.fd)
+
+class VigiaPolling:
+    """Alternativa ao inotify: compara o nome, tamanho e data de modificação dos ficheiros a intervalos."""
+
+    def __init__(self, pasta, intervalo=INTERVALO_POLLING):
+        self.pasta = pasta
+        self.intervalo = intervalo
+        self.estado = self._ler_estado()
+
+    def _ler_estado(self):
+        estado = {}
+        for entrada in os.scandir(self.pasta):
+            try:
+                st = entrada.stat()
+            except FileNotFoundError:
+                continue
+            estado[entrada.name] = (st.st_size, st.st_mtime_ns)
+        return estado
+
+    def eventos(self, timeout):
+        time.sleep(min(timeout, self.intervalo))
+        novo = self._ler_estado()
+        eventos = [(nome, False) for nome, identidade in novo.items() if self.estado.get(nome) != identidade]
+        eventos += [(nome, True) for nome in self.estado if nome not in novo]
+        self.estado = novo
+        return eventos
+
+    def fechar(self):
+        pass
+
+def criar_vigia(pasta, forcar_polling=False, intervalo=INTERVALO_POLLING):
+    if not forcar_polling and sys.platform.startswith('linux'):
+        try:
+            return VigiaInotify(pasta), 'inotify'
+        except OSError as e:
+            print(f"AVISO: inotify indisponível ({e}). A usar verificação periódica da pasta.")
+    return VigiaPolling(pasta, intervalo), 'polling'
+
+# --- 3. BIBLIOTECA EM MEMÓRIA E ATUALIZAÇÃO DO SET ---
+
+class BibliotecaVigiada:
+    """
+    O dataset analisado e o set ordenado, mantidos em memória enquanto o daemon corre. Cada
+    alteração substitui só as linhas das faixas afetadas; no set, as faixas removidas ou com
+    outro BPM ou chave saem e as novas entram pela inserção incremental (otimizador_set.inserir_set),
+    sem reordenar as restantes. Na pasta do set e nas tags só as posições alteradas são refeitas.
+    """
+
+    def __init__(self, df, atualizar_set=True, pasta_audio=AUDIO_FOLDER_PATH, pasta_set=FINAL_SET_FOLDER,
+                 modo_pasta=MODO_PADRAO):
+        self.faixas = {linha['filename']: linha for linha in df.to_dict('records')}
+        self.atualizar_set = atualizar_set
+        self.pasta_audio = pasta_audio
+        self.pasta_set = pasta_set
+        self.modo_pasta = modo_pasta
+        self.set_atual = []
+        # Faixas reanalisadas desde a última geração: mesmo sem mudarem de posição, o ficheiro mudou
+        self.reanalisadas = set()
+
+    def carregar_set(self, caminho=ORDERED_CSV_PATH):
+        """Parte do set ordenado já gravado, para que também a sincronização inicial só insira as faixas novas."""
+        try:
+            self.set_atual = pd.read_csv(caminho).to_dict('records')
+        except (FileNotFoundError, pd.errors.EmptyDataError):
+            self.set_atual = []
+
+    def aplicar(self, analisadas, removidas):
+        """`analisadas`: {filename: resultado da análise ou None}; `removidas`: nomes de ficheiros apagados."""
+        for filename in removidas:
+            self.faixas.pop(filename, None)
+        for filename, resultado in analisadas.items():
+            if resultado is None or resultado.get('bpm') is None or resultado.get('key_estimada') is None:
+                self.faixas.pop(filename, None)
+                continue
+            artista, nome_da_musica = extrair_artista_titulo(filename)
+            self.faixas[filename] = {'artista': artista, 'nome_da_musica': nome_da_musica, 'bpm': resultado['bpm'],
+                                     'key_estimada': resultado['key_estimada'], 'filename': filename}
+            self.reanalisadas.add(filename)
+        self.gerar_saidas()
+
+    def atualizar_ordem(self, faixas):
+        """
+        Nova ordem do set a partir da atual: ficam, pela mesma ordem, as faixas ainda presentes
+        com o mesmo BPM e chave Camelot, e as restantes são inseridas. Sem set anterior, ordena tudo.
+        """
+        if not self.set_atual:
+            playlist, _ = ordenar_set(list(faixas.values()))
+            return playlist
+        mantidas = [faixas[m['filename']] for m in self.set_atual if m['filename'] in faixas
+                    and (faixas[m['filename']]['bpm'], faixas[m['filename']]['camelot_key']) == (m['bpm'], m['camelot_key'])]
+        no_set = {m['filename'] for m in mantidas}
+        novas = [m for filename, m in faixas.items() if filename not in no_set]
+        if not novas:
+            return mantidas
+        playlist, _, relatorio = inserir_set(mantidas, novas)
+        for posicao in relatorio['sem_transicao_compativel']:
+            print(f"AVISO: Sem posição com transições compatíveis, posta no fim do set: {playlist[posicao]['filename']}")
+        return playlist
+
+    def gerar_saidas(self):
+        # A mesma ordem de linhas que o analise_acoustica_local.py produz (por nome de ficheiro)
+        df = pd.DataFrame([self.faixas[nome] for nome in sorted(self.faixas)],
+                          columns=['artista', 'nome_da_musica', 'bpm', 'key_estimada', 'filename'])
+        df.to_csv(FINAL_OUTPUT_PATH, index=False, encoding='utf-8')
+
+        df_camelot = adicionar_camelot_key(df)
+        df_camelot.to_csv(PLAYLIST_PATH, index=False, encoding='utf-8')
+
+        antigos = [m['filename'] for m in self.set_atual]
+        self.set_atual = self.atualizar_ordem({m['filename']: m for m in df_camelot.to_dict('records')})
+        df_set = pd.DataFrame(self.set_atual, columns=df_camelot.columns)
+        df_set.to_csv(ORDERED_CSV_PATH, index=False, encoding='utf-8')
+
+        filenames = list(df_set['filename'])
+        posicoes = sorted(set(posicoes_alteradas(antigos, filenames))
+                          | {ordem for ordem, filename in enumerate(filenames, start=1) if filename in self.reanalisadas})
+        self.reanalisadas = set()
+        guardar_alteracoes(filenames, posicoes)
+        if self.atualizar_set and not df_set.empty:
+            criar_pasta_set(df_set, pasta_origem=self.pasta_audio, pasta_destino=self.pasta_set, modo=self.modo_pasta,
+                            posicoes=posicoes)
+            # Nos modos ligados, as tags alterariam os originais e cada escrita voltaria a ser um evento
+            if self.modo_pasta not in MODOS_LIGADOS:
+                escrever_metadados_set(df_set, pasta_set=self.pasta_set, posicoes=posicoes)
+        return df_set
+
+# --- 4. O DAEMON ---
+
+def vigiar(pasta=AUDIO_FOLDER_PATH, num_workers=NUM_WORKERS, modo='auto', debounce=DEBOUNCE_SEGUNDOS,
+           forcar_polling=False, intervalo=INTERVALO_POLLING, caminho_cache=CACHE_PATH, usar_hash=False,
+           atualizar_set=True, modo_pasta=MODO_PADRAO):
+    """
+    Sincroniza a pasta uma vez (só as faixas novas ou alteradas são analisadas, graças à cache)
+    e depois fica à espera de alterações. Cada ficheiro novo ou modificado é analisado num pool
+    de processos em segundo plano, assim que deixa de receber eventos durante `debounce` segundos;
+    quando não há análises em curso, as alterações são aplicadas ao dataset e ao set.
+    """
+    # A pré-visualização tem a sua própria cache, para nunca passar por uma análise completa
+    if modo == 'previa' and caminho_cache == CACHE_PATH:
+        caminho_cache = CACHE_PREVIA_PATH
+    print(f"--- Sincronização inicial da pasta '{pasta}' ---")
+    df = analisar_pasta(pasta, num_workers=num_workers, modo=modo, caminho_cache=caminho_cache, usar_hash=usar_hash)
+    biblioteca = BibliotecaVigiada(df, atualizar_set=atualizar_set, pasta_audio=pasta, modo_pasta=modo_pasta)
+    biblioteca.carregar_set()
+    biblioteca.gerar_saidas()
+
+    cache = CacheAnalise(caminho_cache, usar_hash=usar_hash)
+    vigia, tipo = criar_vigia(pasta, forcar_polling, intervalo)
+    print(f"\n--- A vigiar '{pasta}' ({tipo}, {num_workers} processo(s)). Ctrl+C para terminar. ---")
+
+    pendentes = {}   # nome -> (instante do último evento, removido)
+    em_analise = {}  # future -> (nome, instante do último evento)
+    analisadas, removidas = {}, set()
+    suspeitas = []   # faixas que estavam no pool quando um processo morreu
+    primeiro_evento = None
+
+    def novo_executor():
+        return ProcessPoolExecutor(max_workers=max(1, num_workers), initializer=_iniciar_worker)
+
+    def concluir(nome, resultado):
+        if resultado is not None:
+            try:
+                cache.guardar(os.path.join(pasta, nome), resultado)
+            except FileNotFoundError:
+                pass  # o ficheiro foi removido durante a análise; o evento de remoção trata do resto
+            print(f"  -> {nome}: BPM={resultado['bpm']}, Tonalidade={resultado['key_estimada']}")
+        analisadas[nome] = resultado
+
+    executor = novo_executor()
+    try:
+        while True:
+            espera = debounce if pendentes else 1.0
+            for nome, removido in vigia.eventos(espera):
+                if nome.endswith('.flac'):
+                    pendentes[nome] = (time.monotonic(), removido)
+
+            # Ficheiros sem eventos há `debounce` segundos: removidos ou prontos para análise
+            agora = time.monotonic()
+            for nome, (instante, removido) in list(pendentes.items()):
+                if agora - instante < debounce:
+                    continue
+                del pendentes[nome]
+                primeiro_evento = primeiro_evento or instante
+                caminho = os.path.join(pasta, nome)
+                if removido or not os.path.exists(caminho):
+                    removidas.add(nome)
+                    analisadas.pop(nome, None)
+                    print(f"Removida: {nome}")
+                    continue
+                try:
+                    resultado = cache.obter(caminho)
+                except FileNotFoundError:
+                    # Desapareceu entre o evento e a leitura (cópia parcial, renomeação)
+                    removidas.add(nome)
+                    analisadas.pop(nome, None)
+                    continue
+                removidas.discard(nome)
+                if resultado is not None:
+                    analisadas[nome] = resultado
+                    continue
+                print(f"A analisar: {nome}")
+                try:
+                    em_analise[executor.submit(_analisar_em_worker, caminho, modo)] = (nome, instante)
+                except BrokenProcessPool:
+                    suspeitas.append(nome)
+
+            for future in [f for f in em_analise if f.done()]:
+                nome, _ = em_analise.pop(future)
+                try:
+                    resultado, medicoes = future.result()
+                except BrokenProcessPool:
+                    suspeitas.append(nome)
+                    continue
+                except Exception as e:
+                    print(f"  -> !! Erro ao analisar o ficheiro '{nome}': {e}")
+                    resultado, medicoes = None, None
+                instrumentacao.registar_faixa(medicoes, 'analise')
+                concluir(nome, resultado)
+
+            # Um processo morreu (falha do descodificador, falta de memória): o pool fica inutilizado.
+            # Cria-se um novo e as faixas que estavam em análise são refeitas uma a uma, isoladas;
+            # uma faixa que volte a falhar fica de fora.
+            if suspeitas and not em_analise:
+                print(f"AVISO: um processo de análise terminou abruptamente. "
+                      f"A reanalisar {len(suspeitas)} faixas isoladamente...")
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = novo_executor()
+                for nome in suspeitas:
+                    caminho = os.path.join(pasta, nome)
+                    concluir(nome, _analisar_isolado(caminho, modo) if os.path.exists(caminho) else None)
+                suspeitas = []
+
+            # Aplica as alterações de uma vez, quando já não há análises nem eventos à espera
+            if (analisadas or removidas) and not em_analise and not pendentes and not suspeitas:
+                with instrumentacao.etapa('atualizacao'):
+                    biblioteca.aplicar(analisadas, removidas)
+                print(f"Set atualizado: {len(analisadas)} faixas analisadas, {len(removidas)} removidas, "
+                      f"{len(biblioteca.faixas)} na biblioteca "
+                      f"({time.monotonic() - primeiro_evento:.1f} s desde o primeiro evento).")
+                analisadas, removidas = {}, set()
+                primeiro_evento = None
+    except KeyboardInterrupt:
+        print("\nA terminar...")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        vigia.fechar()
+        cache.fechar()
+
+def main():
+    parser = argparse.ArgumentParser(description="Vigia a pasta de músicas e analisa e ordena automaticamente as faixas novas.")
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS,
+                        help=f"número de processos de análise (padrão: {NUM_WORKERS})")
+    parser.add_argument('--modo', choices=['auto', 'completo', 'streaming', 'previa'], default='auto',
+                        help="modo de análise (padrão: auto)")
+    parser.add_argument('--debounce', type=float, default=DEBOUNCE_SEGUNDOS,
+                        help=f"segundos sem alterações antes de analisar um ficheiro (padrão: {DEBOUNCE_SEGUNDOS})")
+    parser.add_argument('--polling', action='store_true', help="não usa o inotify; verifica a pasta a intervalos")
+    parser.add_argument('--intervalo', type=float, default=INTERVALO_POLLING,
+                        help=f"segundos entre verificações no modo polling (padrão: {INTERVALO_POLLING})")
+    parser.add_argument('--hash', action='store_true',
+                        help="reconhece ficheiros renomeados pelo hash do conteúdo (não os reanalisa)")
+    parser.add_argument('--sem-set', action='store_true',
+                        help="só atualiza os CSV; não mexe na pasta do set nem nas tags")
+    parser.add_argument('--modo-pasta', choices=MODOS, default=MODO_PADRAO,
+                        help=f"como criar os ficheiros da pasta do set (padrão: {MODO_PADRAO})")
+    instrumentacao.adicionar_argumentos(parser)
+    args = parser.parse_args()
+    instrumentacao.configurar(args, etapa='atualizacao')
+
+    if not os.path.isdir(AUDIO_FOLDER_PATH):
+        print(f"ERRO: A pasta '{AUDIO_FOLDER_PATH}' não foi encontrada.")
+        sys.exit()
+    if not args.sem_set and args.modo_pasta in MODOS_LIGADOS:
+        print(f"AVISO: Com --modo-pasta {args.modo_pasta}, as tags não são escritas (alterariam os ficheiros originais).")
+
+    vigiar(num_workers=args.workers, modo=args.modo, debounce=args.debounce, forcar_polling=args.polling,
+           intervalo=args.intervalo, usar_hash=args.hash, atualizar_set=not args.sem_set,
+           modo_pasta=args.modo_pasta)
+
+
+if __name__ == '__main__':
+    main()